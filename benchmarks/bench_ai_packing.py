@@ -0,0 +1,65 @@
+"""AI 画像打包基准测试 - 对比每次请求分析 K=1 / 5 / 10 个交易者的成本与耗时
+
+需要可用的 PostgreSQL（DATABASE_URL，已有交易者画像）和 DeepSeek API（DEEPSEEK_API_KEY）。
+按交易数选出前 N 个交易者，只读取分析数据、不写回数据库；每个 K 使用新的分析器，
+各组顺序请求，以便单独衡量每次请求的固定开销。
+
+用法: python -m benchmarks.bench_ai_packing [交易者数，默认 20]
+"""
+import asyncio
+import sys
+import time
+
+from sqlalchemy import select
+
+from src.db import AsyncSessionLocal, close_db
+from src.models import TraderProfile
+from src.profiler.ai_analyzer import TraderAIProfiler
+
+PACK_SIZES = (1, 5, 10)
+
+
+async def load_datas(n_traders: int):
+    """读取交易数最多的 n_traders 个交易者的分析数据"""
+    profiler = TraderAIProfiler(AsyncSessionLocal)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(TraderProfile).order_by(TraderProfile.total_trades.desc()).limit(n_traders)
+        )
+        datas = []
+        for profile in result.scalars().all():
+            data = await profiler._load_analysis_data(session, profile)
+            if data:
+                datas.append(data)
+    return datas
+
+
+async def run_pack_size(datas, pack_size: int):
+    profiler = TraderAIProfiler(AsyncSessionLocal)
+    analyzed = 0
+    start = time.perf_counter()
+    for i in range(0, len(datas), pack_size):
+        analyzed += len(await profiler._analyze_datas(datas[i:i + pack_size]))
+    elapsed = time.perf_counter() - start
+
+    per_trader = max(analyzed, 1)
+    print(f"K={pack_size:<3} analyzed {analyzed}/{len(datas)} | "
+          f"{elapsed / per_trader:6.2f} s/trader | "
+          f"prompt {profiler.prompt_tokens / per_trader:7.0f} + completion "
+          f"{profiler.completion_tokens / per_trader:6.0f} tokens/trader | "
+          f"{profiler.requests} requests, {profiler.packed_fallbacks} fallbacks")
+
+
+async def bench(n_traders: int):
+    try:
+        datas = await load_datas(n_traders)
+        print(f"loaded: {len(datas)} traders")
+        for pack_size in PACK_SIZES:
+            await run_pack_size(datas, pack_size)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    n_traders = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    asyncio.run(bench(n_traders))
@@ -0,0 +1,74 @@
+"""告警延迟基准测试 - 对比轮询模式与 eth_subscribe 推送模式的端到端延迟
+
+启动本地节点桩（benchmarks.ws_stub），分别以轮询和推送模式运行 TradeListener，
+测量日志在节点产生到进入 process_logs 处理流水线之间的延迟（忽略启动阶段补齐的日志）。
+不连接数据库：process_logs 被替换为只记录到达时间。
+
+用法: python -m benchmarks.bench_alert_latency [每种模式的秒数]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from src.indexer.listener import TradeListener
+from src.indexer.rpc import AsyncRPCClient
+from benchmarks.ws_stub import StubNode
+
+PORT = 18545
+WARMUP_SECONDS = 3
+
+
+async def run_mode(node: StubNode, ws_url: str, seconds: float, poll_interval: int = 2) -> list:
+    rpc = AsyncRPCClient(rpc_url=f"http://127.0.0.1:{PORT}")
+    listener = TradeListener(None, rpc=rpc, ws_url=ws_url)
+    latencies = []
+    measure_from = time.monotonic() + WARMUP_SECONDS
+
+    async def no_token_map():
+        pass
+
+    async def record(logs, cursor=None):
+        now = time.monotonic()
+        for log in logs:
+            emitted = node.emitted_at.get(log["transactionHash"])
+            if emitted is not None and emitted >= measure_from:
+                latencies.append(now - emitted)
+        return {"matched": 0, "inserted": 0, "skipped": 0, "whales": 0}
+
+    listener.refresh_token_map = no_token_map
+    listener.process_logs = record
+
+    task = asyncio.create_task(listener.start(from_block=node.head + 1, poll_interval=poll_interval))
+    await asyncio.sleep(seconds)
+    await listener.stop()
+    task.cancel()
+    await listener.close()
+    return latencies
+
+
+def summarize(name: str, latencies: list):
+    if not latencies:
+        print(f"{name:<8} no logs received")
+        return
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+    print(f"{name:<8} logs {len(latencies):>5} | mean {statistics.mean(latencies) * 1000:8.1f} ms | "
+          f"p50 {statistics.median(latencies) * 1000:8.1f} ms | p95 {p95 * 1000:8.1f} ms")
+
+
+async def bench(seconds: float):
+    node = StubNode(block_time=2.0, logs_per_block=5)
+    await node.start(PORT)
+    try:
+        polling = await run_mode(node, "", seconds)
+        push = await run_mode(node, f"ws://127.0.0.1:{PORT}", seconds)
+    finally:
+        await node.stop()
+
+    summarize("polling", polling)
+    summarize("push", push)
+
+
+if __name__ == "__main__":
+    asyncio.run(bench(float(sys.argv[1]) if len(sys.argv) > 1 else 20))
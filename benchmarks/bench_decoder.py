@@ -0,0 +1,66 @@
+"""解码器基准测试 - 对比 decode_order_filled 逐条解码与 decode_many 批量解码的吞吐
+
+用法: python -m benchmarks.bench_decoder [日志数量]
+"""
+import random
+import sys
+import time
+
+from hexbytes import HexBytes
+
+from src.indexer.decoder import TradeDecoder, ORDER_FILLED_TOPIC_BYTES
+
+
+def make_logs(n: int, seed: int = 42) -> list:
+    """生成 n 条模拟 web3 get_logs 返回格式的 OrderFilled 日志"""
+    rng = random.Random(seed)
+    logs = []
+    for i in range(n):
+        token_id = rng.getrandbits(256)
+        usdc = rng.randint(1, 50_000) * 10 ** 6
+        tokens = rng.randint(1, 100_000) * 10 ** 6
+        if i % 2:
+            words = [0, token_id, usdc, tokens, 0]
+        else:
+            words = [token_id, 0, tokens, usdc, 0]
+        logs.append({
+            "topics": [
+                HexBytes(ORDER_FILLED_TOPIC_BYTES),
+                HexBytes(rng.randbytes(32)),
+                HexBytes(bytes(12) + rng.randbytes(20)),
+                HexBytes(bytes(12) + rng.randbytes(20)),
+            ],
+            "data": HexBytes(b"".join(w.to_bytes(32, "big") for w in words)),
+            "transactionHash": HexBytes(rng.randbytes(32)),
+            "logIndex": i % 200,
+            "blockNumber": 50_000_000 + i // 50,
+        })
+    return logs
+
+
+def bench(n: int):
+    decoder = TradeDecoder()
+    logs = make_logs(n)
+
+    start = time.perf_counter()
+    per_log = [decoder.decode_order_filled(log) for log in logs]
+    per_log_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = decoder.decode_many(logs)
+    batch_elapsed = time.perf_counter() - start
+
+    # 结果必须一致
+    assert len(batch) == len(per_log)
+    for i in (0, 1, n // 2, n - 1):
+        assert batch.row(i) == per_log[i], f"mismatch at {i}"
+
+    print(f"logs:          {n:,}")
+    print(f"per-log path:  {n / per_log_elapsed:,.0f} logs/s ({per_log_elapsed:.3f}s)")
+    print(f"decode_many:   {n / batch_elapsed:,.0f} logs/s ({batch_elapsed:.3f}s)")
+    print(f"speedup:       {per_log_elapsed / batch_elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    bench(n)
@@ -0,0 +1,140 @@
+"""画像刷新基准测试 - 对比逐地址刷新与集合化 refresh_all_profiles
+
+需要可用的 PostgreSQL（DATABASE_URL）。测试交易 / 市场以 0xbench / bench- 前缀写入并在结束时删除；
+集合化刷新会一并重算库中已有交易者的画像（幂等）。逐地址旧路径只抽样 SAMPLE_MAKERS 个地址计时，
+再按地址总数外推。
+
+用法: python -m benchmarks.bench_profile_refresh [交易数，默认 1000000] [地址数，默认 50000]
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import delete, select
+
+from src.db import AsyncSessionLocal, init_db, close_db
+from src.models import Market, Trade, TraderProfile
+from src.indexer.writer import TradeWriter
+from src.profiler.analyzer import TraderProfiler
+
+TX_PREFIX = "0xbench"
+MAKER_PREFIX = "0xbe0c"
+SLUG_PREFIX = "bench-"
+MARKETS = 200
+SAMPLE_MAKERS = 200
+
+
+def maker_address(i: int) -> str:
+    return f"{MAKER_PREFIX}{i:036x}"
+
+
+async def seed(n_trades: int, n_makers: int):
+    """写入 MARKETS 个市场（一半已结算）和 n_trades 条交易"""
+    rng = random.Random(11)
+    async with AsyncSessionLocal() as session:
+        for m in range(MARKETS):
+            session.add(Market(
+                slug=f"{SLUG_PREFIX}{m}",
+                condition_id=f"0x{m:064x}",
+                yes_token_id=str(m * 2),
+                no_token_id=str(m * 2 + 1),
+                question="bench",
+                resolved=m % 2 == 0,
+                resolution_outcome=("YES" if m % 4 == 0 else "NO") if m % 2 == 0 else None,
+            ))
+        await session.commit()
+
+    writer = TradeWriter(AsyncSessionLocal, chunk_size=2000)
+    start_time = datetime.utcnow() - timedelta(days=30)
+    batch = []
+    for i in range(n_trades):
+        price = Decimal(rng.randint(1, 99)) / Decimal(100)
+        size = Decimal(rng.randint(1, 5_000))
+        batch.append({
+            "tx_hash": f"{TX_PREFIX}{i:059x}",
+            "log_index": 0,
+            "block_number": i,
+            "market_slug": f"{SLUG_PREFIX}{rng.randrange(MARKETS)}",
+            "maker": maker_address(rng.randrange(n_makers)),
+            "taker": "",
+            "side": rng.choice(("BUY", "SELL")),
+            "outcome": rng.choice(("YES", "NO")),
+            "price": price,
+            "size": size,
+            "amount_usd": price * size,
+            "is_whale": False,
+            "timestamp": start_time + timedelta(seconds=i),
+        })
+        if len(batch) >= 50_000:
+            await writer.write(batch)
+            batch = []
+    if batch:
+        await writer.write(batch)
+
+
+async def per_maker_path(address: str):
+    """旧路径：每个地址一个会话，读出全部交易和全部已结算市场，在 Python 中聚合"""
+    async with AsyncSessionLocal() as session:
+        trades = (await session.execute(select(Trade).where(Trade.maker == address))).scalars().all()
+        resolved = await session.execute(select(Market).where(Market.resolved == True))
+        resolved_map = {m.slug: m.resolution_outcome for m in resolved.scalars().all()}
+
+        total_volume = Decimal(0)
+        wins = losses = 0
+        for trade in trades:
+            total_volume += trade.amount_usd
+            if trade.market_slug in resolved_map:
+                won = (trade.outcome == resolved_map[trade.market_slug]) == (trade.side == "BUY")
+                wins += won
+                losses += not won
+
+        profile = await session.get(TraderProfile, address)
+        if profile is None:
+            session.add(TraderProfile(address=address, total_trades=len(trades), total_volume=total_volume,
+                                      win_count=wins, loss_count=losses))
+        await session.commit()
+
+
+async def cleanup():
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(Trade).where(Trade.tx_hash.like(f"{TX_PREFIX}%")))
+        await session.execute(delete(Market).where(Market.slug.like(f"{SLUG_PREFIX}%")))
+        await session.execute(delete(TraderProfile).where(TraderProfile.address.like(f"{MAKER_PREFIX}%")))
+        await session.commit()
+
+
+async def bench(n_trades: int, n_makers: int):
+    await init_db()
+    await cleanup()
+
+    try:
+        start = time.perf_counter()
+        await seed(n_trades, n_makers)
+        print(f"seeded:          {n_trades:,} trades / {n_makers:,} makers ({time.perf_counter() - start:.1f}s)")
+
+        sample = [maker_address(i) for i in range(min(SAMPLE_MAKERS, n_makers))]
+        start = time.perf_counter()
+        for address in sample:
+            await per_maker_path(address)
+        per_maker = (time.perf_counter() - start) / len(sample)
+
+        profiler = TraderProfiler(AsyncSessionLocal)
+        start = time.perf_counter()
+        count = await profiler.refresh_all_profiles()
+        set_based = time.perf_counter() - start
+
+        print(f"per-maker path:  {per_maker * 1000:.1f} ms/maker -> ~{per_maker * n_makers:,.0f}s for all makers (extrapolated)")
+        print(f"set-based:       {set_based:.1f}s for {count:,} profiles")
+        print(f"speedup:         ~{per_maker * n_makers / set_based:.0f}x")
+    finally:
+        await cleanup()
+        await close_db()
+
+
+if __name__ == "__main__":
+    n_trades = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_makers = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    asyncio.run(bench(n_trades, n_makers))
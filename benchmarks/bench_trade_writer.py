@@ -0,0 +1,103 @@
+"""交易写入基准测试 - 对比逐条 SELECT + INSERT + COMMIT 与 TradeWriter 批量写入的 rows/s
+
+需要可用的 PostgreSQL（DATABASE_URL），测试数据以 0xbench 前缀写入并在结束时删除；
+TradeWriter 不更新交易者画像，与旧路径的工作量一致。
+
+用法: python -m benchmarks.bench_trade_writer [行数]
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import delete, select
+
+from src.db import AsyncSessionLocal, init_db, close_db
+from src.models import Trade
+from src.indexer.writer import TradeWriter
+
+TX_PREFIX = "0xbench"
+
+
+def make_rows(n: int, tag: str) -> list:
+    """生成 n 条交易行（每笔交易 4 个 fill）"""
+    rng = random.Random(7)
+    rows = []
+    for i in range(n):
+        price = Decimal(rng.randint(1, 99)) / Decimal(100)
+        size = Decimal(rng.randint(1, 10_000))
+        rows.append({
+            "tx_hash": f"{TX_PREFIX}{tag}{i // 4:058x}"[:66],
+            "log_index": i % 4,
+            "block_number": 50_000_000 + i // 50,
+            "market_slug": "bench-market",
+            "maker": f"0x{rng.getrandbits(160):040x}",
+            "taker": f"0x{rng.getrandbits(160):040x}",
+            "side": "BUY",
+            "outcome": "YES",
+            "price": price,
+            "size": size,
+            "amount_usd": price * size,
+            "is_whale": False,
+            "timestamp": datetime.utcnow(),
+        })
+    return rows
+
+
+async def per_row_path(rows: list):
+    """旧路径：每行一个会话、一次去重 SELECT、一次 INSERT、一次 COMMIT"""
+    for row in rows:
+        async with AsyncSessionLocal() as session:
+            existing = await session.execute(
+                select(Trade).where(
+                    Trade.tx_hash == row["tx_hash"],
+                    Trade.log_index == row["log_index"],
+                )
+            )
+            if existing.scalar_one_or_none():
+                continue
+            session.add(Trade(**row))
+            await session.commit()
+
+
+async def cleanup():
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(Trade).where(Trade.tx_hash.like(f"{TX_PREFIX}%")))
+        await session.commit()
+
+
+async def bench(n: int):
+    await init_db()
+    await cleanup()
+    # 只比较交易写入本身（旧路径不更新画像），也避免留下随机 maker 的画像
+    writer = TradeWriter(AsyncSessionLocal, update_profiles=False)
+
+    try:
+        rows = make_rows(n, "a")
+        start = time.perf_counter()
+        await per_row_path(rows)
+        per_row_elapsed = time.perf_counter() - start
+
+        rows = make_rows(n, "b")
+        start = time.perf_counter()
+        result = await writer.write(rows)
+        batch_elapsed = time.perf_counter() - start
+
+        # 重放同一窗口，全部应被唯一索引跳过
+        replay = await writer.write(rows)
+
+        print(f"rows:            {n:,}")
+        print(f"per-row path:    {n / per_row_elapsed:,.0f} rows/s ({per_row_elapsed:.3f}s)")
+        print(f"TradeWriter:     {n / batch_elapsed:,.0f} rows/s ({batch_elapsed:.3f}s) {result}")
+        print(f"replay:          {replay}")
+        print(f"speedup:         {per_row_elapsed / batch_elapsed:.1f}x")
+    finally:
+        await cleanup()
+        await close_db()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    asyncio.run(bench(n))
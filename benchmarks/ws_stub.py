@@ -0,0 +1,137 @@
+"""本地 Polygon 节点桩 - 同一端口提供 HTTP JSON-RPC 与 WebSocket eth_subscribe
+
+平均每 block_time 秒出块（带随机抖动），每个区块产生 logs_per_block 条 OrderFilled 日志。
+每条日志的产生时间记录在 emitted_at 中（按 transactionHash 索引），用于测量端到端延迟。
+
+用法: python -m benchmarks.ws_stub [端口]
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Set
+
+from aiohttp import web, WSMsgType
+
+from src.indexer.decoder import ORDER_FILLED_TOPIC
+
+
+class StubNode:
+    """模拟节点"""
+
+    def __init__(self, block_time: float = 2.0, logs_per_block: int = 5, start_block: int = 50_000_000):
+        self.block_time = block_time
+        self.logs_per_block = logs_per_block
+        self.head = start_block
+        self.logs: Dict[int, List[Dict]] = {}
+        self.timestamps: Dict[int, int] = {}
+        self.emitted_at: Dict[str, float] = {}
+        self.sockets: Set[web.WebSocketResponse] = set()
+        self.drop_sockets = False  # 置为 True 时断开所有订阅，用于测试回退轮询
+        self._rng = random.Random(1)
+        self._runner: Optional[web.AppRunner] = None
+        self._producer: Optional[asyncio.Task] = None
+
+    def _make_log(self, block_number: int, index: int) -> Dict:
+        words = [0, self._rng.getrandbits(256), 20_000 * 10 ** 6, 40_000 * 10 ** 6, 0]
+        return {
+            "address": "0x4bfb41d5b3570defd03c39a9a4d8de6bd8b8982e",
+            "topics": [
+                ORDER_FILLED_TOPIC,
+                "0x" + self._rng.randbytes(32).hex(),
+                "0x" + "00" * 12 + self._rng.randbytes(20).hex(),
+                "0x" + "00" * 12 + self._rng.randbytes(20).hex(),
+            ],
+            "data": "0x" + b"".join(w.to_bytes(32, "big") for w in words).hex(),
+            "blockNumber": hex(block_number),
+            "transactionHash": "0x" + self._rng.randbytes(32).hex(),
+            "logIndex": hex(index),
+            "removed": False,
+        }
+
+    async def _produce(self):
+        while True:
+            await asyncio.sleep(self.block_time * self._rng.uniform(0.5, 1.5))
+            self.head += 1
+            self.timestamps[self.head] = int(time.time())
+            block_logs = [self._make_log(self.head, i) for i in range(self.logs_per_block)]
+            self.logs[self.head] = block_logs
+
+            now = time.monotonic()
+            for log in block_logs:
+                self.emitted_at[log["transactionHash"]] = now
+
+            for ws in list(self.sockets):
+                if self.drop_sockets:
+                    await ws.close()
+                    continue
+                for log in block_logs:
+                    await ws.send_str(json.dumps({
+                        "jsonrpc": "2.0",
+                        "method": "eth_subscription",
+                        "params": {"subscription": "0xstub", "result": log},
+                    }))
+
+    def _handle_call(self, call: Dict) -> Dict:
+        method = call.get("method")
+        params = call.get("params") or []
+        result = None
+        if method == "eth_blockNumber":
+            result = hex(self.head)
+        elif method == "eth_getLogs":
+            start = int(params[0]["fromBlock"], 16)
+            end = min(int(params[0]["toBlock"], 16), self.head)
+            result = [log for n in range(start, end + 1) for log in self.logs.get(n, [])]
+        elif method == "eth_getBlockByNumber":
+            number = int(params[0], 16)
+            result = {"number": params[0], "timestamp": hex(self.timestamps.get(number, int(time.time())))}
+        return {"jsonrpc": "2.0", "id": call.get("id"), "result": result}
+
+    async def _http(self, request: web.Request) -> web.StreamResponse:
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            return await self._websocket(request)
+        body = await request.json()
+        if isinstance(body, list):
+            return web.json_response([self._handle_call(call) for call in body])
+        return web.json_response(self._handle_call(body))
+
+    async def _websocket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                break
+            data = json.loads(message.data)
+            if data.get("method") == "eth_subscribe":
+                await ws.send_str(json.dumps({"jsonrpc": "2.0", "id": data.get("id"), "result": "0xstub"}))
+                self.sockets.add(ws)
+        self.sockets.discard(ws)
+        return ws
+
+    async def start(self, port: int = 8545):
+        app = web.Application()
+        app.router.add_route("*", "/", self._http)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", port).start()
+        self._producer = asyncio.create_task(self._produce())
+
+    async def stop(self):
+        if self._producer:
+            self._producer.cancel()
+        for ws in list(self.sockets):
+            await ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def main(port: int):
+    node = StubNode()
+    await node.start(port)
+    print(f"Stub node on http://127.0.0.1:{port} and ws://127.0.0.1:{port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 8545))
@@ -2,7 +2,7 @@
 import json
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Dict, Optional
+from typing import Awaitable, Callable, List, Dict, Optional
 from openai import AsyncOpenAI
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -165,12 +165,17 @@ class InsiderAnalyzer:
             print(f"解析响应失败: {e}")
             return None
 
-    async def scan_pending_trades(self, limit: int = 10) -> List[InsiderAlert]:
+    async def scan_pending_trades(
+        self,
+        limit: int = 10,
+        progress: Optional[Callable[[int, int], Awaitable]] = None,
+    ) -> List[InsiderAlert]:
         """
         扫描待分析的大单
 
         Args:
             limit: 每次处理的数量限制
+            progress: 可选进度回调 (已分析交易数, 总数)
 
         Returns:
             生成的 InsiderAlert 列表
@@ -198,8 +203,10 @@ class InsiderAnalyzer:
             pending_trades = result.scalars().all()
 
             print(f"发现 {len(pending_trades)} 笔待分析大单")
+            if progress:
+                await progress(0, len(pending_trades))
 
-            for trade in pending_trades:
+            for i, trade in enumerate(pending_trades, 1):
                 print(f"分析交易: {trade.tx_hash[:16]}... ({trade.market_slug})")
                 alert = await self.analyze_trade(trade)
 
@@ -212,6 +219,9 @@ class InsiderAnalyzer:
                     else:
                         print(f"  ✓ 正常交易")
 
+                if progress:
+                    await progress(i, len(pending_trades))
+
             await session.commit()
 
         return alerts
@@ -8,6 +8,7 @@ from ..db import get_db
 from ..models import Trade, Market, TraderProfile, InsiderAlert
 from ..profiler.analyzer import TraderProfiler
 from ..agent.insider import InsiderAnalyzer
+from ..jobs import JOB_AI_BATCH_ANALYZE, JOB_INSIDER_ANALYZE, get_job_queue
 
 router = APIRouter(prefix="/api", tags=["default"])
 
@@ -309,14 +310,15 @@ async def get_insider_alerts(
     )
 
 
-@router.post("/insider/analyze", tags=["Insider Analysis"])
+@router.post("/insider/analyze", tags=["Insider Analysis"], status_code=202)
 async def trigger_insider_analysis(
     limit: int = Query(default=5, ge=1, le=20, description="分析的交易数量"),
 ):
     """
     # 手动触发内幕分析
 
-    对未分析的大单交易进行AI内幕分析。
+    对未分析的大单交易进行AI内幕分析。提交后立即返回任务ID，
+    通过 `GET /api/jobs/{job_id}` 查询进度和结果。
 
     ## 执行流程
     1. 从数据库查询未分析的大单（is_whale=true）
@@ -329,19 +331,10 @@ async def trigger_insider_analysis(
     - 每次分析会消耗AI API额度
     - 建议设置较小的limit进行测试（5-10）
     - 已分析过的交易会被跳过
+    - 同一时间只运行一个内幕分析任务：已有任务在排队 / 执行中时，重复提交返回已有任务
+      （不论 limit，两个任务会扫描同一批未分析的大单）
     """
-    from ..db import AsyncSessionLocal
-
-    analyzer = InsiderAnalyzer(AsyncSessionLocal)
-    alerts = await analyzer.scan_pending_trades(limit=limit)
-
-    suspect_count = sum(1 for a in alerts if a.is_suspect)
-
-    return {
-        "analyzed": len(alerts),
-        "suspect_count": suspect_count,
-        "message": f"已分析 {len(alerts)} 笔交易，发现 {suspect_count} 笔可疑交易",
-    }
+    return await _submit_job(JOB_INSIDER_ANALYZE, {}, {"limit": limit})
 
 
 # ==================== AI 交易者画像接口 ====================
@@ -373,9 +366,9 @@ async def get_ai_leaderboard(
     - 学习成功交易者的行为模式
     """
     from ..db import AsyncSessionLocal
-    from ..profiler.ai_analyzer import TraderAIProfiler
+    from ..profiler.ai_analyzer import get_ai_profiler
 
-    ai_profiler = TraderAIProfiler(AsyncSessionLocal)
+    ai_profiler = get_ai_profiler(AsyncSessionLocal)
     leaderboard = await ai_profiler.get_top_traders_with_ai(
         session=db,
         limit=limit,
@@ -390,7 +383,7 @@ async def analyze_trader_ai(
     address: str,
     force_refresh: bool = Query(
         default=False,
-        description="是否强制重新分析（忽略缓存）"
+        description="是否重新分析已有标签的交易者（输入未变化时仍返回缓存）"
     ),
     db: AsyncSession = Depends(get_db)
 ):
@@ -401,7 +394,8 @@ async def analyze_trader_ai(
 
     ## 功能说明
     - 首次分析会调用AI生成画像
-    - 已分析过的交易者返回缓存结果（除非使用 force_refresh=true）
+    - 结果按输入指纹（画像统计 + 最近交易 + 模型 + 提示词版本）缓存，输入未变化时直接返回缓存（cached=true）
+    - 输入变化后自动重新分析；没有指纹的旧结果需要 force_refresh=true 才会重新分析
     - 分析维度包括：交易风格、风险偏好、决策特点、行为模式等
 
     ## 前置条件
@@ -414,9 +408,9 @@ async def analyze_trader_ai(
     - 建议先查看基础画像后再决定是否AI分析
     """
     from ..db import AsyncSessionLocal
-    from ..profiler.ai_analyzer import TraderAIProfiler
+    from ..profiler.ai_analyzer import get_ai_profiler
 
-    ai_profiler = TraderAIProfiler(AsyncSessionLocal)
+    ai_profiler = get_ai_profiler(AsyncSessionLocal)
     result = await ai_profiler.analyze_trader(
         session=db,
         address=address,
@@ -429,7 +423,7 @@ async def analyze_trader_ai(
     return result
 
 
-@router.post("/traders/batch-ai-analyze", tags=["AI Trader Profile"])
+@router.post("/traders/batch-ai-analyze", tags=["AI Trader Profile"], status_code=202)
 async def batch_analyze_traders(
     limit: int = Query(
         default=50,
@@ -446,11 +440,24 @@ async def batch_analyze_traders(
         default=False,
         description="是否强制重新分析已有标签的交易者"
     ),
+    concurrency: Optional[int] = Query(
+        default=None,
+        ge=1,
+        le=32,
+        description="同时在途的分析请求数（默认取配置 AI_MAX_CONCURRENCY）"
+    ),
+    pack_size: Optional[int] = Query(
+        default=None,
+        ge=1,
+        le=20,
+        description="每次请求打包分析的交易者数（默认取配置 AI_PACK_SIZE）"
+    ),
 ):
     """
     # 批量AI分析交易者
 
     批量对多个交易者进行AI画像分析，适合首次部署或定期刷新使用。
+    提交后立即返回任务ID，通过 `GET /api/jobs/{job_id}` 查询进度和结果。
 
     ## 使用场景
     1. **首次部署**: 分析所有活跃交易者（建议 limit=100-200）
@@ -460,8 +467,10 @@ async def batch_analyze_traders(
     ## 执行流程
     1. 从数据库筛选符合条件的交易者（total_trades >= min_trades）
     2. 如果不强制刷新，跳过已有AI标签的交易者
-    3. 依次调用AI进行分析
-    4. 返回批量分析结果
+    3. 并发调用AI进行分析（受 RPM / TPM 限流，429 / 5xx 自动退避重试）；
+       pack_size > 1 时多个交易者合并为一次请求，响应中缺失的交易者单独重试
+    4. 每个交易者单独提交，单个失败不影响其他结果
+    5. 分析结果保存在任务的 result 中
 
     ## 成本估算
     - 每个交易者消耗约 0.01-0.02 元 API 额度
@@ -470,26 +479,89 @@ async def batch_analyze_traders(
 
     ## 性能建议
     - 首次测试建议 limit=10-20
-    - 大批量分析建议在后台运行
     - API有速率限制，每次不超过200个
+    - 同一时间只运行一个批量分析任务：已有任务在排队 / 执行中时，重复提交返回已有任务
+      （不论参数，不同 limit / min_trades 的任务会选中同一批交易者）
 
-    ## 返回结果
+    ## 任务结果（result）
     - **analyzed**: 成功分析的数量
+    - **cached**: 输入未变化、直接复用缓存的数量
     - **message**: 简要说明
     - **results**: 详细的分析结果列表
+    - **stats**: 缓存命中率与模型调用统计
+    """
+    return await _submit_job(
+        JOB_AI_BATCH_ANALYZE,
+        {},
+        {
+            "limit": limit,
+            "min_trades": min_trades,
+            "force_refresh": force_refresh,
+            "concurrency": concurrency,
+            "pack_size": pack_size,
+        },
+    )
+
+
+@router.get("/traders/ai-stats", tags=["AI Trader Profile"])
+async def get_ai_analysis_stats():
+    """
+    # AI分析统计
+
+    返回进程启动以来的 AI 分析统计：缓存命中数 / 未命中数 / 命中率、
+    模型请求数、重试数、失败数和消耗的 token。
     """
     from ..db import AsyncSessionLocal
-    from ..profiler.ai_analyzer import TraderAIProfiler
+    from ..profiler.ai_analyzer import get_ai_profiler
 
-    ai_profiler = TraderAIProfiler(AsyncSessionLocal)
-    results = await ai_profiler.batch_analyze(
-        limit=limit,
-        min_trades=min_trades,
-        force_refresh=force_refresh
-    )
+    return get_ai_profiler(AsyncSessionLocal).stats()
+
+
+# ==================== 后台任务接口 ====================
+
+async def _submit_job(kind: str, scope: dict, params: Optional[dict] = None) -> dict:
+    """提交后台任务，相同 scope 的任务在排队 / 执行中时返回已有任务"""
+    from ..db import AsyncSessionLocal
+
+    try:
+        job, created = await get_job_queue(AsyncSessionLocal).submit(kind, scope, params)
+    except ValueError:
+        raise HTTPException(status_code=503, detail="后台任务服务未启动")
 
     return {
-        "analyzed": len(results),
-        "message": f"已完成 {len(results)} 个交易者的AI画像分析",
-        "results": results
+        **job,
+        "deduplicated": not created,
+        "message": "任务已提交" if created else "同类任务已在排队 / 执行中，返回已有任务",
     }
+
+
+@router.get("/jobs", tags=["Jobs"])
+async def list_jobs(
+    kind: Optional[str] = Query(default=None, description="任务类型: ai_batch_analyze / insider_analyze"),
+    status: Optional[str] = Query(default=None, description="状态: queued / running / succeeded / failed"),
+    limit: int = Query(default=20, ge=1, le=100, description="返回数量"),
+):
+    """
+    # 最近的后台任务
+
+    按提交时间倒序返回任务状态与进度（不含结果）。
+    """
+    from ..db import AsyncSessionLocal
+
+    return {"data": await get_job_queue(AsyncSessionLocal).recent(kind=kind, status=status, limit=limit)}
+
+
+@router.get("/jobs/{job_id}", tags=["Jobs"])
+async def get_job(job_id: int):
+    """
+    # 查询后台任务
+
+    返回任务状态（queued / running / succeeded / failed）、
+    进度（progress / total）、结果（result）或错误信息（error）。
+    """
+    from ..db import AsyncSessionLocal
+
+    job = await get_job_queue(AsyncSessionLocal).get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
@@ -11,11 +11,49 @@ class Settings(BaseSettings):
 
     # Polygon RPC
     POLYGON_RPC_URL: str = "https://polygon-rpc.com"
+    POLYGON_WS_URL: str = ""  # 节点 WebSocket 地址，配置后监听器启用 eth_subscribe 推送模式
+    WS_RETRY_DELAY: float = 30.0  # 订阅断开后回退轮询多久再重试（秒）
+    BLOCK_CACHE_SIZE: int = 10000  # 区块时间戳 LRU 缓存容量
+    RPC_TIMEOUT: float = 20.0  # 单次 RPC 调用超时（秒）
+    RPC_MAX_RETRIES: int = 3  # 限流 / 网络错误最大重试次数
+    RPC_MAX_CONCURRENCY: int = 8  # 同时在途的 RPC 请求上限（连接池大小）
+
+    # Token 注册表
+    TOKEN_REGISTRY_REFRESH_INTERVAL: float = 60.0  # 后台增量刷新间隔（秒）
+    TOKEN_REGISTRY_WATERMARK_OVERLAP: float = 300.0  # 增量刷新回看水位线之前的时间（秒），覆盖晚提交的行
+
+    # 监听器追赶
+    CATCHUP_TARGET_LOGS: int = 2000  # 每个 get_logs 窗口期望的日志数
+    CATCHUP_TARGET_LATENCY: float = 2.0  # 每次 get_logs 期望的响应时间（秒）
+    CATCHUP_MAX_PARALLEL: int = 4  # 落后时最多同时获取的窗口数
+    CATCHUP_MAX_WINDOW: int = 2000  # 最大窗口区块数
+
+    # 历史回填
+    BACKFILL_WORKERS: int = 4  # 并发分片数
+    BACKFILL_MAX_RPS: float = 20.0  # 回填全局 RPC 请求预算（次/秒）
+
+    # 快速回填（Polymarket Data API）
+    FAST_BACKFILL_FETCHERS: int = 4  # 并发分页获取协程数
+    FAST_BACKFILL_MAX_RPS: float = 10.0  # Data API 请求预算（次/秒）
+    FAST_BACKFILL_MAX_RETRIES: int = 3  # 限流 / 网络错误最大重试次数
 
     # DeepSeek API
     DEEPSEEK_BASE_URL: str = "https://api.siliconflow.cn/v1"
     DEEPSEEK_API_KEY: str = ""
     DEEPSEEK_MODEL: str = "deepseek-ai/DeepSeek-V3"
+    AI_MAX_CONCURRENCY: int = 4  # 批量分析同时在途的 LLM 请求数
+    AI_MAX_RPM: float = 60.0  # LLM 每分钟请求预算
+    AI_MAX_TPM: float = 100000.0  # LLM 每分钟 token 预算（按提示词长度估算）
+    AI_MAX_RETRIES: int = 3  # 限流 / 5xx / 网络错误最大重试次数
+    AI_PACK_SIZE: int = 1  # 每次请求打包分析的交易者数（1 为逐个分析）
+
+    # AI 画像定期重分析
+    AI_REANALYSIS_ENABLED: bool = False  # 服务启动时是否运行重分析调度（会消耗 LLM 额度）
+    AI_REANALYSIS_HOURLY_BUDGET: int = 60  # 每小时最多发送的模型请求数（含重试）
+    AI_REANALYSIS_INTERVAL: float = 600.0  # 调度间隔（秒），每轮按比例使用小时预算
+    AI_REANALYSIS_MIN_TRADES: int = 5  # 参与调度的最小交易数
+    AI_REANALYSIS_MIN_NEW_TRADES: int = 3  # 分析后新增交易数达到该值视为过期
+    AI_REANALYSIS_MIN_DRIFT: float = 2.0  # 胜率漂移（百分点）达到该值视为过期
 
     # 业务配置
     WHALE_THRESHOLD: float = 10000.0  # 大单阈值 1万U
@@ -28,6 +66,16 @@ class Settings(BaseSettings):
 
     # Gamma API
     GAMMA_API_URL: str = "https://gamma-api.polymarket.com"
+    GAMMA_PAGE_SIZE: int = 500  # 市场发现每页数量
+    GAMMA_MAX_CONCURRENCY: int = 4  # 市场发现同时在途的分页请求数
+    GAMMA_CACHE_PATH: str = ".cache/gamma_markets.json"  # 条件请求缓存与市场快照（为空则不缓存）
+
+    # 市场结算追踪
+    RESOLUTION_POLL_INTERVAL: float = 300.0  # 结算追踪轮询间隔（秒）
+    RESOLUTION_BATCH_SIZE: int = 500  # 每轮最多检查的未结算市场数
+
+    # 后台任务
+    JOB_WORKERS: int = 2  # 同时执行的后台任务数（批量 AI 分析 / 内幕分析）
 
     class Config:
         env_file = ".env"
@@ -124,6 +124,13 @@ export async function triggerInsiderAnalysis(limit = 5): Promise<any> {
   return fetchApi(`/api/insider/analyze${query}`, { method: 'POST' })
 }
 
+// ==================== Jobs API ====================
+
+// batch-ai-analyze / insider/analyze return a job; poll it for progress and result
+export async function getJob(jobId: number): Promise<any> {
+  return fetchApi(`/api/jobs/${jobId}`)
+}
+
 // ==================== Health Check ====================
 
 export async function healthCheck(): Promise<{ status: string; service: string }> {
@@ -152,6 +159,9 @@ export const api = {
   getInsiderAlerts,
   triggerInsiderAnalysis,
 
+  // Jobs
+  getJob,
+
   // System
   healthCheck,
 }
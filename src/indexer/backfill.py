@@ -1,15 +1,20 @@
 """历史数据回填模块 - 批量获取历史链上交易数据"""
 import asyncio
+import time
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from web3 import Web3
-from web3.providers import HTTPProvider
 
 from ..config import get_settings
 from ..db import AsyncSessionLocal, init_db, close_db
 from ..models import Market
-from .decoder import TradeDecoder, ORDER_FILLED_TOPIC
+from .decoder import ORDER_FILLED_TOPIC
 from .listener import TradeListener
+from .pipeline import BackfillPipeline, WindowItem
+from .blocks import BlockTimestampCache
+from .rpc import AsyncRPCClient, RPCError
+from .scheduler import AdaptiveWindow, is_range_too_large
+from .cursors import BACKFILL_JOB_PREFIX, backfill_job_name, ensure_cursor, list_cursors
 
 settings = get_settings()
 
@@ -17,15 +22,29 @@ settings = get_settings()
 BLOCKS_PER_DAY = 43200
 BLOCKS_PER_MONTH = BLOCKS_PER_DAY * 30
 
+# 同一范围连续失败多少次后跳过
+MAX_RANGE_FAILURES = 3
+
 
 class HistoryBackfill:
     """历史数据回填器"""
 
-    def __init__(self):
-        self.w3 = Web3(HTTPProvider(settings.POLYGON_RPC_URL))
-        self.decoder = TradeDecoder()
+    def __init__(
+        self,
+        rpc: Optional[AsyncRPCClient] = None,
+        block_cache: Optional[BlockTimestampCache] = None,
+    ):
+        """
+        初始化回填器
+
+        Args:
+            rpc: 异步 RPC 客户端，与监听器共享，默认按 BACKFILL_MAX_RPS 限速新建
+            block_cache: 区块时间戳缓存，与监听器共享，默认新建
+        """
+        self.rpc = rpc or AsyncRPCClient(max_rps=settings.BACKFILL_MAX_RPS)
         self.exchange_address = Web3.to_checksum_address(settings.CTF_EXCHANGE_ADDRESS)
-        self.listener = TradeListener(AsyncSessionLocal)
+        self.block_cache = block_cache or BlockTimestampCache(self.rpc)
+        self.listener = TradeListener(AsyncSessionLocal, rpc=self.rpc, block_cache=self.block_cache)
 
     async def estimate_block_for_date(self, target_date: datetime) -> int:
         """
@@ -37,7 +56,7 @@ class HistoryBackfill:
         Returns:
             估算的区块号
         """
-        current_block = self.w3.eth.block_number
+        current_block = await self.rpc.block_number()
         current_time = datetime.utcnow()
 
         # 计算时间差（秒）
@@ -61,7 +80,7 @@ class HistoryBackfill:
         Returns:
             (起始区块, 结束区块)
         """
-        end_block = self.w3.eth.block_number
+        end_block = await self.rpc.block_number()
         start_date = datetime.utcnow() - timedelta(days=months * 30)
         start_block = await self.estimate_block_for_date(start_date)
 
@@ -72,119 +91,285 @@ class HistoryBackfill:
         from_block: Optional[int] = None,
         to_block: Optional[int] = None,
         months: int = 6,
-        batch_size: int = 1,
-        delay: float = 0.2,
+        batch_size: int = 100,
+        workers: Optional[int] = None,
+        resume: bool = False,
     ):
         """
         执行历史数据回填
 
+        区块范围被切分为 workers 个连续分片并发获取，所有分片共享 RPC
+        客户端的全局请求预算；每个分片的窗口大小按响应自适应调整。
+        获取到的窗口进入 解码 → 匹配 → 补充时间戳 → 写入 流水线，
+        每条日志只解码一次；每个分片的进度作为采集游标与交易在同一事务中提交。
+
         Args:
             from_block: 起始区块（如果指定则忽略 months）
             to_block: 结束区块（默认最新）
             months: 回填月数（默认 6 个月）
-            batch_size: 每批处理的区块数
-            delay: 每批之间的延迟（秒），避免 RPC 限流
+            batch_size: 每个分片的初始窗口区块数
+            workers: 并发分片数（默认取配置 BACKFILL_WORKERS）
+            resume: 从已保存的分片游标继续，跳过已完成的范围
         """
-        # 初始化数据库
-        await init_db()
+        try:
+            # 初始化数据库
+            await init_db()
+
+            # 刷新 token 映射
+            await self.listener.refresh_token_map()
+
+            if not self.listener.token_map:
+                print("[WARN] No market mapping available, please sync markets first")
+                return
+
+            shards = await self._load_resumable_shards() if resume else None
+
+            if shards is None:
+                # 确定区块范围
+                if from_block is None:
+                    from_block, _ = await self.get_block_range_for_period(months)
 
-        # 刷新 token 映射
-        await self.listener.refresh_token_map()
+                if to_block is None:
+                    to_block = await self.rpc.block_number()
 
-        if not self.listener.token_map:
-            print("[WARN] No market mapping available, please sync markets first")
-            return
+                workers = max(1, workers or settings.BACKFILL_WORKERS)
+                shards = await self._create_shards(from_block, to_block, workers)
 
-        # 确定区块范围
-        if from_block is None:
-            from_block, _ = await self.get_block_range_for_period(months)
+            if not shards:
+                print("[OK] All saved backfill ranges are already complete")
+                return
 
-        if to_block is None:
-            to_block = self.w3.eth.block_number
+            total_blocks = sum(end - start + 1 for _, start, end in shards)
 
-        total_blocks = to_block - from_block
-        print(f"[*] History Backfill")
-        print(f"    Block range: {from_block:,} - {to_block:,}")
-        print(f"    Total blocks: {total_blocks:,}")
-        print(f"    Estimated batches: {total_blocks // batch_size + 1}")
-        print()
+            print(f"[*] History Backfill{' (resume)' if resume else ''}")
+            print(f"    Block range: {min(s[1] for s in shards):,} - {max(s[2] for s in shards):,}")
+            print(f"    Total blocks: {total_blocks:,}")
+            budget = f"{self.rpc.rate_limiter.rate:g} req/s" if self.rpc.rate_limiter else "unlimited"
+            print(f"    Workers: {len(shards)} | Initial window: {batch_size} blocks | RPC budget: {budget}")
+            print()
 
-        processed_blocks = 0
-        total_trades = 0
-        whale_trades = 0
-        current_block = from_block
+            stats = [
+                self._new_worker_stats(i, job, start, end)
+                for i, (job, start, end) in enumerate(shards)
+            ]
+            start_time = datetime.now()
 
-        start_time = datetime.now()
+            pipeline = BackfillPipeline(self.listener)
+            pipeline.start()
 
-        while current_block <= to_block:
-            batch_end = min(current_block + batch_size - 1, to_block)
+            reporter = asyncio.create_task(self._report_progress(stats, total_blocks, start_time))
+            shard_tasks = [
+                asyncio.create_task(self._run_shard(worker_stats, batch_size, pipeline))
+                for worker_stats in stats
+            ]
+            try:
+                await asyncio.gather(*shard_tasks)
+                await pipeline.join()
+            finally:
+                # 某个分片抛出异常时，取消其余分片和流水线各阶段，不留下悬挂的任务
+                reporter.cancel()
+                for task in shard_tasks:
+                    task.cancel()
+                await asyncio.gather(*shard_tasks, return_exceptions=True)
+                await pipeline.close()
+
+            elapsed_total = datetime.now() - start_time
+            processed_blocks = sum(w["blocks"] for w in stats)
+            seconds = max(elapsed_total.total_seconds(), 1e-9)
+
+            print(f"\n\n[OK] Backfill complete!")
+            print(f"    Duration: {elapsed_total}")
+            print(f"    Blocks processed: {processed_blocks:,} ({processed_blocks / seconds:,.1f} blocks/s)")
+            print(f"    Total trades: {sum(w['logs'] for w in stats):,}")
+            print(f"    Whale trades: {sum(w['whales'] for w in stats):,}")
+            print(f"    Inserted / duplicate: {sum(w['inserted'] for w in stats):,} / "
+                  f"{sum(w['skipped'] for w in stats):,}")
+            print(f"    Failed blocks: {sum(w['failed_blocks'] for w in stats):,}")
+            print(f"    Block cache: {self.block_cache.stats()}")
+            print(f"    RPC: {self.rpc.stats()}")
+            print()
+            print("    Per worker:")
+            for w in stats:
+                print(f"      #{w['worker']} {w['start']:,}-{w['end']:,} | "
+                      f"blocks {w['blocks']:,} ({w['blocks'] / seconds:,.1f}/s) | "
+                      f"requests {w['requests']:,} | trades {w['logs']:,} | "
+                      f"window {w['window']} (+{w['grows']}/-{w['shrinks']}) | "
+                      f"errors {w['errors']}")
+            print()
+            print("    Per stage:")
+            for name, stage in pipeline.stats().items():
+                rate = f"{stage['items_per_sec']:,.1f}/s" if stage["items_per_sec"] is not None else "-"
+                print(f"      {name:<7} | windows {stage['windows']:,} | items {stage['items']:,} ({rate}) | "
+                      f"busy {stage['seconds']:.1f}s | errors {stage['errors'] or '-'}")
+        finally:
+            # 任何提前返回或异常都释放 RPC 连接池和数据库连接
+            await self.listener.close()
+            await close_db()
+
+    async def _create_shards(self, from_block: int, to_block: int, workers: int) -> List[Tuple[str, int, int]]:
+        """切分新的回填范围，并为每个分片创建游标"""
+        shards = [
+            (backfill_job_name(start, end), start, end)
+            for start, end in self._split_range(from_block, to_block, workers)
+        ]
+
+        async with AsyncSessionLocal() as session:
+            for job, start, end in shards:
+                await ensure_cursor(session, job, last_block=start - 1, start_block=start, end_block=end)
+            await session.commit()
+
+        return shards
+
+    async def _load_resumable_shards(self) -> Optional[List[Tuple[str, int, int]]]:
+        """
+        读取已保存的回填分片游标
 
+        Returns:
+            未完成分片 [(job, 续传起点, 终点)]；没有任何已保存分片时返回 None
+        """
+        async with AsyncSessionLocal() as session:
+            cursors = await list_cursors(session, BACKFILL_JOB_PREFIX)
+
+        if not cursors:
+            print("[*] No saved backfill progress, starting a new range")
+            return None
+
+        pending = [
+            (c.job, c.last_block + 1, c.end_block)
+            for c in cursors
+            if c.end_block is not None and c.last_block < c.end_block
+        ]
+        print(f"[*] Resuming backfill: {len(cursors) - len(pending)} of {len(cursors)} saved ranges already complete")
+        return pending
+
+    @staticmethod
+    def _split_range(from_block: int, to_block: int, parts: int) -> List[Tuple[int, int]]:
+        """将 [from_block, to_block] 均分为最多 parts 个连续分片"""
+        total = to_block - from_block + 1
+        parts = max(1, min(parts, total))
+        step, extra = divmod(total, parts)
+
+        shards = []
+        start = from_block
+        for i in range(parts):
+            end = start + step - 1 + (1 if i < extra else 0)
+            shards.append((start, end))
+            start = end + 1
+        return shards
+
+    @staticmethod
+    def _new_worker_stats(worker: int, job: str, start: int, end: int) -> Dict:
+        return {
+            "worker": worker,
+            "job": job,
+            "start": start,
+            "end": end,
+            "current": start,
+            "blocks": 0,
+            "requests": 0,
+            "logs": 0,
+            "inserted": 0,
+            "skipped": 0,
+            "whales": 0,
+            "errors": 0,
+            "failed_blocks": 0,
+            "window": 0,
+            "grows": 0,
+            "shrinks": 0,
+        }
+
+    async def _run_shard(self, stats: Dict, initial_window: int, pipeline: BackfillPipeline):
+        """
+        获取单个分片的日志（流水线的 fetch 阶段）
+
+        Args:
+            stats: 该分片的统计字典（原地更新）
+            initial_window: 初始窗口区块数
+            pipeline: 接收已获取窗口的回填流水线
+        """
+        window = AdaptiveWindow(initial=initial_window)
+        fetch_stage = pipeline.stages["fetch"]
+        current_block = stats["start"]
+        end_block = stats["end"]
+        failures = 0
+
+        while current_block <= end_block:
+            # 下游处理失败后停止获取；游标停在最后提交的区块，--resume 时重试
+            if pipeline.is_failed(stats["job"]):
+                return
+
+            batch_end = min(current_block + window.size - 1, end_block)
+            stats["window"] = window.size
+            stats["requests"] += 1
+
+            started = time.perf_counter()
             try:
                 # 获取事件日志
-                logs = self.w3.eth.get_logs({
+                logs = await self.rpc.get_logs({
                     "address": self.exchange_address,
                     "topics": [ORDER_FILLED_TOPIC],
                     "fromBlock": current_block,
                     "toBlock": batch_end,
                 })
-
-                # 处理日志
-                for log in logs:
-                    try:
-                        await self.listener.process_log(log)
-                        total_trades += 1
-
-                        # 检查是否是大单
-                        trade_data = self.decoder.decode_order_filled(log)
-                        if trade_data:
-                            token_id = trade_data.get("token_id", "")
-                            market_info = self.listener.token_map.get(token_id)
-                            if market_info:
-                                amount_usd = trade_data["price"] * trade_data["size"]
-                                if amount_usd >= settings.WHALE_THRESHOLD:
-                                    whale_trades += 1
-
-                    except Exception as e:
-                        pass  # 跳过处理失败的日志
-
-                processed_blocks += (batch_end - current_block + 1)
-                progress = (processed_blocks / total_blocks) * 100
-
-                # 计算剩余时间
-                elapsed = (datetime.now() - start_time).total_seconds()
-                if processed_blocks > 0:
-                    rate = processed_blocks / elapsed
-                    remaining_blocks = total_blocks - processed_blocks
-                    eta_seconds = remaining_blocks / rate if rate > 0 else 0
-                    eta_str = str(timedelta(seconds=int(eta_seconds)))
-                else:
-                    eta_str = "calculating..."
-
-                print(f"\r    Progress: {progress:.1f}% | Blocks: {current_block:,} - {batch_end:,} | "
-                      f"Trades: {total_trades:,} | Whales: {whale_trades:,} | ETA: {eta_str}   ", end="")
-
-            except Exception as e:
-                print(f"\n    [WARN] Block {current_block} - {batch_end} failed: {e}")
-                # 出错后增加延迟
-                await asyncio.sleep(delay * 2)
-
+            except RPCError as e:
+                if is_range_too_large(e) and window.on_too_large():
+                    fetch_stage.error("rpc_too_large")
+                    stats["shrinks"] = window.shrinks
+                    continue
+
+                fetch_stage.error("rpc_error")
+                stats["errors"] += 1
+                failures += 1
+                if failures < MAX_RANGE_FAILURES:
+                    await asyncio.sleep(failures)
+                    continue
+
+                # 连续失败，停止该分片；游标停在最后提交的区块，--resume 时重试
+                print(f"\n    [WARN] Block {current_block} - {batch_end} failed, stopping worker #{stats['worker']}: {e}")
+                stats["failed_blocks"] += end_block - current_block + 1
+                return
+
+            fetch_stage.record(len(logs), time.perf_counter() - started)
+            failures = 0
+            window.on_success(len(logs))
+            stats["grows"] = window.grows
+
+            # 交给流水线处理（队列满时在此等待）
+            await pipeline.submit(WindowItem(stats, current_block, batch_end, logs))
             current_block = batch_end + 1
-            await asyncio.sleep(delay)
-
-        elapsed_total = datetime.now() - start_time
-        print(f"\n\n[OK] Backfill complete!")
-        print(f"    Duration: {elapsed_total}")
-        print(f"    Blocks processed: {processed_blocks:,}")
-        print(f"    Total trades: {total_trades:,}")
-        print(f"    Whale trades: {whale_trades:,}")
-
-        await close_db()
-
 
-async def run_backfill(months: int = 6, batch_size: int = 2000):
+    async def _report_progress(self, stats: List[Dict], total_blocks: int, start_time: datetime):
+        """定期打印聚合进度"""
+        while True:
+            await asyncio.sleep(2)
+
+            processed_blocks = sum(w["blocks"] for w in stats)
+            progress = (processed_blocks / total_blocks) * 100 if total_blocks else 100.0
+
+            # 计算速率和剩余时间
+            elapsed = (datetime.now() - start_time).total_seconds()
+            rate = processed_blocks / elapsed if elapsed > 0 else 0
+            if rate > 0:
+                eta_str = str(timedelta(seconds=int((total_blocks - processed_blocks) / rate)))
+            else:
+                eta_str = "calculating..."
+
+            print(f"\r    Progress: {progress:.1f}% | Blocks: {processed_blocks:,}/{total_blocks:,} | "
+                  f"{rate:,.1f} blocks/s | Trades: {sum(w['logs'] for w in stats):,} | "
+                  f"Whales: {sum(w['whales'] for w in stats):,} | ETA: {eta_str}   ", end="")
+
+
+async def run_backfill(
+    months: int = 6,
+    batch_size: int = 100,
+    workers: Optional[int] = None,
+    max_rps: Optional[float] = None,
+    resume: bool = False,
+):
     """运行历史数据回填（CLI 入口）"""
-    backfill = HistoryBackfill()
-    await backfill.backfill(months=months, batch_size=batch_size)
+    rpc = AsyncRPCClient(max_rps=max_rps or settings.BACKFILL_MAX_RPS)
+    backfill = HistoryBackfill(rpc=rpc)
+    await backfill.backfill(months=months, batch_size=batch_size, workers=workers, resume=resume)
 
 
 if __name__ == "__main__":
@@ -198,4 +383,4 @@ if __name__ == "__main__":
             pass
 
     print(f"Starting backfill for {months} months...")
-    asyncio.run(run_backfill(months=months))
+    asyncio.run(run_backfill(months=months, resume="--resume" in sys.argv))
@@ -0,0 +1,128 @@
+"""区块时间戳缓存模块 - 按 get_logs 窗口批量获取区块头并做 LRU 缓存"""
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from ..config import get_settings
+from .rpc import AsyncRPCClient, RPCError
+
+settings = get_settings()
+
+# 批量获取区块头的最大尝试次数（每次只重新请求仍缺失的区块）
+FETCH_ATTEMPTS = 3
+
+
+class BlockTimestampError(RPCError):
+    """重试后仍有区块时间戳无法获取"""
+
+
+class BlockTimestampCache:
+    """
+    区块时间戳 LRU 缓存
+
+    同一区块内的多笔成交只需要一次区块头查询；一个 get_logs 窗口内
+    所有缺失的区块通过一次 JSON-RPC batch 请求获取。
+    """
+
+    def __init__(self, rpc: AsyncRPCClient, max_size: Optional[int] = None):
+        """
+        初始化缓存
+
+        Args:
+            rpc: 异步 RPC 客户端
+            max_size: 最多缓存的区块数
+        """
+        self.rpc = rpc
+        self.max_size = max_size or settings.BLOCK_CACHE_SIZE
+        self._timestamps: "OrderedDict[int, int]" = OrderedDict()
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+        self.rpc_batches = 0
+        self.rpc_blocks = 0
+
+    def _put(self, block_number: int, timestamp: int):
+        self._timestamps[block_number] = timestamp
+        self._timestamps.move_to_end(block_number)
+        while len(self._timestamps) > self.max_size:
+            self._timestamps.popitem(last=False)
+
+    async def get_many(self, block_numbers: Iterable[int]) -> Dict[int, int]:
+        """
+        获取一批区块的时间戳
+
+        Args:
+            block_numbers: 区块号序列（每条日志一个，允许重复）
+
+        Returns:
+            {block_number: unix_timestamp}，获取失败的区块不在结果中
+        """
+        result: Dict[int, int] = {}
+        missing: Dict[int, None] = {}  # 保序去重
+
+        for number in block_numbers:
+            if number in result or number in missing:
+                # 同一窗口内重复的区块由同一次查询满足
+                self.hits += 1
+                continue
+            timestamp = self._timestamps.get(number)
+            if timestamp is not None:
+                self._timestamps.move_to_end(number)
+                result[number] = timestamp
+                self.hits += 1
+            else:
+                missing[number] = None
+                self.misses += 1
+
+        if missing:
+            fetched = await self._fetch_headers(list(missing))
+            for number, timestamp in fetched.items():
+                self._put(number, timestamp)
+                result[number] = timestamp
+
+        return result
+
+    async def get(self, block_number: int) -> Optional[int]:
+        """获取单个区块的时间戳"""
+        return (await self.get_many([block_number])).get(block_number)
+
+    async def _fetch_headers(self, block_numbers: list) -> Dict[int, int]:
+        """通过 JSON-RPC batch 请求获取多个区块头，失败或缺失的区块重试"""
+        result: Dict[int, int] = {}
+        missing = list(block_numbers)
+
+        for attempt in range(FETCH_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(attempt)
+
+            self.rpc_batches += 1
+            self.rpc_blocks += len(missing)
+            try:
+                blocks = await self.rpc.batch(
+                    [("eth_getBlockByNumber", [hex(number), False]) for number in missing]
+                )
+            except RPCError as e:
+                print(f"[WARN] 批量获取区块头失败 (第 {attempt + 1} 次): {e}")
+                continue
+
+            for number, block in zip(missing, blocks):
+                if block:
+                    result[number] = int(block["timestamp"], 16)
+            missing = [number for number in missing if number not in result]
+            if not missing:
+                break
+
+        return result
+
+    def stats(self) -> Dict:
+        """缓存命中统计"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._timestamps),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "rpc_batches": self.rpc_batches,
+            "rpc_blocks": self.rpc_blocks,
+        }
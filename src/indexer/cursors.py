@@ -0,0 +1,89 @@
+"""采集游标模块 - 读写 ingestion_cursors，使监听和回填可以断点续传"""
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import IngestionCursor
+
+LISTENER_JOB = "listener"
+BACKFILL_JOB_PREFIX = "backfill:"
+# 按市场的 Data API 回填，last_block 记录已提交的最新成交时间戳（Unix 秒）
+MARKET_JOB_PREFIX = "market:"
+
+
+def backfill_job_name(start_block: int, end_block: int) -> str:
+    """回填分片的任务名"""
+    return f"{BACKFILL_JOB_PREFIX}{start_block}-{end_block}"
+
+
+def market_job_name(condition_id: str) -> str:
+    """按市场回填的任务名（slug 可能超过任务名长度，使用 condition_id）"""
+    return f"{MARKET_JOB_PREFIX}{condition_id}"
+
+
+async def get_cursor(session: AsyncSession, job: str) -> Optional[IngestionCursor]:
+    """读取单个任务的游标"""
+    result = await session.execute(
+        select(IngestionCursor).where(IngestionCursor.job == job)
+    )
+    return result.scalar_one_or_none()
+
+
+async def list_cursors(session: AsyncSession, prefix: str) -> List[IngestionCursor]:
+    """读取任务名以 prefix 开头的全部游标"""
+    result = await session.execute(
+        select(IngestionCursor)
+        .where(IngestionCursor.job.like(f"{prefix}%"))
+        .order_by(IngestionCursor.start_block)
+    )
+    return list(result.scalars().all())
+
+
+async def ensure_cursor(
+    session: AsyncSession,
+    job: str,
+    last_block: int,
+    start_block: Optional[int] = None,
+    end_block: Optional[int] = None,
+):
+    """创建游标（已存在则保持不变，不提交）"""
+    stmt = pg_insert(IngestionCursor).values(
+        job=job,
+        start_block=start_block,
+        end_block=end_block,
+        last_block=last_block,
+        updated_at=datetime.utcnow(),
+    ).on_conflict_do_nothing(index_elements=["job"])
+    await session.execute(stmt)
+
+
+async def advance_cursor(
+    session: AsyncSession,
+    job: str,
+    last_block: int,
+    start_block: Optional[int] = None,
+    end_block: Optional[int] = None,
+):
+    """
+    推进游标（不提交，和该区块的交易在同一事务中提交）
+
+    游标只前进不后退（重放旧窗口不会把游标拉回）。
+    """
+    stmt = pg_insert(IngestionCursor).values(
+        job=job,
+        start_block=start_block,
+        end_block=end_block,
+        last_block=last_block,
+        updated_at=datetime.utcnow(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["job"],
+        set_={
+            "last_block": func.greatest(IngestionCursor.last_block, stmt.excluded.last_block),
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    await session.execute(stmt)
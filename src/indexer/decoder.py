@@ -1,7 +1,7 @@
 """交易解码模块 - 解析 Polymarket CTF Exchange 的 OrderFilled 事件"""
 from __future__ import annotations
 from decimal import Decimal
-from typing import Dict, Optional, Union, Tuple
+from typing import Dict, Iterable, List, Optional, Union, Tuple
 from web3 import Web3
 from eth_abi import decode
 
@@ -20,12 +20,105 @@ ORDER_FILLED_TOPIC = Web3.keccak(
     text="OrderFilled(bytes32,address,address,uint256,uint256,uint256,uint256,uint256)"
 ).hex()
 
+ORDER_FILLED_TOPIC_BYTES = bytes.fromhex(ORDER_FILLED_TOPIC[2:])
+
 # USDC 精度 (6 位小数)
 USDC_DECIMALS = 6
 
 # Conditional Token 精度
 CT_DECIMALS = 6
 
+# data 段: makerAssetId, takerAssetId, makerAmountFilled, takerAmountFilled, fee
+ORDER_FILLED_DATA_SIZE = 5 * 32
+
+
+def _as_bytes(value: Union[bytes, str]) -> bytes:
+    """将 HexBytes / bytes / 0x 十六进制字符串统一为 bytes（bytes 原样返回，不复制）"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return value
+    if value.startswith("0x"):
+        value = value[2:]
+    return bytes.fromhex(value)
+
+
+def _as_int(value: Union[int, str, None]) -> int:
+    """将 int 或 0x 十六进制字符串（原始 JSON-RPC 格式）统一为 int"""
+    if value is None:
+        return 0
+    if isinstance(value, int):
+        return value
+    return int(value, 16)
+
+
+class OrderFilledBatch:
+    """
+    批量解码结果（列式存储）
+
+    每个属性是等长列表，第 i 个元素对应第 i 条成功解码的日志。
+    资产 ID 与金额保持链上原生 int，只有在调用 price/size/row 时才转换为 Decimal，
+    未匹配到市场的日志不需要付出这部分开销。
+    """
+
+    __slots__ = (
+        "tx_hash", "log_index", "block_number", "maker", "taker",
+        "maker_asset_id", "taker_asset_id", "maker_amount_raw", "taker_amount_raw", "fee_raw",
+        "side", "token_id", "usdc_raw", "token_raw", "skipped",
+    )
+
+    def __init__(self):
+        self.tx_hash: List[str] = []
+        self.log_index: List[int] = []
+        self.block_number: List[int] = []
+        self.maker: List[str] = []
+        self.taker: List[str] = []
+        self.maker_asset_id: List[int] = []
+        self.taker_asset_id: List[int] = []
+        self.maker_amount_raw: List[int] = []
+        self.taker_amount_raw: List[int] = []
+        self.fee_raw: List[int] = []
+        self.side: List[str] = []
+        self.token_id: List[int] = []  # conditional token 的 asset id
+        self.usdc_raw: List[int] = []  # USDC 数量（未除精度）
+        self.token_raw: List[int] = []  # token 数量（未除精度）
+        self.skipped = 0  # 非 OrderFilled 或格式错误的日志数
+
+    def __len__(self) -> int:
+        return len(self.tx_hash)
+
+    def size(self, i: int) -> Decimal:
+        """第 i 笔成交的 token 数量"""
+        return Decimal(self.token_raw[i]) / Decimal(10 ** CT_DECIMALS)
+
+    def price(self, i: int) -> Decimal:
+        """第 i 笔成交的价格 (USDC per token)"""
+        token_amount = self.size(i)
+        if token_amount > 0:
+            return (Decimal(self.usdc_raw[i]) / Decimal(10 ** USDC_DECIMALS)) / token_amount
+        return Decimal(0)
+
+    def row(self, i: int) -> Dict:
+        """将第 i 笔成交还原为 decode_order_filled 的返回格式"""
+        return {
+            "tx_hash": self.tx_hash[i],
+            "log_index": self.log_index[i],
+            "block_number": self.block_number[i],
+            "maker": self.maker[i],
+            "taker": self.taker[i],
+            "maker_asset_id": str(self.maker_asset_id[i]),
+            "taker_asset_id": str(self.taker_asset_id[i]),
+            "maker_amount": Decimal(self.maker_amount_raw[i]) / Decimal(10 ** USDC_DECIMALS),
+            "taker_amount": Decimal(self.taker_amount_raw[i]) / Decimal(10 ** CT_DECIMALS),
+            "fee": Decimal(self.fee_raw[i]) / Decimal(10 ** USDC_DECIMALS),
+            "side": self.side[i],
+            "price": self.price(i),
+            "size": self.size(i),
+            "token_id": str(self.token_id[i]),
+        }
+
+    def rows(self) -> List[Dict]:
+        """全部成交的行格式"""
+        return [self.row(i) for i in range(len(self))]
+
 
 class TradeDecoder:
     """交易解码器"""
@@ -124,6 +217,85 @@ class TradeDecoder:
             print(f"解码失败: {e}")
             return None
 
+    def decode_many(self, logs: Iterable[Dict]) -> OrderFilledBatch:
+        """
+        批量解码 OrderFilled 事件
+
+        直接从原始 data / topics 缓冲区按 32 字节切片读取 uint256，
+        不经过 hex 往返和通用 ABI 解码；topic0 按 bytes 比较一次完成过滤。
+        同时兼容 web3 返回的 HexBytes 和原始 JSON-RPC 的十六进制字符串。
+
+        Args:
+            logs: 原始日志列表
+
+        Returns:
+            OrderFilledBatch 列式结果
+        """
+        batch = OrderFilledBatch()
+        from_bytes = int.from_bytes
+
+        for log in logs:
+            try:
+                topics = log.get("topics")
+                if not topics or len(topics) < 4:
+                    batch.skipped += 1
+                    continue
+                if _as_bytes(topics[0]) != ORDER_FILLED_TOPIC_BYTES:
+                    batch.skipped += 1
+                    continue
+
+                data = memoryview(_as_bytes(log.get("data", b"")))
+                if len(data) < ORDER_FILLED_DATA_SIZE:
+                    batch.skipped += 1
+                    continue
+
+                maker_asset_id = from_bytes(data[0:32], "big")
+                taker_asset_id = from_bytes(data[32:64], "big")
+                maker_amount_raw = from_bytes(data[64:96], "big")
+                taker_amount_raw = from_bytes(data[96:128], "big")
+                fee_raw = from_bytes(data[128:160], "big")
+
+                # 与 _determine_trade_direction 相同的规则，直接在 int 上判断
+                if maker_asset_id == 0:
+                    side, usdc_raw, token_raw, token_id = "BUY", maker_amount_raw, taker_amount_raw, taker_asset_id
+                elif taker_asset_id == 0:
+                    side, usdc_raw, token_raw, token_id = "SELL", taker_amount_raw, maker_amount_raw, maker_asset_id
+                else:
+                    side, usdc_raw, token_raw, token_id = "BUY", maker_amount_raw, taker_amount_raw, taker_asset_id
+
+                tx_hash = log.get("transactionHash", "")
+                if isinstance(tx_hash, bytes):
+                    tx_hash = tx_hash.hex()
+
+                # 缺少日志位置无法去重，计入 skipped
+                if log.get("logIndex") is None or log.get("blockNumber") is None:
+                    batch.skipped += 1
+                    continue
+                log_index = _as_int(log["logIndex"])
+                block_number = _as_int(log["blockNumber"])
+                maker = self._extract_address(topics[2])
+                taker = self._extract_address(topics[3])
+            except (ValueError, TypeError, AttributeError):
+                batch.skipped += 1
+                continue
+
+            batch.tx_hash.append(tx_hash)
+            batch.log_index.append(log_index)
+            batch.block_number.append(block_number)
+            batch.maker.append(maker)
+            batch.taker.append(taker)
+            batch.maker_asset_id.append(maker_asset_id)
+            batch.taker_asset_id.append(taker_asset_id)
+            batch.maker_amount_raw.append(maker_amount_raw)
+            batch.taker_amount_raw.append(taker_amount_raw)
+            batch.fee_raw.append(fee_raw)
+            batch.side.append(side)
+            batch.token_id.append(token_id)
+            batch.usdc_raw.append(usdc_raw)
+            batch.token_raw.append(token_raw)
+
+        return batch
+
     def _extract_address(self, topic: bytes | str) -> str:
         """从 bytes32 topic 中提取地址"""
         if isinstance(topic, bytes):
@@ -1,28 +1,140 @@
 """市场发现模块 - 从 Gamma API 获取 Polymarket 市场数据"""
+import asyncio
+import hashlib
 import json
+import random
 import httpx
-from typing import List, Dict, Optional
-from datetime import datetime
-from sqlalchemy import select
+from contextlib import aclosing
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from datetime import datetime, timezone
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用标准库 json
+    orjson = None
+
 from ..config import get_settings
 from ..models import Market
+from .registry import TokenRegistry, get_token_registry
+from .gamma_cache import GammaCache
 
 settings = get_settings()
 
+POLITICS_KEYWORDS = ["politics", "political", "election", "government"]
+
+# 同步时会更新的字段（category 只在新增时写入），content_hash 基于这些字段计算
+SYNC_UPDATE_FIELDS = ("condition_id", "yes_token_id", "no_token_id", "question", "active", "end_date")
+
+# Market 每行约 10 列，单条语句远低于 PostgreSQL 的绑定参数上限
+SYNC_CHUNK_SIZE = 1000
+
+
+def market_content_hash(market: Dict) -> str:
+    """同步字段的 MD5 摘要"""
+    payload = json.dumps([market.get(field) for field in SYNC_UPDATE_FIELDS], separators=(",", ":"), default=str)
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+def _loads(content: bytes):
+    """解析 JSON，安装了 orjson 时使用更快的 orjson"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _is_politics(m: Dict) -> bool:
+    """通过 tags 或 category 判断是否是政治类市场"""
+    tags = m.get("tags") or []
+    tag_names = [t.get("label", "").lower() if isinstance(t, dict) else str(t).lower() for t in tags]
+    category = (m.get("category") or "").lower()
+
+    return any(
+        keyword in tag_names or keyword in category
+        for keyword in POLITICS_KEYWORDS
+    )
+
+
+def _parse_market(m: Dict, category: Optional[str] = None) -> Optional[Dict]:
+    """
+    将 Gamma API 的市场转换为 markets 表字段
+
+    Args:
+        m: Gamma API 返回的单个市场
+        category: 固定类别，默认取市场自身的 category
+
+    Returns:
+        市场数据；没有两个 clobTokenIds 时返回 None
+    """
+    # 解析 clobTokenIds (可能是 JSON 字符串或列表)
+    clob_token_ids = m.get("clobTokenIds", "[]")
+    if isinstance(clob_token_ids, str):
+        try:
+            clob_token_ids = json.loads(clob_token_ids)
+        except json.JSONDecodeError:
+            return None
+
+    if not isinstance(clob_token_ids, list) or len(clob_token_ids) < 2:
+        return None
+
+    return {
+        "slug": m.get("slug", ""),
+        "condition_id": m.get("conditionId", ""),
+        "yes_token_id": clob_token_ids[0],
+        "no_token_id": clob_token_ids[1],
+        "category": category or m.get("category") or "Other",
+        "question": m.get("question", ""),
+        "active": m.get("active", True),
+        "end_date": m.get("endDate"),  # ISO 字符串，写库时解析（解析结果需可序列化到缓存）
+    }
+
+
+def parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    """解析 Gamma 的 ISO 时间为 UTC naive datetime，无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
 
 class MarketDiscovery:
     """市场发现服务"""
 
-    def __init__(self):
+    def __init__(self, token_registry: Optional[TokenRegistry] = None, cache_path: Optional[str] = None):
+        """
+        初始化市场发现服务
+
+        Args:
+            token_registry: token -> 市场注册表，默认使用进程内共享实例
+            cache_path: Gamma 响应缓存文件，默认取配置 GAMMA_CACHE_PATH（为空则不缓存）
+        """
         self.base_url = settings.GAMMA_API_URL
         self.client = httpx.AsyncClient(timeout=30.0)
+        self.token_registry = token_registry or get_token_registry()
+
+        cache_path = settings.GAMMA_CACHE_PATH if cache_path is None else cache_path
+        self.cache = GammaCache(cache_path) if cache_path else None
 
     async def close(self):
         """关闭 HTTP 客户端"""
         await self.client.aclose()
 
+    def cached_markets(self) -> List[Dict]:
+        """
+        上次完整抓取保存的市场快照（不发网络请求）
+
+        Returns:
+            市场数据列表，没有缓存时为空
+        """
+        return self.cache.markets() if self.cache else []
+
     async def fetch_politics_markets(self, limit: int = 100) -> List[Dict]:
         """
         获取政治类活跃市场
@@ -33,182 +145,257 @@ class MarketDiscovery:
         Returns:
             市场数据列表
         """
-        # Gamma API 参数
-        params = {
-            "active": "true",
-            "closed": "false",
-            "limit": limit,
-        }
-
         try:
-            response = await self.client.get(
-                f"{self.base_url}/markets",
-                params=params
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            markets = []
-            for m in data:
-                # 筛选政治类市场 (通过 tags 或 category)
-                tags = m.get("tags", [])
-                tag_names = [t.get("label", "").lower() if isinstance(t, dict) else str(t).lower() for t in tags]
-
-                # 检查是否是政治类
-                is_politics = any(
-                    keyword in tag_names or keyword in m.get("category", "").lower()
-                    for keyword in ["politics", "political", "election", "government"]
-                )
-
-                if not is_politics:
-                    continue
-
-                # 解析 clobTokenIds (可能是 JSON 字符串或列表)
-                clob_token_ids_raw = m.get("clobTokenIds", "[]")
-                if isinstance(clob_token_ids_raw, str):
-                    try:
-                        clob_token_ids = json.loads(clob_token_ids_raw)
-                    except json.JSONDecodeError:
-                        clob_token_ids = []
-                else:
-                    clob_token_ids = clob_token_ids_raw
-
-                if not isinstance(clob_token_ids, list) or len(clob_token_ids) < 2:
-                    continue
-
-                markets.append({
-                    "slug": m.get("slug", ""),
-                    "condition_id": m.get("conditionId", ""),
-                    "yes_token_id": clob_token_ids[0],
-                    "no_token_id": clob_token_ids[1],
-                    "category": "Politics",
-                    "question": m.get("question", ""),
-                    "active": m.get("active", True),
-                })
-
-            return markets
-
-        except httpx.HTTPError as e:
+            data = await self._fetch_page(offset=0, limit=limit)
+        except (httpx.HTTPError, ValueError) as e:
             print(f"获取市场数据失败: {e}")
             return []
 
-    async def fetch_all_active_markets(self, limit: int = 200) -> List[Dict]:
+        markets = []
+        for m in data:
+            # 筛选政治类市场 (通过 tags 或 category)
+            if not _is_politics(m):
+                continue
+
+            market = _parse_market(m, category="Politics")
+            if market:
+                markets.append(market)
+
+        return markets
+
+    async def fetch_all_active_markets(self, limit: Optional[int] = None) -> List[Dict]:
         """
         获取所有活跃市场（不限类别，用于 token 匹配）
 
         Args:
-            limit: 获取数量限制
+            limit: 可选的数量上限，默认获取全部分页；指定时按偏移量顺序逐页抓取，
+                返回列表最前面的市场
 
         Returns:
             市场数据列表
         """
+        markets = []
+        # 提前返回时关闭生成器，取消仍在途的分页请求
+        async with aclosing(self.crawl_markets(concurrency=1 if limit is not None else None)) as pages:
+            async for page in pages:
+                markets.extend(page)
+                if limit is not None and len(markets) >= limit:
+                    return markets[:limit]
+        return markets
+
+    async def crawl_markets(
+        self,
+        page_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        changed_only: bool = False,
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        并发分页抓取全部活跃市场，逐页产出解析后的市场
+
+        最多 concurrency 个分页请求同时在途，页面按完成顺序产出，调用方可以
+        边抓取边同步到数据库。遇到不满页即停止调度后续偏移量；分页期间
+        市场列表变化导致的重复 slug 会被去掉。启用缓存时每页发送条件请求，
+        304 直接使用缓存的解析结果，全部分页成功后保存新的快照。
+
+        Args:
+            page_size: 每页数量（默认取配置 GAMMA_PAGE_SIZE）
+            concurrency: 同时在途的请求数（默认取配置 GAMMA_MAX_CONCURRENCY）
+            changed_only: 只产出相对缓存有变化（非 304）的分页
+
+        Yields:
+            一页解析后的市场数据列表
+        """
+        page_size = page_size or settings.GAMMA_PAGE_SIZE
+        concurrency = max(1, concurrency or settings.GAMMA_MAX_CONCURRENCY)
+
+        seen = set()
+        failed = False
+        next_offset = 0
+        end_offset = None  # 第一个不满页的偏移量
+        pending: Dict[asyncio.Task, int] = {}  # 在途请求 -> 偏移量
+
+        try:
+            while True:
+                while len(pending) < concurrency and (end_offset is None or next_offset < end_offset):
+                    task = asyncio.create_task(self._fetch_page_with_retry(next_offset, page_size))
+                    pending[task] = next_offset
+                    next_offset += page_size
+
+                if not pending:
+                    break
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    offset = pending.pop(task)
+                    result = task.result()
+                    if result is None:
+                        failed = True
+                    if result is None or result[0] < page_size:
+                        end_offset = offset if end_offset is None else min(end_offset, offset)
+                    if result is None:
+                        continue
+
+                    _, markets, changed = result
+                    page = []
+                    for market in markets:
+                        if market["slug"] not in seen:
+                            seen.add(market["slug"])
+                            page.append(market)
+                    if page and (changed or not changed_only):
+                        yield page
+
+            # 只在完整抓取后更新快照，避免部分失败时丢掉缓存的分页
+            if self.cache is not None and not failed:
+                self.cache.truncate(end_offset)
+                await self.cache.save()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _request_page(self, offset: int, limit: int, headers: Optional[Dict] = None) -> httpx.Response:
+        """请求一页活跃市场（304 不视为错误）"""
+        # Gamma API 参数
         params = {
             "active": "true",
             "closed": "false",
             "limit": limit,
+            "offset": offset,
         }
 
-        try:
-            response = await self.client.get(
-                f"{self.base_url}/markets",
-                params=params
-            )
+        response = await self.client.get(
+            f"{self.base_url}/markets",
+            params=params,
+            headers=headers,
+        )
+        if response.status_code != 304:
             response.raise_for_status()
-            data = response.json()
-
-            markets = []
-            for m in data:
-                # 解析 clobTokenIds (可能是 JSON 字符串或列表)
-                clob_token_ids_raw = m.get("clobTokenIds", "[]")
-                if isinstance(clob_token_ids_raw, str):
-                    try:
-                        clob_token_ids = json.loads(clob_token_ids_raw)
-                    except json.JSONDecodeError:
-                        clob_token_ids = []
-                else:
-                    clob_token_ids = clob_token_ids_raw
-
-                if not isinstance(clob_token_ids, list) or len(clob_token_ids) < 2:
-                    continue
-
-                markets.append({
-                    "slug": m.get("slug", ""),
-                    "condition_id": m.get("conditionId", ""),
-                    "yes_token_id": clob_token_ids[0],
-                    "no_token_id": clob_token_ids[1],
-                    "category": m.get("category", "Other"),
-                    "question": m.get("question", ""),
-                    "active": m.get("active", True),
-                })
-
-            return markets
-
-        except httpx.HTTPError as e:
-            print(f"获取市场数据失败: {e}")
-            return []
+        return response
+
+    async def _fetch_page(self, offset: int, limit: int) -> List[Dict]:
+        """请求一页活跃市场（原始 JSON）"""
+        response = await self._request_page(offset, limit)
+        return _loads(response.content)
+
+    async def _fetch_page_with_retry(
+        self,
+        offset: int,
+        limit: int,
+        max_retries: int = 3,
+    ) -> Optional[Tuple[int, List[Dict], bool]]:
+        """
+        请求并解析一页（启用缓存时发送条件请求），失败时退避重试
 
-    async def sync_markets_to_db(self, session: AsyncSession, markets: List[Dict]) -> int:
+        Returns:
+            (原始条数, 解析后的市场, 相对缓存是否有变化)，最终失败返回 None
+        """
+        cached = self.cache.get(offset) if self.cache is not None else None
+        if cached and cached.get("limit") != limit:
+            cached = None
+        headers = self.cache.validators(offset) if cached else None
+
+        for attempt in range(max_retries + 1):
+            try:
+                response = await self._request_page(offset, limit, headers=headers)
+                if response.status_code == 304 and cached:
+                    self.cache.hits += 1
+                    return cached["count"], cached["markets"], False
+
+                data = _loads(response.content)
+                break
+            except (httpx.HTTPError, ValueError) as e:
+                if attempt >= max_retries:
+                    print(f"获取市场数据失败 (offset {offset}): {e}")
+                    return None
+                await asyncio.sleep(min(2 ** attempt, 10) * (0.5 + random.random()))
+
+        markets = [market for market in map(_parse_market, data) if market]
+        if self.cache is not None:
+            self.cache.misses += 1
+            self.cache.put(
+                offset,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                limit=limit,
+                count=len(data),
+                markets=markets,
+            )
+        return len(data), markets, True
+
+    async def sync_markets_to_db(
+        self,
+        session: AsyncSession,
+        markets: List[Dict],
+        chunk_size: int = SYNC_CHUNK_SIZE,
+    ) -> Dict[str, int]:
         """
         同步市场数据到数据库
 
+        按 chunk_size 分块，每块一条 INSERT ... ON CONFLICT (slug) DO UPDATE；
+        只有 content_hash 变化的行才会被更新（updated_at 随之变化，
+        TokenRegistry 的增量刷新也只会读到真正变化的市场）。
+
         Args:
             session: 数据库会话
             markets: 市场数据列表
+            chunk_size: 每条语句的最大行数
 
         Returns:
-            新增/更新的市场数量
+            {"inserted": 新增数, "updated": 更新数, "unchanged": 未变化数}
         """
-        count = 0
-
+        # 同一批中重复的 slug 以最后一条为准（同一语句不能两次更新同一行）
+        rows = {}
+        now = datetime.utcnow()
         for market_data in markets:
             slug = market_data.get("slug")
             if not slug:
                 continue
 
-            # 检查是否已存在
-            result = await session.execute(
-                select(Market).where(Market.slug == slug)
-            )
-            existing = result.scalar_one_or_none()
-
-            if existing:
-                # 更新现有记录
-                existing.condition_id = market_data.get("condition_id", existing.condition_id)
-                existing.yes_token_id = market_data.get("yes_token_id", existing.yes_token_id)
-                existing.no_token_id = market_data.get("no_token_id", existing.no_token_id)
-                existing.question = market_data.get("question", existing.question)
-                existing.active = market_data.get("active", existing.active)
-                existing.updated_at = datetime.utcnow()
-            else:
-                # 创建新记录
-                new_market = Market(
-                    slug=slug,
-                    condition_id=market_data.get("condition_id", ""),
-                    yes_token_id=market_data.get("yes_token_id", ""),
-                    no_token_id=market_data.get("no_token_id", ""),
-                    category=market_data.get("category", "Politics"),
-                    question=market_data.get("question", ""),
-                    active=market_data.get("active", True),
-                )
-                session.add(new_market)
-                count += 1
+            row = {
+                "slug": slug,
+                "condition_id": market_data.get("condition_id", ""),
+                "yes_token_id": market_data.get("yes_token_id", ""),
+                "no_token_id": market_data.get("no_token_id", ""),
+                "category": market_data.get("category", "Politics"),
+                "question": market_data.get("question", ""),
+                "active": market_data.get("active", True),
+                "end_date": parse_datetime(market_data.get("end_date")),
+            }
+            row["content_hash"] = market_content_hash(row)
+            row["updated_at"] = now
+            rows[slug] = row
+
+        rows = list(rows.values())
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            stmt = pg_insert(Market).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["slug"],
+                set_={
+                    field: stmt.excluded[field]
+                    for field in SYNC_UPDATE_FIELDS + ("content_hash", "updated_at")
+                },
+                where=Market.content_hash.is_distinct_from(stmt.excluded.content_hash),
+            ).returning(literal_column("xmax = 0").label("inserted"))
+
+            # RETURNING 只返回插入或更新的行；xmax = 0 表示新插入
+            result = await session.execute(stmt)
+            written = 0
+            for (inserted,) in result.all():
+                written += 1
+                counts["inserted" if inserted else "updated"] += 1
+            counts["unchanged"] += len(chunk) - written
 
         await session.commit()
-        return count
+        return counts
 
-    async def get_token_to_market_map(self, session: AsyncSession) -> Dict[str, Dict]:
+    async def get_token_to_market_map(self, session: AsyncSession) -> TokenRegistry:
         """
-        构建 token_id 到市场的映射表
+        获取 token_id 到市场的映射表（共享注册表，增量刷新）
 
         Returns:
-            {token_id: {"slug": ..., "outcome": "YES"/"NO"}}
+            TokenRegistry，可按 int 或字符串 token_id 查询 {"slug": ..., "outcome": "YES"/"NO"}
         """
-        result = await session.execute(select(Market).where(Market.active == True))
-        markets = result.scalars().all()
-
-        token_map = {}
-        for m in markets:
-            token_map[m.yes_token_id] = {"slug": m.slug, "outcome": "YES"}
-            token_map[m.no_token_id] = {"slug": m.slug, "outcome": "NO"}
-
-        return token_map
+        await self.token_registry.refresh(session)
+        return self.token_registry
@@ -1,16 +1,25 @@
 """快速回填模块 - 使用 Polymarket Data API 直接获取交易数据"""
 import asyncio
+import random
+import zlib
 import httpx
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 from decimal import Decimal
 
-from sqlalchemy import select
+from sqlalchemy import String, and_, any_, bindparam, delete, exists, or_, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from ..config import get_settings
 from ..db import AsyncSessionLocal, init_db, close_db
-from ..models import Trade, Market
+from ..models import InsiderAlert, Market, Trade
+from ..ratelimit import TokenBucket
+from .writer import TradeWriter
+from .registry import get_token_registry
+from .cursors import MARKET_JOB_PREFIX, market_job_name, list_cursors, advance_cursor
+from .rpc import RETRY_STATUS_CODES
 
 settings = get_settings()
 
@@ -18,36 +27,112 @@ settings = get_settings()
 DATA_API_URL = "https://data-api.polymarket.com"
 
 
+# Data API 成交的自然键字段（同一交易内的多笔成交据此区分）
+NATURAL_KEY_FIELDS = ("asset", "proxyWallet", "side", "size", "price", "timestamp")
+
+
+def natural_log_index(trade: Dict) -> int:
+    """
+    由 Data API 成交的自然键生成稳定的 log_index
+
+    Data API 不返回链上日志序号，用自然键的 CRC32（截断到 31 位，适配 Integer 列）
+    代替，同一笔成交重复获取时得到相同的值，配合唯一索引 (tx_hash, log_index) 去重。
+
+    Args:
+        trade: Data API 返回的单条成交
+
+    Returns:
+        非负 31 位整数
+    """
+    key = "|".join(str(trade.get(field, "")) for field in NATURAL_KEY_FIELDS)
+    return zlib.crc32(key.encode()) & 0x7FFFFFFF
+
+
+def _stored_elsewhere(row):
+    """
+    该行所在交易已由其他来源写入：链上路径（block_number 非 0，真实日志序号），
+    或自然键去重之前的 Data API 旧数据（block_number = 0 且 log_index = 0）
+    """
+    return or_(row.block_number != 0, row.log_index == 0)
+
+
+async def remove_duplicate_api_trades(session: AsyncSession) -> int:
+    """
+    一次性清理 Data API 写入的重复成交（由调用方提交，之后应全量重建画像）
+
+    删除两类重复行：
+    1. 同一交易已有链上行时的 Data API 行（block_number = 0），链上数据为准；
+    2. 同一交易已有自然键行（log_index 非 0）时的旧 Data API 行（log_index = 0）。
+    引用被删除行的内幕警报改为指向同一交易保留下来的行。
+
+    Returns:
+        删除的行数
+    """
+    def duplicate(row):
+        other = aliased(Trade)
+        return and_(
+            row.block_number == 0,
+            or_(
+                exists().where(other.tx_hash == row.tx_hash, other.block_number != 0),
+                and_(
+                    row.log_index == 0,
+                    exists().where(other.tx_hash == row.tx_hash, other.block_number == 0, other.log_index != 0),
+                ),
+            ),
+        )
+
+    # 保留行：优先链上行，其次自然键行
+    doomed = aliased(Trade)
+    keeper = aliased(Trade)
+    keeper_id = (
+        select(keeper.id)
+        .where(keeper.tx_hash == doomed.tx_hash, or_(keeper.block_number != 0, keeper.log_index != 0))
+        .order_by(keeper.block_number == 0, keeper.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    await session.execute(
+        update(InsiderAlert)
+        .where(InsiderAlert.trade_id == doomed.id, duplicate(doomed))
+        .values(trade_id=keeper_id)
+    )
+
+    result = await session.execute(delete(Trade).where(duplicate(Trade)))
+    return result.rowcount or 0
+
+
 class FastBackfill:
     """快速回填器 - 使用 Polymarket Data API"""
 
-    def __init__(self):
+    def __init__(self, max_rps: Optional[float] = None):
+        """
+        Args:
+            max_rps: Data API 请求预算（次/秒），默认取配置 FAST_BACKFILL_MAX_RPS
+        """
         self.client = httpx.AsyncClient(timeout=30.0)
-        self.token_map: Dict[str, Dict] = {}
+        self.token_map = get_token_registry()  # 与监听器共享的 token -> 市场注册表
+        self.writer = TradeWriter(AsyncSessionLocal)
+        self.rate_limiter = TokenBucket(max_rps or settings.FAST_BACKFILL_MAX_RPS)
+        self.max_retries = settings.FAST_BACKFILL_MAX_RETRIES
+
+        # 统计计数
+        self.requests = 0
+        self.retries = 0
 
     async def close(self):
         await self.client.aclose()
 
     async def refresh_token_map(self):
-        """刷新 token_id -> market 映射"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Market).where(Market.active == True)
-            )
-            markets = result.scalars().all()
-
-            self.token_map = {}
-            for m in markets:
-                self.token_map[m.yes_token_id] = {"slug": m.slug, "outcome": "YES"}
-                self.token_map[m.no_token_id] = {"slug": m.slug, "outcome": "NO"}
-
-            print(f"Loaded {len(self.token_map)} token mappings")
+        """刷新 token_id -> market 映射（增量）"""
+        await self.token_map.refresh()
+        print(f"Loaded {len(self.token_map)} token mappings")
 
     async def fetch_trades(
         self,
         limit: int = 100,
         offset: int = 0,
         market_slug: Optional[str] = None,
+        condition_id: Optional[str] = None,
     ) -> List[Dict]:
         """
         从 Polymarket Data API 获取交易数据
@@ -56,10 +141,27 @@ class FastBackfill:
             limit: 每次获取数量 (max 100)
             offset: 偏移量
             market_slug: 可选，筛选特定市场
+            condition_id: 可选，按市场 condition_id 筛选
 
         Returns:
             交易数据列表
         """
+        try:
+            return await self._get_page(
+                limit=limit, offset=offset, market_slug=market_slug, condition_id=condition_id
+            )
+        except httpx.HTTPError as e:
+            print(f"[WARN] 获取交易失败: {e}")
+            return []
+
+    async def _get_page(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        market_slug: Optional[str] = None,
+        condition_id: Optional[str] = None,
+    ) -> List[Dict]:
+        """获取一页交易，按令牌桶限速；429 / 5xx / 网络错误时退避重试，最终失败抛出 httpx.HTTPError"""
         params = {
             "limit": min(limit, 100),
             "offset": offset,
@@ -67,38 +169,67 @@ class FastBackfill:
 
         if market_slug:
             params["slug"] = market_slug
-
-        try:
-            response = await self.client.get(
-                f"{DATA_API_URL}/trades",
-                params=params
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPError as e:
-            print(f"[WARN] 获取交易失败: {e}")
-            return []
+        if condition_id:
+            params["market"] = condition_id
+
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire()
+            self.requests += 1
+            try:
+                response = await self.client.get(
+                    f"{DATA_API_URL}/trades",
+                    params=params
+                )
+                if response.status_code == 429:
+                    # 被限流时所有获取协程一起退避，优先使用服务端给出的 Retry-After
+                    self.rate_limiter.pause(_retry_after(response) or 2 ** attempt)
+                response.raise_for_status()
+                return response.json()
+            except httpx.HTTPError as e:
+                retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in RETRY_STATUS_CODES
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(min(2 ** attempt, 10) * (0.5 + random.random()))
 
     async def save_trades(self, session: AsyncSession, trades: List[Dict]) -> tuple[int, int]:
         """
         保存交易到数据库
 
+        Data API 不返回日志序号，log_index 由成交的自然键生成（见 natural_log_index），
+        与链上路径的真实日志序号不可比较。因此先用一次 tx_hash = ANY(...) 查询
+        跳过已由链上路径（或自然键之前的旧数据）写入的交易；只出现在 Data API 的交易
+        用一条 INSERT ... ON CONFLICT DO NOTHING 写入，重复获取由唯一索引
+        (tx_hash, log_index) 去重，同一交易中的多笔成交不会互相覆盖。
+
         Returns:
             (saved_count, whale_count)
         """
-        saved = 0
-        whales = 0
+        rows = {}
+
+        page_hashes = list({t.get("transactionHash") for t in trades if t.get("transactionHash")})
+        if not page_hashes:
+            return 0, 0
+        result = await session.execute(
+            select(Trade.tx_hash)
+            .where(
+                Trade.tx_hash == any_(bindparam("page_hashes", page_hashes, type_=ARRAY(String))),
+                _stored_elsewhere(Trade),
+            )
+            .distinct()
+        )
+        stored = {row[0] for row in result.all()}
 
         for t in trades:
             tx_hash = t.get("transactionHash", "")
-            if not tx_hash:
+            if not tx_hash or tx_hash in stored:
                 continue
 
-            # 检查是否已存在
-            existing = await session.execute(
-                select(Trade).where(Trade.tx_hash == tx_hash)
-            )
-            if existing.scalar_one_or_none():
+            # 页内重复的成交只保留一条
+            log_index = natural_log_index(t)
+            if (tx_hash, log_index) in rows:
                 continue
 
             # 解析交易数据
@@ -125,98 +256,286 @@ class FastBackfill:
 
             is_whale = amount_usd >= settings.WHALE_THRESHOLD
 
-            trade = Trade(
-                tx_hash=tx_hash,
-                log_index=0,
-                block_number=0,
-                market_slug=market_info.get("slug", ""),
-                maker=t.get("proxyWallet", ""),
-                taker="",
-                side=side,
-                outcome=market_info.get("outcome", "YES"),
-                price=price,
-                size=size,
-                amount_usd=amount_usd,
-                is_whale=is_whale,
-                timestamp=timestamp,
-            )
-
-            session.add(trade)
-            saved += 1
-            if is_whale:
-                whales += 1
-
+            rows[(tx_hash, log_index)] = {
+                "tx_hash": tx_hash,
+                "log_index": log_index,
+                "block_number": 0,
+                "market_slug": market_info.get("slug", ""),
+                "maker": t.get("proxyWallet", ""),
+                "taker": "",
+                "side": side,
+                "outcome": market_info.get("outcome", "YES"),
+                "price": price,
+                "size": size,
+                "amount_usd": amount_usd,
+                "is_whale": is_whale,
+                "timestamp": timestamp,
+            }
+
+        # 整页一条 INSERT 写入
+        result = await self.writer.insert(session, list(rows.values()))
         await session.commit()
-        return saved, whales
+        return result["inserted"], result["whales"]
 
     async def backfill(
         self,
         total_trades: int = 10000,
         batch_size: int = 100,
-        delay: float = 0.2,
+        fetchers: Optional[int] = None,
     ):
         """
         执行快速回填
 
+        fetchers 个协程按偏移量交错分页获取（第 k 个协程负责第 k, k+K, k+2K... 页），
+        速率由共享令牌桶控制；获取到的页面经有界队列交给单个写入协程批量写库，
+        网络请求与数据库写入重叠进行。
+
         Args:
             total_trades: 要获取的总交易数
-            batch_size: 每批数量
-            delay: 批次间延迟
+            batch_size: 每页数量（最大 100）
+            fetchers: 并发获取协程数（默认取配置 FAST_BACKFILL_FETCHERS）
         """
         await init_db()
         await self.refresh_token_map()
 
+        batch_size = min(batch_size, 100)
+        fetchers = max(1, fetchers or settings.FAST_BACKFILL_FETCHERS)
+
         print(f"[*] 快速回填 (Polymarket Data API)")
         print(f"    目标交易数: {total_trades:,}")
-        print(f"    批次大小: {batch_size}")
+        print(f"    批次大小: {batch_size} | 并发获取: {fetchers} | 请求预算: {self.rate_limiter.rate:g} req/s")
         print()
 
-        total_saved = 0
-        total_whales = 0
-        offset = 0
+        stats = {"fetched": 0, "saved": 0, "whales": 0, "failed_pages": 0}
+        # 第一个返回空页 / 不满页的偏移量，之后的页不再请求
+        self._end_offset = total_trades
+        queue: asyncio.Queue = asyncio.Queue(maxsize=fetchers * 2)
         start_time = datetime.now()
 
-        async with AsyncSessionLocal() as session:
-            while offset < total_trades:
-                trades = await self.fetch_trades(limit=batch_size, offset=offset)
+        writer = asyncio.create_task(self._write_pages(queue, stats, total_trades, start_time))
+        try:
+            await asyncio.gather(*[
+                self._fetch_pages(k, fetchers, batch_size, queue, stats)
+                for k in range(fetchers)
+            ])
+        finally:
+            await queue.put(None)
+            await writer
 
-                if not trades:
-                    print(f"\n[*] 没有更多交易数据")
-                    break
+        if self._end_offset < total_trades:
+            print(f"\n[*] 没有更多交易数据")
 
-                saved, whales = await self.save_trades(session, trades)
-                total_saved += saved
-                total_whales += whales
-                offset += len(trades)
+        elapsed_total = datetime.now() - start_time
+        seconds = max(elapsed_total.total_seconds(), 1e-9)
+        print(f"\n\n[OK] 回填完成!")
+        print(f"    耗时: {elapsed_total}")
+        print(f"    获取交易: {stats['fetched']:,} ({stats['fetched'] / seconds:,.1f}/s)")
+        print(f"    保存交易: {stats['saved']:,}")
+        print(f"    大单交易: {stats['whales']:,}")
+        print(f"    请求: {self.requests:,} | 重试: {self.retries:,} | 失败页: {stats['failed_pages']:,} | "
+              f"限流退避: {self.rate_limiter.pauses} 次")
+
+        await self.close()
+        await close_db()
+
+    async def _fetch_pages(self, k: int, stride: int, batch_size: int, queue: asyncio.Queue, stats: Dict):
+        """第 k 个获取协程：请求偏移量 k*batch_size, (k+stride)*batch_size, ... 的页面"""
+        offset = k * batch_size
+        while offset < self._end_offset:
+            limit = min(batch_size, self._end_offset - offset)
+            try:
+                trades = await self._get_page(limit=limit, offset=offset)
+            except httpx.HTTPError as e:
+                stats["failed_pages"] += 1
+                print(f"\n[WARN] 获取交易失败 (offset {offset}): {e}")
+                offset += stride * batch_size
+                continue
+
+            if len(trades) < limit:
+                self._end_offset = min(self._end_offset, offset + len(trades))
+            if trades:
+                # 队列满时等待写入协程（背压）
+                await queue.put(trades)
+            offset += stride * batch_size
+
+    async def _write_pages(self, queue: asyncio.Queue, stats: Dict, total_trades: int, start_time: datetime):
+        """写入协程：逐页批量写库并打印进度"""
+        async with AsyncSessionLocal() as session:
+            while True:
+                trades = await queue.get()
+                if trades is None:
+                    return
+
+                try:
+                    saved, whales = await self.save_trades(session, trades)
+                except Exception as e:
+                    await session.rollback()
+                    stats["failed_pages"] += 1
+                    print(f"\n[WARN] 保存交易失败: {e}")
+                    continue
+
+                stats["fetched"] += len(trades)
+                stats["saved"] += saved
+                stats["whales"] += whales
 
                 # 进度显示
-                progress = min(offset / total_trades * 100, 100)
+                progress = min(stats["fetched"] / total_trades * 100, 100)
                 elapsed = (datetime.now() - start_time).total_seconds()
-                rate = offset / elapsed if elapsed > 0 else 0
+                rate = stats["fetched"] / elapsed if elapsed > 0 else 0
 
                 print(f"\r    进度: {progress:.1f}% | "
-                      f"已获取: {offset:,} | "
-                      f"已保存: {total_saved:,} | "
-                      f"大单: {total_whales:,} | "
+                      f"已获取: {stats['fetched']:,} | "
+                      f"已保存: {stats['saved']:,} | "
+                      f"大单: {stats['whales']:,} | "
                       f"速率: {rate:.1f}/s   ", end="")
 
-                await asyncio.sleep(delay)
+    async def backfill_markets(self, workers: Optional[int] = None):
+        """
+        按市场回填：只获取 markets 表中活跃市场的成交
+
+        市场由 workers 个协程并发处理，共享令牌桶的请求预算。每个市场记录
+        已提交的最新成交时间戳（ingestion_cursors 中的 market:<condition_id>），
+        再次运行时只获取更新的成交。
+
+        Args:
+            workers: 并发处理的市场数（默认取配置 FAST_BACKFILL_FETCHERS）
+        """
+        await init_db()
+        await self.refresh_token_map()
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Market.slug, Market.condition_id).where(Market.active == True)
+            )
+            markets = result.all()
+            cursors = {
+                c.job: c.last_block
+                for c in await list_cursors(session, MARKET_JOB_PREFIX)
+            }
+
+        workers = max(1, min(workers or settings.FAST_BACKFILL_FETCHERS, len(markets) or 1))
+
+        print(f"[*] 按市场快速回填 (Polymarket Data API)")
+        print(f"    活跃市场: {len(markets):,} | 已有进度: {len(cursors):,}")
+        print(f"    并发市场: {workers} | 请求预算: {self.rate_limiter.rate:g} req/s")
+        print()
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for slug, condition_id in markets:
+            queue.put_nowait((slug, condition_id, cursors.get(market_job_name(condition_id))))
+
+        stats = {"markets": 0, "fetched": 0, "saved": 0, "whales": 0, "failed_markets": 0}
+        start_time = datetime.now()
+
+        await asyncio.gather(*[
+            self._market_worker(queue, stats, len(markets), start_time)
+            for _ in range(workers)
+        ])
 
         elapsed_total = datetime.now() - start_time
         print(f"\n\n[OK] 回填完成!")
         print(f"    耗时: {elapsed_total}")
-        print(f"    获取交易: {offset:,}")
-        print(f"    保存交易: {total_saved:,}")
-        print(f"    大单交易: {total_whales:,}")
+        print(f"    市场: {stats['markets']:,} (失败 {stats['failed_markets']:,})")
+        print(f"    获取交易: {stats['fetched']:,}")
+        print(f"    保存交易: {stats['saved']:,}")
+        print(f"    大单交易: {stats['whales']:,}")
+        print(f"    请求: {self.requests:,} | 重试: {self.retries:,} | 限流退避: {self.rate_limiter.pauses} 次")
 
         await self.close()
         await close_db()
 
+    async def _market_worker(self, queue: asyncio.Queue, stats: Dict, total_markets: int, start_time: datetime):
+        """从队列中取市场逐个回填"""
+        while True:
+            try:
+                slug, condition_id, since = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            try:
+                fetched, saved, whales = await self._backfill_market(condition_id, since)
+                stats["fetched"] += fetched
+                stats["saved"] += saved
+                stats["whales"] += whales
+            except Exception as e:
+                stats["failed_markets"] += 1
+                print(f"\n[WARN] 市场 {slug} 回填失败: {e}")
+            stats["markets"] += 1
+
+            elapsed = (datetime.now() - start_time).total_seconds()
+            rate = stats["fetched"] / elapsed if elapsed > 0 else 0
+            print(f"\r    市场: {stats['markets']:,}/{total_markets:,} | "
+                  f"已获取: {stats['fetched']:,} | "
+                  f"已保存: {stats['saved']:,} | "
+                  f"大单: {stats['whales']:,} | "
+                  f"速率: {rate:.1f}/s   ", end="")
+
+    async def _backfill_market(self, condition_id: str, since: Optional[int], batch_size: int = 100) -> tuple[int, int, int]:
+        """
+        回填单个市场时间戳不早于 since 的成交
+
+        Data API 按时间倒序分页，遇到早于 since 的成交即停止。游标在全部页面
+        写入后才推进，中途失败时下次会重新获取（写入按唯一索引去重）。
+
+        Returns:
+            (fetched, saved, whales)
+        """
+        fetched = saved = whales = 0
+        newest = since
+        offset = 0
+
+        async with AsyncSessionLocal() as session:
+            while True:
+                page = await self._get_page(limit=batch_size, offset=offset, condition_id=condition_id)
+                trades = [
+                    t for t in page
+                    if since is None or _trade_timestamp(t) >= since
+                ]
+                if trades:
+                    page_saved, page_whales = await self.save_trades(session, trades)
+                    fetched += len(trades)
+                    saved += page_saved
+                    whales += page_whales
+                    newest = max(newest or 0, max(_trade_timestamp(t) for t in trades))
+
+                # 不满页或已到达上次的高水位
+                if len(page) < batch_size or len(trades) < len(page):
+                    break
+                offset += len(page)
+
+            if newest is not None and newest != since:
+                await advance_cursor(session, market_job_name(condition_id), last_block=newest)
+                await session.commit()
+
+        return fetched, saved, whales
+
+
+def _trade_timestamp(trade: Dict) -> int:
+    """成交时间戳（Unix 秒），缺失时为 0"""
+    timestamp_val = trade.get("timestamp", 0)
+    return timestamp_val if isinstance(timestamp_val, int) else 0
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """解析 Retry-After 响应头（秒）"""
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
 
-async def run_fast_backfill(total: int = 10000):
+async def run_fast_backfill(
+    total: int = 10000,
+    fetchers: Optional[int] = None,
+    max_rps: Optional[float] = None,
+    by_market: bool = False,
+):
     """运行快速回填 (CLI 入口)"""
-    backfill = FastBackfill()
-    await backfill.backfill(total_trades=total)
+    backfill = FastBackfill(max_rps=max_rps)
+    if by_market:
+        await backfill.backfill_markets(workers=fetchers)
+    else:
+        await backfill.backfill(total_trades=total, fetchers=fetchers)
 
 
 if __name__ == "__main__":
@@ -230,4 +549,4 @@ if __name__ == "__main__":
             pass
 
     print(f"开始快速回填 {total} 条交易...")
-    asyncio.run(run_fast_backfill(total))
+    asyncio.run(run_fast_backfill(total, by_market="--markets" in sys.argv))
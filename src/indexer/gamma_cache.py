@@ -0,0 +1,127 @@
+"""Gamma API 响应缓存 - 按分页保存 ETag / Last-Modified 和解析后的市场，持久化到本地磁盘"""
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+
+class GammaCache:
+    """
+    Gamma 市场分页的条件请求缓存
+
+    每个分页偏移量保存一条记录：
+        {"etag", "last_modified", "limit": 页大小, "count": 原始条数, "markets": 解析后的市场}
+    重新抓取时带上 If-None-Match / If-Modified-Since，服务端返回 304 即直接
+    使用缓存的解析结果。整个快照保存在一个 JSON 文件中，启动时可以直接使用。
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 缓存文件路径
+        """
+        self.path = path
+        self.saved_at: Optional[float] = None
+        self._pages: Dict[int, Dict] = {}
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Gamma cache unreadable, ignoring: {e}")
+            return
+
+        self.saved_at = data.get("saved_at")
+        self._pages = {int(offset): page for offset, page in data.get("pages", {}).items()}
+
+    def __bool__(self) -> bool:
+        return bool(self._pages)
+
+    def get(self, offset: int) -> Optional[Dict]:
+        """读取某个分页的缓存记录"""
+        return self._pages.get(offset)
+
+    def validators(self, offset: int) -> Dict[str, str]:
+        """构造该分页的条件请求头"""
+        page = self._pages.get(offset)
+        if not page:
+            return {}
+
+        headers = {}
+        if page.get("etag"):
+            headers["If-None-Match"] = page["etag"]
+        if page.get("last_modified"):
+            headers["If-Modified-Since"] = page["last_modified"]
+        return headers
+
+    def put(
+        self,
+        offset: int,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        limit: int,
+        count: int,
+        markets: List[Dict],
+    ):
+        """更新某个分页的缓存记录"""
+        self._pages[offset] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "limit": limit,
+            "count": count,
+            "markets": markets,
+        }
+
+    def truncate(self, end_offset: Optional[int]):
+        """删除最后一页（end_offset）之后、列表变短后已不存在的分页"""
+        if end_offset is None:
+            return
+        for offset in [o for o in self._pages if o > end_offset]:
+            del self._pages[offset]
+
+    def markets(self) -> List[Dict]:
+        """缓存快照中的全部市场（按分页顺序）"""
+        markets = []
+        for offset in sorted(self._pages):
+            markets.extend(self._pages[offset]["markets"])
+        return markets
+
+    async def save(self):
+        """原子写入缓存文件（在线程中序列化并写入，不阻塞事件循环）"""
+        self.saved_at = time.time()
+        # 分页记录只整体替换、不原地修改，浅拷贝即可得到一致的快照
+        data = {
+            "saved_at": self.saved_at,
+            "pages": {str(offset): page for offset, page in self._pages.items()},
+        }
+        await asyncio.to_thread(self._write, data)
+
+    def _write(self, data: Dict):
+        """先写临时文件再替换"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> Dict:
+        return {
+            "pages": len(self._pages),
+            "markets": sum(len(p["markets"]) for p in self._pages.values()),
+            "saved_at": self.saved_at,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
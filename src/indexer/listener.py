@@ -1,16 +1,22 @@
 """链上监听模块 - 监听 Polymarket CTF Exchange 的交易事件"""
 import asyncio
+import time
+import aiohttp
+from contextlib import aclosing
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, Optional, Callable
+from typing import Dict, List, Optional, Callable, Tuple
 from web3 import Web3
-from web3.providers import HTTPProvider
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import get_settings
-from ..models import Trade, Market
-from .decoder import TradeDecoder, ORDER_FILLED_TOPIC
+from .decoder import TradeDecoder, OrderFilledBatch, ORDER_FILLED_TOPIC
+from .blocks import BlockTimestampCache, BlockTimestampError
+from .rpc import AsyncRPCClient
+from .cursors import LISTENER_JOB, get_cursor
+from .scheduler import CatchupScheduler, is_range_too_large
+from .subscription import LogSubscription, SubscriptionError
+from .registry import TokenRegistry, get_token_registry
+from .writer import TradeWriter
 
 settings = get_settings()
 
@@ -18,40 +24,42 @@ settings = get_settings()
 class TradeListener:
     """链上交易监听器"""
 
-    def __init__(self, session_factory):
+    def __init__(
+        self,
+        session_factory,
+        rpc: Optional[AsyncRPCClient] = None,
+        block_cache: Optional[BlockTimestampCache] = None,
+        ws_url: Optional[str] = None,
+        token_registry: Optional[TokenRegistry] = None,
+    ):
         """
         初始化监听器
 
         Args:
             session_factory: 异步数据库会话工厂
+            rpc: 异步 RPC 客户端（可与 HistoryBackfill 共享），默认新建
+            block_cache: 区块时间戳缓存（可与 HistoryBackfill 共享），默认新建
+            ws_url: 节点 WebSocket 地址，配置后追上最新区块时切换为推送模式（默认取 POLYGON_WS_URL）
+            token_registry: token -> 市场注册表，默认使用进程内共享实例
         """
-        self.w3 = Web3(HTTPProvider(settings.POLYGON_RPC_URL))
-
-        # 添加 POA middleware 支持 Polygon 链
-        from web3.middleware import geth_poa_middleware
-        self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-
+        self.rpc = rpc or AsyncRPCClient()
         self.decoder = TradeDecoder()
         self.session_factory = session_factory
+        self.block_cache = block_cache or BlockTimestampCache(self.rpc)
+        self.writer = TradeWriter(session_factory)
+        self.scheduler = CatchupScheduler()
+        self.ws_url = ws_url if ws_url is not None else settings.POLYGON_WS_URL
+        self._subscription: Optional[LogSubscription] = None
+        self._ws_retry_at = 0.0
         self.exchange_address = Web3.to_checksum_address(settings.CTF_EXCHANGE_ADDRESS)
         self.whale_threshold = Decimal(str(settings.WHALE_THRESHOLD))
         self.running = False
-        self.token_map: Dict[str, Dict] = {}  # token_id -> {slug, outcome}
+        self.token_map = token_registry or get_token_registry()  # asset_id(int) -> {slug, outcome}
         self.on_whale_callback: Optional[Callable] = None
 
     async def refresh_token_map(self):
-        """刷新 token 到市场的映射"""
-        async with self.session_factory() as session:
-            result = await session.execute(
-                select(Market).where(Market.active == True)
-            )
-            markets = result.scalars().all()
-
-            self.token_map = {}
-            for m in markets:
-                self.token_map[m.yes_token_id] = {"slug": m.slug, "outcome": "YES"}
-                self.token_map[m.no_token_id] = {"slug": m.slug, "outcome": "NO"}
-
+        """刷新 token 到市场的映射（增量）"""
+        await self.token_map.refresh()
         print(f"[OK] Loaded {len(self.token_map)} token mappings")
 
     def set_whale_callback(self, callback: Callable):
@@ -63,71 +71,170 @@ class TradeListener:
         开始监听链上交易
 
         Args:
-            from_block: 起始区块，None 则从最新区块开始
+            from_block: 起始区块，None 则从持久化游标的下一个区块继续（没有游标时从最新区块开始）
             poll_interval: 轮询间隔（秒）
         """
         self.running = True
         await self.refresh_token_map()
 
-        # 追赶模式配置
-        CATCHUP_STEP = 10  # 追赶时每次处理的区块数（减小以避免 413 错误）
-        CATCHUP_DELAY = 0.5  # 追赶时每批之间的延迟（秒）
-        MAX_CATCHUP_PER_CYCLE = 100  # 每个周期最多追赶的区块数
+        # 后台增量刷新，之后由 MarketDiscovery 同步的市场无需重启即可匹配
+        self.token_map.start()
 
         if from_block is None:
-            from_block = self.w3.eth.block_number
+            from_block = await self._resume_block()
 
         current_block = from_block
         print(f"[LISTENER] Starting from block: {current_block}")
 
         while self.running:
             try:
-                latest_block = self.w3.eth.block_number
-                blocks_behind = latest_block - current_block
+                latest_block = await self.rpc.block_number()
+                self.scheduler.update_lag(current_block, latest_block)
 
-                if blocks_behind > 0:
-                    # 限制每个周期的追赶量
-                    target_block = min(current_block + MAX_CATCHUP_PER_CYCLE, latest_block)
+                if current_block > latest_block:
+                    if self.ws_url and time.monotonic() >= self._ws_retry_at:
+                        # 已追上最新区块，切换为推送模式；断线后回到轮询补齐缺口
+                        try:
+                            current_block = await self._run_subscription(current_block)
+                        finally:
+                            self._ws_retry_at = time.monotonic() + settings.WS_RETRY_DELAY
+                        continue
+
+                    # 已追上最新区块，正常轮询
+                    await asyncio.sleep(poll_interval)
+                    continue
+
+                # 按日志密度和响应时间规划窗口，落后较多时多个窗口并发获取
+                windows = self.scheduler.plan(current_block, latest_block)
+                if len(windows) > 1:
+                    print(f"[CATCHUP] Behind {self.scheduler.lag_blocks} blocks "
+                          f"(~{self.scheduler.lag_seconds:.0f}s), fetching {len(windows)} windows "
+                          f"of {self.scheduler.window} blocks")
+
+                fetched = await asyncio.gather(
+                    *[self._fetch_window(start, end) for start, end in windows],
+                    return_exceptions=True,
+                )
 
-                    if blocks_behind > MAX_CATCHUP_PER_CYCLE:
-                        print(f"[CATCHUP] Behind {blocks_behind} blocks, catching up to {target_block}")
+                # 按区块顺序处理，保证游标连续前进
+                for (start, end), logs in zip(windows, fetched):
+                    if isinstance(logs, Exception):
+                        # 范围过大时缩小窗口立即重试；已是最小窗口（或限流等其他错误）时
+                        # 不跳过失败的区块，等待后从同一位置重试
+                        if not (is_range_too_large(logs) and self.scheduler.on_too_large()):
+                            print(f"[WARN] 区块 {start}-{end} 失败: {logs}")
+                            await asyncio.sleep(1)
+                        break
+
+                    # 交易与游标同一事务提交，空窗口也推进游标
+                    result = await self.process_logs(
+                        logs, cursor={"job": LISTENER_JOB, "last_block": end}
+                    )
+                    if logs:
+                        print(f"[TRADES] Block {start}-{end}: {len(logs)} trades, "
+                              f"{result['inserted']} new, {result['skipped']} duplicate")
+
+                    current_block = end + 1
+                    self.scheduler.update_lag(current_block, latest_block)
 
-                    # 分批处理
-                    while current_block <= target_block and self.running:
-                        batch_end = min(current_block + CATCHUP_STEP - 1, target_block)
+            except Exception as e:
+                print(f"[ERROR] Listener error: {e}")
+                await asyncio.sleep(5)  # 出错后等待 5 秒重试
 
-                        try:
-                            logs = self.w3.eth.get_logs({
-                                "address": self.exchange_address,
-                                "topics": [ORDER_FILLED_TOPIC],
-                                "fromBlock": current_block,
-                                "toBlock": batch_end,
-                            })
+    async def _run_subscription(self, next_block: int) -> int:
+        """
+        推送模式：处理 eth_subscribe 推送的 OrderFilled 日志，直到连接断开或监听停止
 
-                            if logs:
-                                print(f"[TRADES] Block {current_block}-{batch_end}: {len(logs)} trades")
+        节点按区块顺序推送，收到区块 N 的日志即说明 N 之前的区块已推送完毕，
+        游标据此推进到 N - 1；订阅建立前产生的区块用 get_logs 补齐。
 
-                            for log in logs:
-                                await self.process_log(log)
+        Args:
+            next_block: 下一个待处理区块
 
-                        except Exception as e:
-                            print(f"[WARN] 区块 {current_block}-{batch_end} 失败: {e}")
+        Returns:
+            断线或出错时的下一个待处理区块（最后提交的区块之后），轮询从这里继续
+        """
+        self._subscription = LogSubscription(self.ws_url, self.exchange_address, [ORDER_FILLED_TOPIC])
+        print("[LISTENER] Subscribed to OrderFilled logs via WebSocket")
 
-                        current_block = batch_end + 1
-                        await asyncio.sleep(CATCHUP_DELAY)
+        gap_filled = False
+        try:
+            # 提前退出时显式关闭生成器，立即断开 WebSocket
+            async with aclosing(self._subscription.logs()) as logs:
+                async for log in logs:
+                    if not self.running:
+                        break
+                    if log.get("removed"):
+                        continue  # 链重组撤销的日志
+
+                    block_number = log.get("blockNumber")
+                    if isinstance(block_number, str):
+                        block_number = int(block_number, 16)
+                    if block_number < next_block:
+                        continue  # 轮询已处理过
+
+                    if not gap_filled and block_number > next_block:
+                        # 补齐订阅建立前的区块
+                        gap_logs = await self._fetch_window(next_block, block_number - 1)
+                        await self.process_logs(gap_logs, cursor={"job": LISTENER_JOB, "last_block": block_number - 1})
+                        next_block = block_number
+                    gap_filled = True
+
+                    await self.process_logs([log], cursor={"job": LISTENER_JOB, "last_block": block_number - 1})
+                    next_block = block_number
+                    self.scheduler.update_lag(next_block, block_number)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, SubscriptionError) as e:
+            print(f"[WARN] WebSocket subscription error: {e}")
+        except Exception as e:
+            # 写入 / 补齐失败：返回最后提交的位置，由轮询从这里重试
+            print(f"[ERROR] WebSocket log processing failed: {e}")
+        finally:
+            self._subscription = None
+
+        if self.running:
+            print("[LISTENER] WebSocket subscription dropped, falling back to polling")
+        return next_block
+
+    async def _fetch_window(self, from_block: int, to_block: int) -> List[Dict]:
+        """获取一个窗口的日志，并把响应规模和耗时反馈给调度器"""
+        started = time.monotonic()
+        logs = await self.rpc.get_logs({
+            "address": self.exchange_address,
+            "topics": [ORDER_FILLED_TOPIC],
+            "fromBlock": from_block,
+            "toBlock": to_block,
+        })
+        self.scheduler.on_response(to_block - from_block + 1, len(logs), time.monotonic() - started)
+        return logs
+
+    def lag(self) -> Dict:
+        """落后指标：lag_blocks（区块数）与 lag_seconds（秒），以及当前窗口参数"""
+        return self.scheduler.stats()
+
+    async def _resume_block(self) -> int:
+        """从持久化游标确定起始区块"""
+        async with self.session_factory() as session:
+            cursor = await get_cursor(session, LISTENER_JOB)
 
-                # 已追上最新区块，正常轮询
-                await asyncio.sleep(poll_interval)
+        if cursor is not None:
+            print(f"[LISTENER] Resuming after committed block {cursor.last_block}")
+            return cursor.last_block + 1
 
-            except Exception as e:
-                print(f"[ERROR] Listener error: {e}")
-                await asyncio.sleep(5)  # 出错后等待 5 秒重试
+        return await self.rpc.block_number()
 
     async def stop(self):
         """停止监听"""
         self.running = False
+        if self._subscription:
+            await self._subscription.close()
         print("[LISTENER] Stopped")
 
+    async def close(self):
+        """释放 RPC 连接池，停止注册表后台刷新"""
+        self.token_map.stop()
+        await self.rpc.close()
+
     async def process_log(self, log: Dict):
         """
         处理单条日志
@@ -135,117 +242,120 @@ class TradeListener:
         Args:
             log: 原始日志数据
         """
-        # 解码交易
-        trade_data = self.decoder.decode_order_filled(log)
-        if not trade_data:
-            return
+        await self.process_logs([log])
+
+    async def process_logs(self, logs: List[Dict], cursor: Optional[Dict] = None) -> Dict[str, int]:
+        """
+        处理一个 get_logs 窗口内的全部日志（解码 → 匹配 → 补充时间戳 → 写入）
 
-        token_id = trade_data.get("token_id", "")
+        批量解码后只为匹配到市场的成交获取区块时间戳，窗口内
+        缺失的区块头通过一次 batch 请求取回，整个窗口一条 INSERT 写入。
+
+        Args:
+            logs: 原始日志列表
+            cursor: 可选的采集游标，与本窗口的交易在同一事务中推进
 
-        # 匹配市场
-        market_info = self.token_map.get(token_id)
-        if not market_info:
-            # 未知 token，可能不是我们关注的市场
-            return
+        Returns:
+            {"matched": 匹配到市场的成交数, "inserted": 新写入数, "skipped": 重复跳过数, "whales": 新写入大单数}
+        """
+        batch = self.decoder.decode_many(logs)
+        matched = self.match(batch)
+        rows = await self.enrich(batch, matched)
+        return await self.write(rows, cursor=cursor)
 
-        market_slug = market_info["slug"]
-        outcome = market_info["outcome"]
+    def match(self, batch: OrderFilledBatch) -> List[Tuple[int, Dict]]:
+        """
+        匹配市场
 
-        # 计算 USD 金额
-        price = trade_data["price"]
-        size = trade_data["size"]
-        amount_usd = price * size
+        Returns:
+            [(batch 下标, {"slug", "outcome"})]，未知 token（不是我们关注的市场）被丢弃
+        """
+        matched = []
+        for i, token_id in enumerate(batch.token_id):
+            market_info = self.token_map.get(token_id)
+            if market_info:
+                matched.append((i, market_info))
+        return matched
+
+    async def enrich(self, batch: OrderFilledBatch, matched: List[Tuple[int, Dict]]) -> List[Dict]:
+        """
+        补充区块时间戳与金额，生成交易行
 
-        # 判断是否是大单
-        is_whale = amount_usd >= self.whale_threshold
+        Returns:
+            交易行列表
 
-        # 获取区块时间戳
-        try:
-            block = self.w3.eth.get_block(trade_data["block_number"])
-            timestamp = datetime.utcfromtimestamp(block["timestamp"])
-        except Exception:
-            timestamp = datetime.utcnow()
-
-        # 存入数据库
-        await self._save_trade(
-            tx_hash=trade_data["tx_hash"],
-            log_index=trade_data["log_index"],
-            block_number=trade_data["block_number"],
-            market_slug=market_slug,
-            maker=trade_data["maker"],
-            taker=trade_data["taker"],
-            side=trade_data["side"],
-            outcome=outcome,
-            price=price,
-            size=size,
-            amount_usd=amount_usd,
-            is_whale=is_whale,
-            timestamp=timestamp,
+        Raises:
+            BlockTimestampError: 重试后仍缺少区块时间戳（整个窗口失败，游标不前进，稍后重新获取）
+        """
+        if not matched:
+            return []
+
+        # 获取区块时间戳（每个区块最多一次 RPC）
+        timestamps = await self.block_cache.get_many(
+            batch.block_number[i] for i, _ in matched
         )
+        missing = {batch.block_number[i] for i, _ in matched} - timestamps.keys()
+        if missing:
+            raise BlockTimestampError(f"missing timestamps for {len(missing)} blocks (e.g. {min(missing)})")
+
+        rows = []
+        for i, market_info in matched:
+            block_number = batch.block_number[i]
+
+            # 计算 USD 金额
+            price = batch.price(i)
+            size = batch.size(i)
+            amount_usd = price * size
+
+            rows.append({
+                "tx_hash": batch.tx_hash[i],
+                "log_index": batch.log_index[i],
+                "block_number": block_number,
+                "market_slug": market_info["slug"],
+                "maker": batch.maker[i],
+                "taker": batch.taker[i],
+                "side": batch.side[i],
+                "outcome": market_info["outcome"],
+                "price": price,
+                "size": size,
+                "amount_usd": amount_usd,
+                # 判断是否是大单
+                "is_whale": amount_usd >= self.whale_threshold,
+                "timestamp": datetime.utcfromtimestamp(timestamps[block_number]),
+            })
+
+        return rows
+
+    async def write(self, rows: List[Dict], cursor: Optional[Dict] = None) -> Dict[str, int]:
+        """
+        写入交易行（重复的 (tx_hash, log_index) 由唯一索引跳过）并发出大单警报
+
+        Returns:
+            同 process_logs
+        """
+        result = await self.writer.write(rows, cursor=cursor)
+        result["matched"] = len(rows)
 
         # 大单警报
-        if is_whale:
-            print(f"[WHALE ALERT] {market_slug} [{outcome}]: ${amount_usd:.2f} USD ({trade_data['side']})")
+        for row in rows:
+            if not row["is_whale"]:
+                continue
+
+            print(f"[WHALE ALERT] {row['market_slug']} [{row['outcome']}]: "
+                  f"${row['amount_usd']:.2f} USD ({row['side']})")
 
             if self.on_whale_callback:
                 await self.on_whale_callback({
-                    "tx_hash": trade_data["tx_hash"],
-                    "market_slug": market_slug,
-                    "outcome": outcome,
-                    "side": trade_data["side"],
-                    "amount_usd": float(amount_usd),
-                    "maker": trade_data["maker"],
-                    "timestamp": timestamp.isoformat(),
+                    "tx_hash": row["tx_hash"],
+                    "market_slug": row["market_slug"],
+                    "outcome": row["outcome"],
+                    "side": row["side"],
+                    "amount_usd": float(row["amount_usd"]),
+                    "maker": row["maker"],
+                    "timestamp": row["timestamp"].isoformat(),
                 })
 
-    async def _save_trade(
-        self,
-        tx_hash: str,
-        log_index: int,
-        block_number: int,
-        market_slug: str,
-        maker: str,
-        taker: str,
-        side: str,
-        outcome: str,
-        price: Decimal,
-        size: Decimal,
-        amount_usd: Decimal,
-        is_whale: bool,
-        timestamp: datetime,
-    ):
-        """保存交易到数据库"""
-        async with self.session_factory() as session:
-            # 检查是否已存在（去重）
-            result = await session.execute(
-                select(Trade).where(
-                    Trade.tx_hash == tx_hash,
-                    Trade.log_index == log_index
-                )
-            )
-            existing = result.scalar_one_or_none()
-
-            if existing:
-                return  # 已存在，跳过
-
-            trade = Trade(
-                tx_hash=tx_hash,
-                log_index=log_index,
-                block_number=block_number,
-                market_slug=market_slug,
-                maker=maker,
-                taker=taker,
-                side=side,
-                outcome=outcome,
-                price=price,
-                size=size,
-                amount_usd=amount_usd,
-                is_whale=is_whale,
-                timestamp=timestamp,
-            )
-
-            session.add(trade)
-            await session.commit()
+        return result
 
 
 async def run_listener():
@@ -262,3 +372,5 @@ async def run_listener():
         await listener.start()
     except KeyboardInterrupt:
         await listener.stop()
+    finally:
+        await listener.close()
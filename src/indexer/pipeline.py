@@ -0,0 +1,194 @@
+"""回填流水线 - 获取 → 解码 → 匹配 → 补充时间戳 → 写入
+
+每个阶段由一个消费协程处理，阶段之间用有界 asyncio 队列连接：
+RPC 获取与数据库写入可以重叠进行，队列满时上游自动等待（背压）。
+每个阶段只有一个消费者，同一分片的窗口按提交顺序到达写入阶段，
+因此分片游标总是按顺序推进。
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Set
+
+from .blocks import BlockTimestampError
+from .decoder import OrderFilledBatch
+from .listener import TradeListener
+
+# 阶段之间队列的默认容量（窗口数）
+DEFAULT_QUEUE_SIZE = 8
+
+STAGES = ("fetch", "decode", "match", "enrich", "write")
+
+_DONE = object()
+
+
+class PipelineStage:
+    """单个阶段的吞吐与错误计数"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.windows = 0
+        self.items = 0
+        self.seconds = 0.0
+        self.errors: Dict[str, int] = {}
+
+    def record(self, items: int, seconds: float):
+        self.windows += 1
+        self.items += items
+        self.seconds += seconds
+
+    def error(self, category: str, count: int = 1):
+        if count:
+            self.errors[category] = self.errors.get(category, 0) + count
+
+    def stats(self) -> Dict:
+        return {
+            "windows": self.windows,
+            "items": self.items,
+            "seconds": round(self.seconds, 3),
+            "items_per_sec": round(self.items / self.seconds, 1) if self.seconds > 0 else None,
+            "errors": dict(self.errors),
+        }
+
+
+class WindowItem:
+    """在阶段之间传递的一个区块窗口"""
+
+    __slots__ = ("stats", "start", "end", "logs", "batch", "matched", "rows")
+
+    def __init__(self, stats: Dict, start: int, end: int, logs: List[Dict]):
+        self.stats = stats
+        self.start = start
+        self.end = end
+        self.logs = logs
+        self.batch: Optional[OrderFilledBatch] = None
+        self.matched: List = []
+        self.rows: List[Dict] = []
+
+    @property
+    def job(self) -> str:
+        return self.stats["job"]
+
+
+class BackfillPipeline:
+    """回填流水线（fetch 阶段由调用方通过 submit 提交窗口）"""
+
+    def __init__(self, listener: TradeListener, queue_size: int = DEFAULT_QUEUE_SIZE):
+        """
+        Args:
+            listener: 提供 match / enrich / write 阶段实现的监听器
+            queue_size: 每个阶段输入队列的容量
+        """
+        self.listener = listener
+        self.decoder = listener.decoder
+        self.stages = {name: PipelineStage(name) for name in STAGES}
+        self.failed_jobs: Set[str] = set()
+
+        self._queues = {name: asyncio.Queue(maxsize=queue_size) for name in STAGES[1:]}
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """启动各阶段的消费协程"""
+        handlers = [
+            ("decode", self._decode, "match"),
+            ("match", self._match, "enrich"),
+            ("enrich", self._enrich, "write"),
+            ("write", self._write, None),
+        ]
+        self._tasks = [
+            asyncio.create_task(self._consume(name, handler, next_stage))
+            for name, handler, next_stage in handlers
+        ]
+
+    async def submit(self, item: WindowItem):
+        """提交一个已获取的窗口（队列满时等待）"""
+        await self._queues["decode"].put(item)
+
+    async def join(self):
+        """所有窗口提交完毕后调用，等待流水线排空"""
+        await self._queues["decode"].put(_DONE)
+        await asyncio.gather(*self._tasks)
+
+    async def close(self):
+        """取消并等待各阶段的消费协程（异常退出时调用，正常排空后为空操作）"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def is_failed(self, job: str) -> bool:
+        return job in self.failed_jobs
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+    async def _consume(self, name: str, handler, next_stage: Optional[str]):
+        queue = self._queues[name]
+        stage = self.stages[name]
+
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                if next_stage:
+                    await self._queues[next_stage].put(_DONE)
+                return
+
+            # 同一分片前面的窗口已失败：丢弃，游标不越过失败的窗口
+            if item.job in self.failed_jobs:
+                continue
+
+            started = time.perf_counter()
+            try:
+                count = await handler(item)
+            except Exception as e:
+                stage.error(_error_category(name, e))
+                self._fail(item, f"{name} failed: {e}")
+                continue
+            stage.record(count, time.perf_counter() - started)
+
+            if next_stage:
+                await self._queues[next_stage].put(item)
+
+    def _fail(self, item: WindowItem, reason: str):
+        stats = item.stats
+        self.failed_jobs.add(item.job)
+        stats["errors"] += 1
+        stats["failed_blocks"] += stats["end"] - item.start + 1
+        print(f"\n    [WARN] Block {item.start} - {item.end} {reason}, stopping worker #{stats['worker']}")
+
+    async def _decode(self, item: WindowItem) -> int:
+        item.batch = self.decoder.decode_many(item.logs)
+        self.stages["decode"].error("not_order_filled", item.batch.skipped)
+        item.logs = []
+        return len(item.batch) + item.batch.skipped
+
+    async def _match(self, item: WindowItem) -> int:
+        item.matched = self.listener.match(item.batch)
+        self.stages["match"].error("unmatched", len(item.batch) - len(item.matched))
+        return len(item.batch)
+
+    async def _enrich(self, item: WindowItem) -> int:
+        item.rows = await self.listener.enrich(item.batch, item.matched)
+        return len(item.matched)
+
+    async def _write(self, item: WindowItem) -> int:
+        written = await self.listener.write(
+            item.rows, cursor={"job": item.job, "last_block": item.end}
+        )
+        stats = item.stats
+        stats["inserted"] += written["inserted"]
+        stats["skipped"] += written["skipped"]
+        stats["whales"] += written["whales"]
+        stats["logs"] += len(item.batch)
+        stats["blocks"] += item.end - item.start + 1
+        stats["current"] = item.end + 1
+        return len(item.rows)
+
+
+def _error_category(stage: str, error: Exception) -> str:
+    """阶段异常的错误分类"""
+    if isinstance(error, BlockTimestampError):
+        return "timestamp_missing"
+    if stage == "enrich":
+        return "rpc_error"
+    if stage == "write":
+        return "db_error"
+    return f"{stage}_error"
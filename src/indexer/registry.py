@@ -0,0 +1,185 @@
+"""Token 注册表模块 - 以原生 int asset id 为键的共享 token -> 市场映射，后台增量刷新"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Union
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..db import AsyncSessionLocal
+from ..models import Market
+
+settings = get_settings()
+
+
+class TokenRegistry:
+    """
+    Token 注册表
+
+    监听器、FastBackfill 和 MarketDiscovery 共享同一份映射。首次刷新全量加载，
+    之后只读取 updated_at 不早于水位线的市场，后台定期执行，监听不中断。
+
+    updated_at 由写入方的应用时钟生成，事务可能晚于该时间才提交；因此每次
+    增量刷新都回看水位线之前 overlap 秒，重复读取的市场重新应用即可（幂等）。
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        refresh_interval: Optional[float] = None,
+        overlap: Optional[float] = None,
+    ):
+        """
+        初始化注册表
+
+        Args:
+            session_factory: 异步数据库会话工厂
+            refresh_interval: 后台增量刷新间隔（秒）
+            overlap: 增量刷新回看水位线之前的秒数（默认取配置 TOKEN_REGISTRY_WATERMARK_OVERLAP）
+        """
+        self.session_factory = session_factory
+        self.refresh_interval = refresh_interval or settings.TOKEN_REGISTRY_REFRESH_INTERVAL
+        self.overlap = timedelta(
+            seconds=settings.TOKEN_REGISTRY_WATERMARK_OVERLAP if overlap is None else overlap
+        )
+        self._tokens: Dict[int, Dict] = {}  # asset_id -> {slug, outcome}
+        self._market_tokens: Dict[str, Tuple[int, ...]] = {}  # slug -> 该市场的 asset_id
+        self.watermark: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+        # 统计计数
+        self.lookups = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.last_refresh_duration = 0.0
+        self.last_refresh_changes = 0
+
+    @staticmethod
+    def _key(token_id: Union[int, str]) -> Optional[int]:
+        if isinstance(token_id, int):
+            return token_id
+        try:
+            return int(token_id)
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, token_id: Union[int, str], default: Optional[Dict] = None) -> Optional[Dict]:
+        """按 asset id（int 或十进制字符串）查找市场，统计未命中率"""
+        self.lookups += 1
+        market_info = self._tokens.get(self._key(token_id))
+        if market_info is None:
+            self.misses += 1
+            return default
+        return market_info
+
+    def __contains__(self, token_id: Union[int, str]) -> bool:
+        return self._key(token_id) in self._tokens
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def _apply(self, market: Market) -> bool:
+        """用一条市场记录更新映射，返回该市场的 token 是否有变化"""
+        previous = self._market_tokens.pop(market.slug, ())
+        for token_id in previous:
+            self._tokens.pop(token_id, None)
+
+        if not market.active:
+            return bool(previous)
+
+        yes_id = self._key(market.yes_token_id)
+        no_id = self._key(market.no_token_id)
+        tokens = []
+        if yes_id is not None:
+            self._tokens[yes_id] = {"slug": market.slug, "outcome": "YES"}
+            tokens.append(yes_id)
+        if no_id is not None:
+            self._tokens[no_id] = {"slug": market.slug, "outcome": "NO"}
+            tokens.append(no_id)
+        self._market_tokens[market.slug] = tuple(tokens)
+        return self._market_tokens[market.slug] != previous
+
+    async def refresh(self, session: Optional[AsyncSession] = None) -> int:
+        """
+        增量刷新
+
+        Args:
+            session: 可选的数据库会话，默认新建
+
+        Returns:
+            本次 token 映射有变化的市场数（回看窗口内重复读取的未变化市场不计）
+        """
+        async with self._lock:
+            started = time.perf_counter()
+
+            query = select(Market)
+            if self.watermark is None:
+                query = query.where(Market.active == True)
+            else:
+                # 回看 overlap：updated_at 早于水位线、但在上次刷新之后才提交的市场
+                query = query.where(Market.updated_at >= self.watermark - self.overlap)
+
+            if session is None:
+                async with self.session_factory() as own_session:
+                    markets = (await own_session.execute(query)).scalars().all()
+            else:
+                markets = (await session.execute(query)).scalars().all()
+
+            changed = 0
+            for market in markets:
+                changed += self._apply(market)
+                if market.updated_at and (self.watermark is None or market.updated_at > self.watermark):
+                    self.watermark = market.updated_at
+
+            if self.watermark is None:
+                self.watermark = datetime.utcnow()
+
+            self.refreshes += 1
+            self.last_refresh_changes = changed
+            self.last_refresh_duration = time.perf_counter() - started
+            return changed
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                changed = await self.refresh()
+                if changed:
+                    print(f"[REGISTRY] Refreshed {changed} markets, {len(self)} tokens "
+                          f"({self.last_refresh_duration * 1000:.0f} ms)")
+            except Exception as e:
+                print(f"[WARN] Token registry refresh failed: {e}")
+
+    def start(self):
+        """启动后台增量刷新（重复调用无副作用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """停止后台刷新"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict:
+        """注册表指标"""
+        return {
+            "size": len(self._tokens),
+            "markets": len(self._market_tokens),
+            "refreshes": self.refreshes,
+            "last_refresh_ms": round(self.last_refresh_duration * 1000, 1),
+            "last_refresh_changes": self.last_refresh_changes,
+            "lookups": self.lookups,
+            "misses": self.misses,
+            "miss_rate": round(self.misses / self.lookups, 4) if self.lookups else 0.0,
+        }
+
+
+@lru_cache()
+def get_token_registry() -> TokenRegistry:
+    """获取进程内共享的注册表单例"""
+    return TokenRegistry(AsyncSessionLocal)
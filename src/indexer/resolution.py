@@ -0,0 +1,250 @@
+"""市场结算追踪模块 - 轮询未结算市场的结算结果，只重算受影响交易者的画像"""
+import asyncio
+import json
+import httpx
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import Market, Trade
+from ..profiler.analyzer import apply_resolution_deltas
+
+settings = get_settings()
+
+# Gamma 按 condition_id 批量查询时每个请求的市场数
+GAMMA_LOOKUP_CHUNK = 50
+
+# 结算价格阈值：某个 outcome 价格达到该值视为胜出
+RESOLVED_PRICE = 0.99
+
+
+def parse_resolution(m: Dict) -> Optional[str]:
+    """
+    从 Gamma 市场数据解析结算结果
+
+    Args:
+        m: Gamma API 返回的单个市场
+
+    Returns:
+        'YES' / 'NO'，未关闭或没有明确结果（如 50/50 作废）时返回 None
+    """
+    if not m.get("closed"):
+        return None
+
+    prices = m.get("outcomePrices") or "[]"
+    if isinstance(prices, str):
+        try:
+            prices = json.loads(prices)
+        except json.JSONDecodeError:
+            return None
+
+    try:
+        prices = [float(p) for p in prices]
+    except (TypeError, ValueError):
+        return None
+
+    if len(prices) < 2:
+        return None
+    if prices[0] >= RESOLVED_PRICE:
+        return "YES"
+    if prices[1] >= RESOLVED_PRICE:
+        return "NO"
+    return None
+
+
+class ResolutionTracker:
+    """
+    市场结算追踪器
+
+    每轮只查询已过预定结束时间、尚未结算的市场（按 end_date 排序，分批轮转），
+    批量写入结算结果，并在同一事务中把这些市场上的胜负作为增量计入交易者画像；
+    受影响的地址交给可选的 on_resolved 回调。
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        on_resolved: Optional[Callable[[Dict[str, str], Set[str]], Awaitable]] = None,
+        batch_size: Optional[int] = None,
+    ):
+        """
+        初始化追踪器
+
+        Args:
+            session_factory: 异步数据库会话工厂
+            on_resolved: 可选回调 (新结算市场 {slug: outcome}, 受影响的 maker 地址集合)
+            batch_size: 每轮最多检查的市场数（默认取配置 RESOLUTION_BATCH_SIZE）
+        """
+        self.session_factory = session_factory
+        self.base_url = settings.GAMMA_API_URL
+        self.client = httpx.AsyncClient(timeout=30.0)
+        self.batch_size = batch_size or settings.RESOLUTION_BATCH_SIZE
+        self.on_resolved = on_resolved
+        self.running = False
+
+        # 分批轮转的偏移量（长期未结算的市场不会一直占满批次）
+        self._offset = 0
+
+        # 统计计数
+        self.checks = 0
+        self.markets_checked = 0
+        self.markets_resolved = 0
+        self.makers_affected = 0
+        self.last_check_at: Optional[datetime] = None
+
+    async def close(self):
+        """关闭 HTTP 客户端"""
+        await self.client.aclose()
+
+    async def run(self, poll_interval: Optional[float] = None):
+        """
+        持续轮询
+
+        Args:
+            poll_interval: 轮询间隔（秒），默认取配置 RESOLUTION_POLL_INTERVAL
+        """
+        poll_interval = poll_interval or settings.RESOLUTION_POLL_INTERVAL
+        self.running = True
+
+        while self.running:
+            try:
+                await self.check_once()
+            except Exception as e:
+                print(f"[RESOLUTION] Check failed: {e}")
+            await asyncio.sleep(poll_interval)
+
+    def stop(self):
+        """停止轮询"""
+        self.running = False
+
+    async def check_once(self) -> Dict:
+        """
+        检查一批未结算市场
+
+        Returns:
+            {"checked": 检查的市场数, "resolved": {slug: outcome}, "makers": 受影响的地址集合}
+        """
+        async with self.session_factory() as session:
+            markets = await self._load_open_markets(session)
+            if not markets:
+                self._offset = 0
+                return {"checked": 0, "resolved": {}, "makers": set()}
+
+            outcomes = await self._fetch_resolutions([m.condition_id for m in markets])
+
+            found: Dict[str, str] = {}
+            for market in markets:
+                outcome = outcomes.get(market.condition_id)
+                if outcome:
+                    found[market.slug] = outcome
+
+            # 条件更新：只有本事务把市场从未结算改为已结算时才返回 slug，
+            # 多个追踪器同时运行时胜负增量也只计一次。先按 slug 顺序加锁，
+            # 与 apply_trade_deltas 的共享锁顺序一致，避免死锁
+            resolved = {}
+            now = datetime.utcnow()
+            if found:
+                await session.execute(
+                    select(Market.id)
+                    .where(Market.slug.in_(list(found)))
+                    .order_by(Market.slug)
+                    .with_for_update()
+                )
+            for outcome in sorted(set(found.values())):
+                result = await session.execute(
+                    update(Market)
+                    .where(
+                        Market.slug.in_([slug for slug, o in found.items() if o == outcome]),
+                        Market.resolved.isnot(True),
+                    )
+                    .values(resolved=True, resolution_outcome=outcome, updated_at=now)
+                    .returning(Market.slug)
+                )
+                resolved.update({row[0]: outcome for row in result.all()})
+
+            makers: Set[str] = set()
+            if resolved:
+                # 胜负增量与结算结果同一事务提交
+                await apply_resolution_deltas(session, list(resolved))
+                result = await session.execute(
+                    select(Trade.maker).where(Trade.market_slug.in_(list(resolved))).distinct()
+                )
+                makers = {row[0] for row in result.all()}
+                await session.commit()
+
+        # 已结算的市场退出候选集，偏移量只跳过仍未结算的部分
+        if len(markets) < self.batch_size:
+            self._offset = 0
+        else:
+            self._offset += len(markets) - len(found)
+
+        self.checks += 1
+        self.markets_checked += len(markets)
+        self.markets_resolved += len(resolved)
+        self.makers_affected += len(makers)
+        self.last_check_at = datetime.utcnow()
+
+        if resolved:
+            print(f"[RESOLUTION] {len(resolved)} markets resolved, {len(makers)} trader profiles updated")
+            if self.on_resolved:
+                await self.on_resolved(resolved, makers)
+
+        return {"checked": len(markets), "resolved": resolved, "makers": makers}
+
+    async def _load_open_markets(self, session: AsyncSession) -> List[Market]:
+        """读取已过结束时间（或结束时间未知）且未结算的市场，按 end_date 排序"""
+        result = await session.execute(
+            select(Market)
+            .where(
+                Market.resolved.isnot(True),
+                Market.condition_id != "",
+                or_(Market.end_date.is_(None), Market.end_date <= datetime.utcnow()),
+            )
+            .order_by(Market.end_date.asc().nulls_last(), Market.id)
+            .offset(self._offset)
+            .limit(self.batch_size)
+        )
+        return list(result.scalars().all())
+
+    async def _fetch_resolutions(self, condition_ids: List[str]) -> Dict[str, str]:
+        """按 condition_id 批量查询 Gamma，返回 {condition_id: outcome}"""
+        semaphore = asyncio.Semaphore(settings.GAMMA_MAX_CONCURRENCY)
+
+        async def fetch_chunk(chunk: List[str]) -> List[Dict]:
+            async with semaphore:
+                try:
+                    response = await self.client.get(
+                        f"{self.base_url}/markets",
+                        params={"condition_ids": chunk, "limit": len(chunk)},
+                    )
+                    response.raise_for_status()
+                    return response.json()
+                except (httpx.HTTPError, ValueError) as e:
+                    print(f"[RESOLUTION] Gamma lookup failed: {e}")
+                    return []
+
+        pages = await asyncio.gather(*[
+            fetch_chunk(condition_ids[i:i + GAMMA_LOOKUP_CHUNK])
+            for i in range(0, len(condition_ids), GAMMA_LOOKUP_CHUNK)
+        ])
+
+        outcomes = {}
+        for page in pages:
+            for m in page:
+                outcome = parse_resolution(m)
+                if outcome and m.get("conditionId"):
+                    outcomes[m["conditionId"]] = outcome
+        return outcomes
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "checks": self.checks,
+            "markets_checked": self.markets_checked,
+            "markets_resolved": self.markets_resolved,
+            "makers_affected": self.makers_affected,
+            "last_check_at": self.last_check_at.isoformat() if self.last_check_at else None,
+        }
@@ -0,0 +1,203 @@
+"""异步 RPC 模块 - 基于连接池的非阻塞 Polygon JSON-RPC 客户端"""
+import asyncio
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from ..config import get_settings
+from ..ratelimit import TokenBucket
+
+settings = get_settings()
+
+# 可重试的 HTTP 状态码（限流 / 网关错误）
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RPCError(Exception):
+    """JSON-RPC 调用失败"""
+
+    def __init__(self, message: str, code: Optional[int] = None, status: Optional[int] = None):
+        super().__init__(message)
+        self.code = code  # JSON-RPC error.code
+        self.status = status  # HTTP 状态码
+
+
+class AsyncRPCClient:
+    """
+    异步 JSON-RPC 客户端
+
+    所有调用共享一个 keep-alive 连接池，不会阻塞 FastAPI 事件循环；
+    每次调用带超时，限流和网络错误按指数退避重试，并用信号量限制并发。
+    """
+
+    def __init__(
+        self,
+        rpc_url: Optional[str] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        max_rps: Optional[float] = None,
+    ):
+        """
+        初始化客户端
+
+        Args:
+            rpc_url: RPC 地址，默认取配置
+            timeout: 单次调用超时（秒）
+            max_retries: 最大重试次数
+            max_concurrency: 同时在途的请求上限
+            max_rps: 全局每秒请求预算，None 表示不限速
+        """
+        self.rpc_url = rpc_url or settings.POLYGON_RPC_URL
+        self.timeout = timeout or settings.RPC_TIMEOUT
+        self.max_retries = settings.RPC_MAX_RETRIES if max_retries is None else max_retries
+        concurrency = max_concurrency or settings.RPC_MAX_CONCURRENCY
+
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=concurrency,
+                max_keepalive_connections=concurrency,
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.rate_limiter = TokenBucket(max_rps) if max_rps else None
+        self._next_id = 0
+
+        # 统计计数
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+
+    async def close(self):
+        """关闭连接池"""
+        await self.client.aclose()
+
+    def _request_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    async def _post(self, payload: Any, timeout: Optional[float] = None) -> Any:
+        """发送请求，失败时按指数退避重试"""
+        attempt = 0
+        while True:
+            try:
+                if self.rate_limiter:
+                    await self.rate_limiter.acquire()
+                async with self._semaphore:
+                    self.requests += 1
+                    response = await self.client.post(
+                        self.rpc_url,
+                        json=payload,
+                        timeout=timeout or self.timeout,
+                    )
+                if response.status_code == 429 and self.rate_limiter:
+                    # 被限流时所有共享预算的调用方一起退避
+                    self.rate_limiter.pause(2 ** attempt)
+                if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                    raise httpx.HTTPStatusError(
+                        f"HTTP {response.status_code}", request=response.request, response=response
+                    )
+                if response.status_code >= 400:
+                    self.errors += 1
+                    raise RPCError(f"HTTP {response.status_code}", status=response.status_code)
+                try:
+                    return response.json()
+                except ValueError as e:
+                    self.errors += 1
+                    raise RPCError(f"无效的 RPC 响应: {e}") from e
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if attempt >= self.max_retries:
+                    self.errors += 1
+                    raise RPCError(f"RPC 请求失败: {e}") from e
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(min(2 ** attempt, 10) * (0.5 + random.random()))
+
+    async def call(self, method: str, params: Sequence = (), timeout: Optional[float] = None) -> Any:
+        """
+        单次 JSON-RPC 调用
+
+        Args:
+            method: RPC 方法名
+            params: 参数列表
+            timeout: 本次调用超时（秒），默认取客户端设置
+
+        Returns:
+            result 字段
+        """
+        reply = await self._post(
+            {"jsonrpc": "2.0", "id": self._request_id(), "method": method, "params": list(params)},
+            timeout=timeout,
+        )
+        error = reply.get("error")
+        if error:
+            raise RPCError(error.get("message", str(error)), code=error.get("code"))
+        return reply.get("result")
+
+    async def batch(self, calls: List[Tuple[str, Sequence]], timeout: Optional[float] = None) -> List[Any]:
+        """
+        JSON-RPC batch 调用（一次 HTTP 往返）
+
+        Args:
+            calls: [(method, params), ...]
+            timeout: 超时（秒）
+
+        Returns:
+            与 calls 一一对应的 result，单个调用出错时对应位置为 None
+        """
+        if not calls:
+            return []
+
+        base_id = self._request_id()
+        self._next_id += len(calls)
+        payload = [
+            {"jsonrpc": "2.0", "id": base_id + i, "method": method, "params": list(params)}
+            for i, (method, params) in enumerate(calls)
+        ]
+        replies = await self._post(payload, timeout=timeout)
+
+        # 整个 batch 被拒绝时部分节点返回单个对象
+        if isinstance(replies, dict):
+            error = replies.get("error") or {}
+            raise RPCError(error.get("message", "batch request rejected"), code=error.get("code"))
+
+        results: List[Any] = [None] * len(calls)
+        for reply in replies:
+            index = reply.get("id", -1) - base_id if isinstance(reply.get("id"), int) else -1
+            if 0 <= index < len(calls) and "result" in reply:
+                results[index] = reply["result"]
+        return results
+
+    async def block_number(self) -> int:
+        """最新区块号"""
+        return int(await self.call("eth_blockNumber"), 16)
+
+    async def get_logs(self, filter_params: Dict, timeout: Optional[float] = None) -> List[Dict]:
+        """
+        获取事件日志
+
+        Args:
+            filter_params: 过滤条件，fromBlock/toBlock 可以是 int
+
+        Returns:
+            原始 JSON-RPC 格式的日志（十六进制字符串字段），可直接交给 TradeDecoder.decode_many
+        """
+        params = dict(filter_params)
+        for key in ("fromBlock", "toBlock"):
+            if isinstance(params.get(key), int):
+                params[key] = hex(params[key])
+        return await self.call("eth_getLogs", [params], timeout=timeout) or []
+
+    async def get_block(self, block_number: int) -> Optional[Dict]:
+        """获取区块头（不含交易）"""
+        return await self.call("eth_getBlockByNumber", [hex(block_number), False])
+
+    def stats(self) -> Dict:
+        """请求统计"""
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
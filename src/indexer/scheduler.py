@@ -0,0 +1,248 @@
+"""区块窗口调度模块 - 根据 RPC 响应自适应调整 get_logs 的区块范围"""
+from typing import Dict, List, Optional, Tuple
+
+from ..config import get_settings
+from .rpc import RPCError
+
+settings = get_settings()
+
+# Polygon 平均出块时间（秒）
+BLOCK_TIME_SECONDS = 2
+
+# 节点对 "结果过多 / 响应过大 / 区块范围过大" 的报错（各家节点的原文片段）
+TOO_MANY_RESULTS_MARKERS = (
+    "query returned more than",  # geth / Infura
+    "response size exceeded",  # Alchemy
+    "too many results",
+    "query exceeds max results",
+    "exceed maximum block range",  # Polygon bor
+    "block range is too wide",  # Ankr
+    "block range limit exceeded",  # Chainstack
+    "eth_getlogs is limited to",  # QuickNode
+    "range too large",
+)
+
+# 限流报错：应退避重试，而不是缩小窗口
+RATE_LIMIT_MARKERS = (
+    "rate limit",
+    "too many requests",
+    "request rate",
+)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """判断失败是否因为节点限流"""
+    if isinstance(error, RPCError) and error.status == 429:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def is_range_too_large(error: Exception) -> bool:
+    """判断 get_logs 失败是否因为区块范围过大（需要缩小窗口重试），限流不算"""
+    if is_rate_limited(error):
+        return False
+    if isinstance(error, RPCError):
+        if error.status == 413 or error.code == -32005:
+            return True
+    message = str(error).lower()
+    return any(marker in message for marker in TOO_MANY_RESULTS_MARKERS)
+
+
+class AdaptiveWindow:
+    """
+    自适应区块窗口
+
+    响应日志数较少时窗口翻倍，节点返回结果过多 / 413 时窗口减半。
+    减半后记住失败的窗口大小作为上限，一段时间内不再扩大到该值，避免反复触发限制。
+    """
+
+    # 连续成功多少次后忘记失败上限
+    CEILING_TTL = 20
+
+    def __init__(
+        self,
+        initial: int = 100,
+        min_size: int = 1,
+        max_size: int = 5000,
+        small_response: int = 1000,
+    ):
+        """
+        初始化窗口
+
+        Args:
+            initial: 初始区块数
+            min_size: 最小区块数
+            max_size: 最大区块数
+            small_response: 日志数低于该值视为"响应较小"，下次扩大窗口
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.small_response = small_response
+        self.size = max(min_size, min(initial, max_size))
+        self._ceiling: Optional[int] = None
+        self._since_shrink = 0
+
+        # 统计计数
+        self.grows = 0
+        self.shrinks = 0
+
+    def on_success(self, log_count: int):
+        """记录一次成功的 get_logs"""
+        self._since_shrink += 1
+        if self._ceiling is not None and self._since_shrink >= self.CEILING_TTL:
+            self._ceiling = None
+
+        if log_count < self.small_response and self.size < self.max_size:
+            target = min(self.size * 2, self.max_size)
+            if self._ceiling is not None and target >= self._ceiling:
+                return
+            self.size = target
+            self.grows += 1
+
+    def on_too_large(self) -> bool:
+        """
+        记录一次结果过多的失败
+
+        Returns:
+            是否还能继续缩小（已是最小窗口时返回 False）
+        """
+        if self.size <= self.min_size:
+            return False
+        self._ceiling = self.size
+        self._since_shrink = 0
+        self.size = max(self.size // 2, self.min_size)
+        self.shrinks += 1
+        return True
+
+
+class CatchupScheduler:
+    """
+    监听器追赶调度器
+
+    根据最近的日志密度（每区块日志数）和 RPC 响应时间决定 get_logs 窗口大小；
+    落后较多时把缺口切成多个窗口并发获取。同时维护落后区块数 / 秒数两个指标。
+    """
+
+    # 指数滑动平均系数
+    EMA_ALPHA = 0.3
+    # 连续成功多少次后忘记 "结果过多" 的窗口上限
+    CEILING_TTL = 20
+
+    def __init__(
+        self,
+        target_logs: Optional[int] = None,
+        target_latency: Optional[float] = None,
+        max_parallel: Optional[int] = None,
+        max_window: Optional[int] = None,
+        min_window: int = 1,
+        initial_window: int = 10,
+    ):
+        """
+        初始化调度器
+
+        Args:
+            target_logs: 每个窗口期望的日志数
+            target_latency: 每次 get_logs 期望的响应时间（秒）
+            max_parallel: 落后时最多同时获取的窗口数
+            max_window: 最大窗口区块数
+            min_window: 最小窗口区块数
+            initial_window: 初始窗口区块数
+        """
+        self.target_logs = target_logs or settings.CATCHUP_TARGET_LOGS
+        self.target_latency = target_latency or settings.CATCHUP_TARGET_LATENCY
+        self.max_parallel = max_parallel or settings.CATCHUP_MAX_PARALLEL
+        self.max_window = max_window or settings.CATCHUP_MAX_WINDOW
+        self.min_window = min_window
+        self.window = max(min_window, min(initial_window, self.max_window))
+
+        self.density: Optional[float] = None  # 每区块日志数 (EMA)
+        self.latency: Optional[float] = None  # 每次请求耗时 (EMA)
+        self._ceiling: Optional[int] = None
+        self._since_shrink = 0
+
+        # 落后指标
+        self.lag_blocks = 0
+        self.lag_seconds = 0.0
+
+    def _ema(self, current: Optional[float], value: float) -> float:
+        if current is None:
+            return value
+        return current + self.EMA_ALPHA * (value - current)
+
+    def on_response(self, blocks: int, log_count: int, elapsed: float):
+        """
+        记录一次成功的 get_logs，并重新计算窗口大小
+
+        Args:
+            blocks: 窗口区块数
+            log_count: 返回的日志数
+            elapsed: 耗时（秒）
+        """
+        self.density = self._ema(self.density, log_count / max(blocks, 1))
+        self.latency = self._ema(self.latency, elapsed)
+
+        # 按日志密度估算窗口，再按响应时间收缩
+        size = self.target_logs / max(self.density, 1e-3)
+        if self.latency > self.target_latency:
+            size *= self.target_latency / self.latency
+
+        # 单步最多翻倍，避免一次跳到很大的窗口
+        size = min(int(size), self.window * 2)
+
+        self._since_shrink += 1
+        if self._ceiling is not None:
+            if self._since_shrink >= self.CEILING_TTL:
+                self._ceiling = None
+            else:
+                size = min(size, self._ceiling - 1)
+
+        self.window = max(self.min_window, min(size, self.max_window))
+
+    def on_too_large(self) -> bool:
+        """
+        节点返回结果过多 / 413 时窗口减半
+
+        Returns:
+            是否还能继续缩小（已是最小窗口时返回 False）
+        """
+        if self.window <= self.min_window:
+            return False
+        self._ceiling = self.window
+        self._since_shrink = 0
+        self.window = max(self.window // 2, self.min_window)
+        return True
+
+    def plan(self, next_block: int, latest_block: int) -> List[Tuple[int, int]]:
+        """
+        规划本轮要获取的窗口
+
+        Args:
+            next_block: 下一个待处理区块
+            latest_block: 链上最新区块
+
+        Returns:
+            连续的 [(from_block, to_block), ...]，缺口大于一个窗口时返回多个以便并发获取
+        """
+        windows = []
+        start = next_block
+        while start <= latest_block and len(windows) < self.max_parallel:
+            end = min(start + self.window - 1, latest_block)
+            windows.append((start, end))
+            start = end + 1
+        return windows
+
+    def update_lag(self, next_block: int, latest_block: int):
+        """更新落后指标（秒数按 Polygon 平均出块时间估算）"""
+        self.lag_blocks = max(latest_block - next_block + 1, 0)
+        self.lag_seconds = self.lag_blocks * BLOCK_TIME_SECONDS
+
+    def stats(self) -> Dict:
+        """调度器指标"""
+        return {
+            "lag_blocks": self.lag_blocks,
+            "lag_seconds": self.lag_seconds,
+            "window": self.window,
+            "logs_per_block": round(self.density, 3) if self.density is not None else None,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+        }
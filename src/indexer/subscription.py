@@ -0,0 +1,82 @@
+"""日志订阅模块 - 通过 WebSocket eth_subscribe("logs") 接收节点推送的事件"""
+import json
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiohttp
+
+
+class SubscriptionError(Exception):
+    """订阅请求被节点拒绝"""
+
+
+class LogSubscription:
+    """
+    WebSocket 日志订阅
+
+    连接断开时 logs() 迭代结束，由调用方决定回退到轮询或重连。
+    """
+
+    def __init__(
+        self,
+        ws_url: str,
+        address: str,
+        topics: List[str],
+        heartbeat: float = 30.0,
+    ):
+        """
+        初始化订阅
+
+        Args:
+            ws_url: 节点 WebSocket 地址
+            address: 合约地址
+            topics: topic 过滤条件
+            heartbeat: WebSocket ping 间隔（秒），超时视为断线
+        """
+        self.ws_url = ws_url
+        self.address = address
+        self.topics = topics
+        self.heartbeat = heartbeat
+        self.subscription_id: Optional[str] = None
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+
+        # 统计计数
+        self.received = 0
+
+    async def close(self):
+        """主动关闭连接（logs() 迭代随之结束）"""
+        if self._ws is not None and not self._ws.closed:
+            await self._ws.close()
+
+    async def logs(self) -> AsyncIterator[Dict]:
+        """
+        逐条产出推送的日志（原始 JSON-RPC 格式，可直接交给 TradeDecoder.decode_many）
+        """
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(self.ws_url, heartbeat=self.heartbeat) as ws:
+                self._ws = ws
+                await ws.send_json({
+                    "jsonrpc": "2.0",
+                    "id": 1,
+                    "method": "eth_subscribe",
+                    "params": ["logs", {"address": self.address, "topics": self.topics}],
+                })
+
+                async for message in ws:
+                    if message.type != aiohttp.WSMsgType.TEXT:
+                        # CLOSED / ERROR 等，结束迭代
+                        break
+
+                    data = json.loads(message.data)
+
+                    if data.get("id") == 1:
+                        if data.get("error"):
+                            raise SubscriptionError(data["error"].get("message", str(data["error"])))
+                        self.subscription_id = data.get("result")
+                        continue
+
+                    params = data.get("params") or {}
+                    if data.get("method") == "eth_subscription" and params.get("subscription") == self.subscription_id:
+                        self.received += 1
+                        yield params["result"]
+
+        self._ws = None
@@ -0,0 +1,121 @@
+"""交易批量写入模块 - 以多行 INSERT ... ON CONFLICT DO NOTHING 幂等写入交易"""
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import String, any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Trade
+from ..profiler.analyzer import apply_trade_deltas
+from .cursors import advance_cursor
+
+# PostgreSQL 单条语句最多 32767 个绑定参数，Trade 每行约 14 列
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class TradeWriter:
+    """
+    交易批量写入器
+
+    一个 get_logs 窗口（或一页 Data API 结果）用一条多行 INSERT 写入，
+    去重依赖唯一索引 idx_trades_tx_log (tx_hash, log_index)，
+    不再逐条 SELECT 检查。新写入的交易在同一事务中作为增量更新交易者画像。
+
+    Data API 写入的交易（block_number = 0）用生成的 log_index，与链上日志序号
+    不可比较，因此链上行所在的交易已有 Data API 行时整笔跳过，避免同一成交计两次。
+    """
+
+    def __init__(self, session_factory, chunk_size: int = DEFAULT_CHUNK_SIZE, update_profiles: bool = True):
+        """
+        初始化写入器
+
+        Args:
+            session_factory: 异步数据库会话工厂
+            chunk_size: 每条 INSERT 语句的最大行数
+            update_profiles: 是否在同一事务中把新交易增量计入交易者画像
+        """
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.update_profiles = update_profiles
+
+    async def insert(self, session: AsyncSession, trades: List[Dict]) -> Dict[str, int]:
+        """
+        在给定会话中写入交易（不提交，由调用方控制事务）
+
+        Args:
+            session: 数据库会话
+            trades: 交易行列表，键与 Trade 列名一致
+
+        Returns:
+            {"inserted": 新写入行数, "skipped": 因重复跳过的行数, "whales": 新写入的大单数}
+        """
+        inserted = 0
+        whales = 0
+
+        # 已由 Data API 写入的交易不再写入链上行
+        covered = await self._api_covered(session, trades)
+        rows = [t for t in trades if not (t.get("block_number") and t["tx_hash"] in covered)]
+
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            stmt = (
+                pg_insert(Trade)
+                .values(chunk)
+                .on_conflict_do_nothing(index_elements=["tx_hash", "log_index"])
+                .returning(Trade.tx_hash, Trade.log_index, Trade.is_whale)
+            )
+            result = await session.execute(stmt)
+
+            # 只有真正新写入的交易计入画像，重放窗口不会重复累加
+            keys = []
+            for tx_hash, log_index, is_whale in result.all():
+                keys.append((tx_hash, log_index))
+                if is_whale:
+                    whales += 1
+            inserted += len(keys)
+
+            if self.update_profiles:
+                await apply_trade_deltas(session, keys)
+
+        return {
+            "inserted": inserted,
+            "skipped": len(trades) - inserted,
+            "whales": whales,
+        }
+
+    async def _api_covered(self, session: AsyncSession, trades: List[Dict]) -> Set[str]:
+        """链上行中已由 Data API 写入的交易哈希"""
+        chain_hashes = list({t["tx_hash"] for t in trades if t.get("block_number")})
+        if not chain_hashes:
+            return set()
+        result = await session.execute(
+            select(Trade.tx_hash)
+            .where(
+                Trade.tx_hash == any_(bindparam("chain_hashes", chain_hashes, type_=ARRAY(String))),
+                Trade.block_number == 0,
+            )
+            .distinct()
+        )
+        return {row[0] for row in result.all()}
+
+    async def write(self, trades: List[Dict], cursor: Optional[Dict] = None) -> Dict[str, int]:
+        """
+        写入交易并提交（一个窗口一次事务）
+
+        Args:
+            trades: 交易行列表
+            cursor: 可选的采集游标 {"job", "last_block", "start_block", "end_block"}，
+                与交易在同一事务中推进，窗口内没有交易时也会推进
+
+        Returns:
+            同 insert
+        """
+        if not trades and cursor is None:
+            return {"inserted": 0, "skipped": 0, "whales": 0}
+
+        async with self.session_factory() as session:
+            result = await self.insert(session, trades)
+            if cursor is not None:
+                await advance_cursor(session, **cursor)
+            await session.commit()
+            return result
@@ -0,0 +1,284 @@
+"""后台任务模块 - 持久化的 jobs 表 + 进程内工作池，执行长耗时的 API 操作"""
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .config import get_settings
+from .models import Job
+
+settings = get_settings()
+
+# 任务类型
+JOB_AI_BATCH_ANALYZE = "ai_batch_analyze"
+JOB_INSIDER_ANALYZE = "insider_analyze"
+
+# 排队中 / 执行中的任务参与去重
+ACTIVE_STATUSES = ("queued", "running")
+
+# 与部分唯一索引 uq_jobs_active_scope 一致的谓词（ON CONFLICT 推断索引时须为字面量）
+ACTIVE_PREDICATE = text("status IN ('queued', 'running')")
+
+# 进度写入数据库的最小间隔（秒）
+PROGRESS_WRITE_INTERVAL = 1.0
+
+# 任务处理函数: (参数, 进度回调(已完成, 总数)) -> 可 JSON 序列化的结果
+ProgressCallback = Callable[[int, int], Awaitable]
+JobHandler = Callable[[Dict, ProgressCallback], Awaitable[Dict]]
+
+
+def job_scope(params: Dict) -> str:
+    """把决定工作内容的参数规范化为去重键"""
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def job_to_dict(job: Job, with_result: bool = True) -> Dict:
+    """任务记录转为 API 返回格式"""
+    data = {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": json.loads(job.params) if job.params else {},
+        "progress": job.progress or 0,
+        "total": job.total,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if with_result:
+        data["result"] = json.loads(job.result) if job.result else None
+    return data
+
+
+class JobQueue:
+    """
+    后台任务队列
+
+    提交时写入 jobs 表并立即返回任务 ID；同一 kind + scope 已有排队中 / 执行中的任务时
+    直接返回已有任务（由部分唯一索引保证，并发提交也只会创建一个）。
+    工作协程按提交顺序领取任务并记录进度与结果。进程退出时执行中的任务保持 running，
+    下次启动时重新排队。
+    """
+
+    def __init__(self, session_factory, workers: Optional[int] = None):
+        """
+        初始化任务队列
+
+        Args:
+            session_factory: 异步数据库会话工厂
+            workers: 工作协程数（默认取配置 JOB_WORKERS）
+        """
+        self.session_factory = session_factory
+        self.workers = workers or settings.JOB_WORKERS
+        self.handlers: Dict[str, JobHandler] = {}
+        self.running = False
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+        # 统计计数
+        self.submitted = 0
+        self.deduplicated = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def register(self, kind: str, handler: JobHandler):
+        """注册任务类型的处理函数"""
+        self.handlers[kind] = handler
+
+    async def start(self):
+        """重新排队上次未完成的任务并启动工作协程"""
+        async with self.session_factory() as session:
+            # 上次进程退出时仍在执行的任务
+            await session.execute(
+                update(Job).where(Job.status == "running").values(status="queued", started_at=None)
+            )
+            result = await session.execute(
+                select(Job.id).where(Job.status == "queued").order_by(Job.created_at, Job.id)
+            )
+            pending = [row[0] for row in result.all()]
+            await session.commit()
+
+        for job_id in pending:
+            self._queue.put_nowait(job_id)
+        if pending:
+            print(f"[JOBS] Re-queued {len(pending)} unfinished jobs")
+
+        self.running = True
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """停止工作协程（执行中的任务下次启动时重新执行）"""
+        self.running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, scope: Dict, params: Optional[Dict] = None) -> Tuple[Dict, bool]:
+        """
+        提交任务
+
+        Args:
+            kind: 任务类型
+            scope: 决定工作内容的参数（去重键）
+            params: 传给处理函数的全部参数（默认等于 scope）
+
+        Returns:
+            (任务信息, 是否新建)；已有相同任务时返回已有任务
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        scope_key = job_scope(scope)
+        params = {**scope, **(params or {})}
+
+        async with self.session_factory() as session:
+            # 已有任务可能在冲突之后、查询之前结束，重试一次即可新建
+            for _ in range(2):
+                result = await session.execute(
+                    pg_insert(Job)
+                    .values(
+                        kind=kind,
+                        scope=scope_key,
+                        params=json.dumps(params, default=str),
+                        status="queued",
+                        progress=0,
+                        created_at=datetime.utcnow(),
+                    )
+                    .on_conflict_do_nothing(
+                        index_elements=["kind", "scope"],
+                        index_where=ACTIVE_PREDICATE,
+                    )
+                    .returning(Job.id)
+                )
+                job_id = result.scalar_one_or_none()
+                await session.commit()
+
+                if job_id is not None:
+                    self.submitted += 1
+                    self._queue.put_nowait(job_id)
+                    return job_to_dict(await session.get(Job, job_id)), True
+
+                existing = await session.execute(
+                    select(Job).where(
+                        Job.kind == kind,
+                        Job.scope == scope_key,
+                        Job.status.in_(ACTIVE_STATUSES),
+                    )
+                )
+                job = existing.scalar_one_or_none()
+                if job is not None:
+                    self.deduplicated += 1
+                    return job_to_dict(job), False
+
+        raise RuntimeError(f"Failed to submit {kind} job")
+
+    async def get(self, job_id: int) -> Optional[Dict]:
+        """查询任务状态、进度与结果"""
+        async with self.session_factory() as session:
+            job = await session.get(Job, job_id)
+            return job_to_dict(job) if job else None
+
+    async def recent(self, kind: Optional[str] = None, status: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """最近的任务（不含结果）"""
+        query = select(Job).order_by(Job.created_at.desc(), Job.id.desc()).limit(limit)
+        if kind:
+            query = query.where(Job.kind == kind)
+        if status:
+            query = query.where(Job.status == status)
+
+        async with self.session_factory() as session:
+            result = await session.execute(query)
+            return [job_to_dict(job, with_result=False) for job in result.scalars().all()]
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[JOBS] Job #{job_id} bookkeeping failed: {e}")
+
+    async def _run(self, job_id: int):
+        # 领取任务（只有 queued 状态才能被领取，避免重复执行）
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "queued")
+                .values(status="running", started_at=datetime.utcnow())
+                .returning(Job.kind, Job.params)
+            )
+            claimed = result.one_or_none()
+            await session.commit()
+
+        if claimed is None:
+            return
+
+        kind, params = claimed
+        handler = self.handlers.get(kind)
+        last_write = 0.0
+
+        async def progress(done: int, total: int):
+            nonlocal last_write
+            now = time.monotonic()
+            if done < total and now - last_write < PROGRESS_WRITE_INTERVAL:
+                return
+            last_write = now
+            await self._update(job_id, progress=done, total=total)
+
+        print(f"[JOBS] Job #{job_id} ({kind}) started")
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job kind: {kind}")
+            output = await handler(json.loads(params) if params else {}, progress)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            print(f"[JOBS] Job #{job_id} ({kind}) failed: {e}")
+            await self._update(job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+            return
+
+        self.succeeded += 1
+        print(f"[JOBS] Job #{job_id} ({kind}) succeeded")
+        await self._update(
+            job_id,
+            status="succeeded",
+            result=json.dumps(output, default=str, ensure_ascii=False),
+            finished_at=datetime.utcnow(),
+        )
+
+    async def _update(self, job_id: int, **values):
+        async with self.session_factory() as session:
+            await session.execute(update(Job).where(Job.id == job_id).values(**values))
+            await session.commit()
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+        }
+
+
+_shared_queue: Optional[JobQueue] = None
+
+
+def get_job_queue(session_factory) -> JobQueue:
+    """进程内共享的任务队列（API 提交、服务启动时注册处理函数并启动工作协程）"""
+    global _shared_queue
+    if _shared_queue is None:
+        _shared_queue = JobQueue(session_factory)
+    return _shared_queue
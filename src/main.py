@@ -1,5 +1,6 @@
 """Insider Hunter - Polymarket 内幕猎手主入口"""
 import asyncio
+import sys
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -9,22 +10,71 @@ from .db import init_db, close_db, AsyncSessionLocal
 from .api.routes import router
 from .indexer.discovery import MarketDiscovery
 from .indexer.listener import TradeListener
-from .indexer.backfill import HistoryBackfill
-from .indexer.fast_backfill import FastBackfill
+from .indexer.backfill import HistoryBackfill, run_backfill
+from .indexer.fast_backfill import FastBackfill, remove_duplicate_api_trades
+from .indexer.resolution import ResolutionTracker
 from .profiler.analyzer import TraderProfiler
 from .agent.insider import InsiderAnalyzer
+from .jobs import JOB_AI_BATCH_ANALYZE, JOB_INSIDER_ANALYZE, JobQueue, get_job_queue
 
 settings = get_settings()
 
 # 全局服务实例
 listener: TradeListener = None
 discovery: MarketDiscovery = None
+discovery_task: asyncio.Task = None
+resolution_tracker: ResolutionTracker = None
+ai_scheduler = None
+job_queue: JobQueue = None
+
+
+async def sync_discovered_markets(discovery: MarketDiscovery, changed_only: bool = False):
+    """抓取 Gamma 市场并逐页写入数据库（changed_only 时只写入相对缓存有变化的分页）"""
+    try:
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        async with AsyncSessionLocal() as session:
+            async for markets in discovery.crawl_markets(changed_only=changed_only):
+                for key, value in (await discovery.sync_markets_to_db(session, markets)).items():
+                    counts[key] += value
+        print(f"[OK] Synced markets: {counts['inserted']} new, {counts['updated']} updated, "
+              f"{counts['unchanged']} unchanged")
+    except Exception as e:
+        print(f"[WARNING] Market sync failed: {e}")
+
+
+async def ai_batch_analyze_job(params: dict, progress) -> dict:
+    """后台任务：批量AI分析交易者"""
+    from .profiler.ai_analyzer import get_ai_profiler
+
+    ai_profiler = get_ai_profiler(AsyncSessionLocal)
+    results = await ai_profiler.batch_analyze(**params, progress=progress)
+    cached = sum(1 for r in results if r.get("cached"))
+    return {
+        "analyzed": len(results),
+        "cached": cached,
+        "message": f"已完成 {len(results)} 个交易者的AI画像分析（{cached} 个输入未变化，复用缓存）",
+        "results": results,
+        "stats": ai_profiler.stats(),
+    }
+
+
+async def insider_analyze_job(params: dict, progress) -> dict:
+    """后台任务：对未分析的大单进行内幕分析"""
+    analyzer = InsiderAnalyzer(AsyncSessionLocal)
+    alerts = await analyzer.scan_pending_trades(limit=params["limit"], progress=progress)
+    suspect_count = sum(1 for a in alerts if a.is_suspect)
+    return {
+        "analyzed": len(alerts),
+        "suspect_count": suspect_count,
+        "alert_ids": [a.id for a in alerts],
+        "message": f"已分析 {len(alerts)} 笔交易，发现 {suspect_count} 笔可疑交易",
+    }
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    global listener, discovery
+    global listener, discovery, discovery_task, resolution_tracker, ai_scheduler, job_queue
 
     # Startup
     print("[STARTUP] Insider Hunter starting...")
@@ -36,14 +86,26 @@ async def lifespan(app: FastAPI):
     # Initialize market discovery service
     discovery = MarketDiscovery()
 
-    # Sync market data
-    try:
-        markets = await discovery.fetch_all_active_markets(limit=200)
-        async with AsyncSessionLocal() as session:
-            count = await discovery.sync_markets_to_db(session, markets)
-            print(f"[OK] Synced {count} new markets, total {len(markets)} active markets")
-    except Exception as e:
-        print(f"[WARNING] Market sync failed: {e}")
+    # Sync market data: warm starts use the cached snapshot and revalidate in background,
+    # cold starts load the first page only and crawl the rest in background
+    snapshot = discovery.cached_markets()
+    if snapshot:
+        try:
+            async with AsyncSessionLocal() as session:
+                await discovery.sync_markets_to_db(session, snapshot)
+            print(f"[OK] Loaded {len(snapshot)} markets from cache, revalidating in background")
+        except Exception as e:
+            print(f"[WARNING] Cached market sync failed: {e}")
+        discovery_task = asyncio.create_task(sync_discovered_markets(discovery, changed_only=True))
+    else:
+        try:
+            markets = await discovery.fetch_all_active_markets(limit=settings.GAMMA_PAGE_SIZE)
+            async with AsyncSessionLocal() as session:
+                await discovery.sync_markets_to_db(session, markets)
+            print(f"[OK] Loaded first {len(markets)} markets, crawling the rest in background")
+        except Exception as e:
+            print(f"[WARNING] First market page sync failed: {e}")
+        discovery_task = asyncio.create_task(sync_discovered_markets(discovery))
 
     # Initialize blockchain listener
     listener = TradeListener(AsyncSessionLocal)
@@ -52,6 +114,27 @@ async def lifespan(app: FastAPI):
     asyncio.create_task(listener.start())
     print("[OK] Blockchain listener started")
 
+    # Track market resolutions; only affected traders' profiles are recomputed
+    resolution_tracker = ResolutionTracker(AsyncSessionLocal)
+    asyncio.create_task(resolution_tracker.run())
+    print("[OK] Resolution tracker started")
+
+    # Re-analyze stale AI trader profiles within an hourly LLM budget
+    if settings.AI_REANALYSIS_ENABLED:
+        from .profiler.ai_analyzer import get_ai_profiler
+        from .profiler.ai_scheduler import AIReanalysisScheduler
+
+        ai_scheduler = AIReanalysisScheduler(get_ai_profiler(AsyncSessionLocal))
+        asyncio.create_task(ai_scheduler.run())
+        print(f"[OK] AI re-analysis scheduler started ({ai_scheduler.hourly_budget} requests/hour)")
+
+    # Long-running AI / insider endpoints run as background jobs
+    job_queue = get_job_queue(AsyncSessionLocal)
+    job_queue.register(JOB_AI_BATCH_ANALYZE, ai_batch_analyze_job)
+    job_queue.register(JOB_INSIDER_ANALYZE, insider_analyze_job)
+    await job_queue.start()
+    print(f"[OK] Job workers started ({job_queue.workers})")
+
     print("[OK] Insider Hunter started successfully!")
     print(f"  API URL: http://localhost:8000")
     print(f"  Docs URL: http://localhost:8000/docs")
@@ -63,6 +146,20 @@ async def lifespan(app: FastAPI):
 
     if listener:
         await listener.stop()
+        await listener.close()
+
+    if resolution_tracker:
+        resolution_tracker.stop()
+        await resolution_tracker.close()
+
+    if ai_scheduler:
+        ai_scheduler.stop()
+
+    if job_queue:
+        await job_queue.stop()
+
+    if discovery_task:
+        discovery_task.cancel()
 
     if discovery:
         await discovery.close()
@@ -103,6 +200,24 @@ async def root():
     }
 
 
+@app.get("/api/indexer/status", tags=["System"])
+async def indexer_status():
+    """链上监听状态 - 落后区块数 / 秒数、窗口参数与区块缓存命中率"""
+    if not listener:
+        return {"running": False}
+
+    return {
+        "running": listener.running,
+        "lag": listener.lag(),
+        "block_cache": listener.block_cache.stats(),
+        "token_registry": listener.token_map.stats(),
+        "rpc": listener.rpc.stats(),
+        "resolution": resolution_tracker.stats() if resolution_tracker else None,
+        "ai_reanalysis": ai_scheduler.stats() if ai_scheduler else None,
+        "jobs": job_queue.stats() if job_queue else None,
+    }
+
+
 # CLI 入口点
 def run_server():
     """运行 API 服务器"""
@@ -115,14 +230,71 @@ def run_server():
     )
 
 
-async def run_profiler_refresh():
+async def run_profiler_refresh(streaming: bool = False):
     """运行交易者画像刷新"""
     await init_db()
     profiler = TraderProfiler(AsyncSessionLocal)
-    await profiler.refresh_all_profiles()
+    await profiler.refresh_all_profiles(streaming=streaming)
     await close_db()
 
 
+async def run_profile_check(fix: bool = False):
+    """核对增量维护的交易者画像，fix 时不一致则全量重建"""
+    await init_db()
+    profiler = TraderProfiler(AsyncSessionLocal)
+    try:
+        result = await profiler.check_consistency()
+        print(f"[*] 交易者 {result['traders']} 个, 画像不一致 {result['mismatched']} 个")
+        for address in result["samples"]:
+            print(f"  - {address}")
+        if result["mismatched"] and fix:
+            await profiler.refresh_all_profiles()
+    finally:
+        await close_db()
+
+
+async def run_dedupe_trades():
+    """一次性清理 Data API 写入的重复成交，并全量重建交易者画像"""
+    await init_db()
+    try:
+        async with AsyncSessionLocal() as session:
+            removed = await remove_duplicate_api_trades(session)
+            await session.commit()
+        print(f"[OK] 删除重复成交 {removed} 条")
+        if removed:
+            await TraderProfiler(AsyncSessionLocal).refresh_all_profiles()
+    finally:
+        await close_db()
+
+
+async def run_track_resolutions():
+    """检查一轮市场结算并重算受影响交易者的画像"""
+    await init_db()
+    tracker = ResolutionTracker(AsyncSessionLocal)
+    try:
+        result = await tracker.check_once()
+        print(f"[OK] 检查 {result['checked']} 个市场, 新结算 {len(result['resolved'])} 个, "
+              f"受影响交易者 {len(result['makers'])} 个")
+    finally:
+        await tracker.close()
+        await close_db()
+
+
+async def run_ai_reanalysis(limit: int = None):
+    """执行一轮 AI 画像重分析（按过期程度和交易量排序，受每小时预算限制）"""
+    from .profiler.ai_analyzer import TraderAIProfiler
+    from .profiler.ai_scheduler import AIReanalysisScheduler
+
+    await init_db()
+    scheduler = AIReanalysisScheduler(TraderAIProfiler(AsyncSessionLocal))
+    try:
+        result = await scheduler.run_once(limit)
+        print(f"[OK] 选中 {result['selected']} 个过期交易者, 重新分析 {result['analyzed']} 个, "
+              f"输入未变化 {result['cached']} 个, 无交易跳过 {result['skipped']} 个, 失败 {result['failed']} 个")
+    finally:
+        await close_db()
+
+
 async def run_insider_scan():
     """运行内幕分析扫描"""
     await init_db()
@@ -131,7 +303,9 @@ async def run_insider_scan():
     await close_db()
 
 
-async def run_ai_profile_analysis(limit: int = 50, min_trades: int = 5, force: bool = False):
+async def run_ai_profile_analysis(
+    limit: int = 50, min_trades: int = 5, force: bool = False, concurrency: int = None, pack_size: int = None
+):
     """Run AI trader profile analysis"""
     from .profiler.ai_analyzer import TraderAIProfiler
 
@@ -145,7 +319,9 @@ async def run_ai_profile_analysis(limit: int = 50, min_trades: int = 5, force: b
     results = await ai_profiler.batch_analyze(
         limit=limit,
         min_trades=min_trades,
-        force_refresh=force
+        force_refresh=force,
+        concurrency=concurrency,
+        pack_size=pack_size,
     )
 
     print(f"\n[SUCCESS] Analysis complete! Analyzed {len(results)} traders")
@@ -162,10 +338,14 @@ async def run_ai_profile_analysis(limit: int = 50, min_trades: int = 5, force: b
     await close_db()
 
 
-async def run_history_backfill(months: int = 6):
+async def run_history_backfill(
+    months: int = 6,
+    workers: int = None,
+    max_rps: float = None,
+    resume: bool = False,
+):
     """运行历史数据回填"""
-    backfill = HistoryBackfill()
-    await backfill.backfill(months=months)
+    await run_backfill(months=months, workers=workers, max_rps=max_rps, resume=resume)
 
 
 async def run_sync_markets():
@@ -173,27 +353,49 @@ async def run_sync_markets():
     await init_db()
     discovery = MarketDiscovery()
     try:
-        markets = await discovery.fetch_all_active_markets(limit=200)
-        print(f"[*] 从 Gamma API 获取了 {len(markets)} 个市场")
-
-        # 打印前几个市场的 token ID 用于验证
-        for m in markets[:3]:
-            print(f"  - {m['slug']}")
-            print(f"    YES: {m['yes_token_id'][:30]}...")
-            print(f"    NO:  {m['no_token_id'][:30]}...")
-
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        total = 0
         async with AsyncSessionLocal() as session:
-            count = await discovery.sync_markets_to_db(session, markets)
-            print(f"[OK] 同步了 {count} 个新市场到数据库")
+            # 边抓取边写入，不等全部分页完成
+            async for markets in discovery.crawl_markets():
+                if total == 0:
+                    # 打印前几个市场的 token ID 用于验证
+                    for m in markets[:3]:
+                        print(f"  - {m['slug']}")
+                        print(f"    YES: {m['yes_token_id'][:30]}...")
+                        print(f"    NO:  {m['no_token_id'][:30]}...")
+
+                for key, value in (await discovery.sync_markets_to_db(session, markets)).items():
+                    counts[key] += value
+                total += len(markets)
+                print(f"\r[*] 已从 Gamma API 获取 {total} 个市场   ", end="")
+
+        print(f"\n[OK] 同步完成: 新增 {counts['inserted']} 个, 更新 {counts['updated']} 个, "
+              f"未变化 {counts['unchanged']} 个（共 {total} 个活跃市场）")
     finally:
         await discovery.close()
         await close_db()
 
 
-async def run_fast_backfill(total: int = 10000):
+async def run_fast_backfill(total: int = 10000, fetchers: int = None, max_rps: float = None, by_market: bool = False):
     """运行快速回填 (使用 Polymarket Data API)"""
-    backfill = FastBackfill()
-    await backfill.backfill(total_trades=total)
+    backfill = FastBackfill(max_rps=max_rps)
+    if by_market:
+        await backfill.backfill_markets(workers=fetchers)
+    else:
+        await backfill.backfill(total_trades=total, fetchers=fetchers)
+
+
+def _get_option(name: str, cast, default=None):
+    """读取 --name value 形式的命令行参数"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            try:
+                return cast(sys.argv[index + 1])
+            except ValueError:
+                pass
+    return default
 
 
 if __name__ == "__main__":
@@ -205,11 +407,15 @@ if __name__ == "__main__":
         if command == "serve":
             run_server()
         elif command == "refresh-profiles":
-            asyncio.run(run_profiler_refresh())
+            # 流式重建（内存有界）: python -m src.main refresh-profiles --stream
+            asyncio.run(run_profiler_refresh(streaming="--stream" in sys.argv))
+        elif command == "check-profiles":
+            # 核对增量画像: python -m src.main check-profiles [--fix]
+            asyncio.run(run_profile_check(fix="--fix" in sys.argv))
         elif command == "scan-insider":
             asyncio.run(run_insider_scan())
         elif command == "ai-profile":
-            # 支持参数: python -m src.main ai-profile [limit] [min_trades] [--force]
+            # 支持参数: python -m src.main ai-profile [limit] [min_trades] [--force] [--concurrency 4] [--pack 5]
             limit = 50
             min_trades = 5
             force = False
@@ -226,39 +432,72 @@ if __name__ == "__main__":
                     pass
             if "--force" in sys.argv:
                 force = True
+            concurrency = _get_option("--concurrency", int)
+            pack_size = _get_option("--pack", int)
 
-            asyncio.run(run_ai_profile_analysis(limit, min_trades, force))
+            asyncio.run(run_ai_profile_analysis(limit, min_trades, force, concurrency, pack_size))
+        elif command == "ai-rescan":
+            # 支持参数: python -m src.main ai-rescan [limit]（默认按调度间隔分摊小时预算）
+            limit = None
+            if len(sys.argv) > 2:
+                try:
+                    limit = int(sys.argv[2])
+                except ValueError:
+                    pass
+            asyncio.run(run_ai_reanalysis(limit))
         elif command == "backfill":
-            # 支持指定月数: python -m src.main backfill 6
+            # 支持指定月数: python -m src.main backfill 6 [--workers 4] [--rps 20] [--resume]
             months = 6
             if len(sys.argv) > 2:
                 try:
                     months = int(sys.argv[2])
                 except ValueError:
                     pass
-            print(f"[BACKFILL] Starting {months} months historical data backfill...")
-            asyncio.run(run_history_backfill(months))
+            workers = _get_option("--workers", int)
+            max_rps = _get_option("--rps", float)
+            resume = "--resume" in sys.argv
+            if resume:
+                print("[BACKFILL] Resuming saved historical data backfill...")
+            else:
+                print(f"[BACKFILL] Starting {months} months historical data backfill...")
+            asyncio.run(run_history_backfill(months, workers, max_rps, resume))
         elif command == "sync-markets":
             asyncio.run(run_sync_markets())
+        elif command == "dedupe-trades":
+            asyncio.run(run_dedupe_trades())
+        elif command == "track-resolutions":
+            asyncio.run(run_track_resolutions())
         elif command == "fast-backfill":
-            # 支持指定数量: python -m src.main fast-backfill 10000
+            # 支持指定数量: python -m src.main fast-backfill 10000 [--fetchers 4] [--rps 10]
+            # 按活跃市场增量回填: python -m src.main fast-backfill --markets [--fetchers 4]
             total = 10000
             if len(sys.argv) > 2:
                 try:
                     total = int(sys.argv[2])
                 except ValueError:
                     pass
-            print(f"[FAST BACKFILL] Loading {total} trades (Polymarket Data API)...")
-            asyncio.run(run_fast_backfill(total))
+            fetchers = _get_option("--fetchers", int)
+            max_rps = _get_option("--rps", float)
+            by_market = "--markets" in sys.argv
+            if by_market:
+                print("[FAST BACKFILL] Loading trades for active markets (Polymarket Data API)...")
+            else:
+                print(f"[FAST BACKFILL] Loading {total} trades (Polymarket Data API)...")
+            asyncio.run(run_fast_backfill(total, fetchers, max_rps, by_market))
         else:
             print(f"未知命令: {command}")
             print("可用命令:")
             print("  serve                    - 启动 API 服务")
             print("  sync-markets             - 同步市场数据")
-            print("  fast-backfill [数量]      - 快速回填交易 (推荐，默认 10000)")
-            print("  backfill [月数]           - 链上回填历史数据 (慢)")
-            print("  refresh-profiles         - 刷新交易者画像")
+            print("  fast-backfill [数量] [--fetchers N] [--rps R] - 快速回填交易 (推荐，默认 10000)")
+            print("  fast-backfill --markets [--fetchers N] [--rps R] - 按活跃市场增量回填交易")
+            print("  backfill [月数] [--workers N] [--rps R] [--resume] - 链上并发分片回填历史数据")
+            print("  dedupe-trades            - 清理 Data API 与链上重复写入的成交并重建画像")
+            print("  track-resolutions        - 检查市场结算并把胜负计入交易者画像")
+            print("  refresh-profiles [--stream] - 全量重建交易者画像，--stream 时流式重建")
+            print("  check-profiles [--fix]   - 核对增量维护的画像，--fix 时不一致则全量重建")
             print("  scan-insider             - 执行内幕分析扫描")
-            print("  ai-profile [数量] [最小交易数] [--force] - AI交易者画像分析")
+            print("  ai-profile [数量] [最小交易数] [--force] [--concurrency N] [--pack K] - AI交易者画像分析")
+            print("  ai-rescan [数量]         - 按过期程度重新分析AI画像（受每小时预算限制）")
     else:
         run_server()
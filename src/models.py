@@ -23,6 +23,8 @@ class Market(Base):
     resolved = Column(Boolean, default=False)
     resolution_outcome = Column(String(10))  # 'YES' / 'NO' / None
     active = Column(Boolean, default=True)
+    end_date = Column(DateTime)  # 预定结束时间（Gamma endDate），结算追踪按此排序
+    content_hash = Column(String(32))  # 同步字段的 MD5，未变化时跳过更新
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -30,6 +32,7 @@ class Market(Base):
     __table_args__ = (
         Index("idx_markets_token_yes", "yes_token_id"),
         Index("idx_markets_token_no", "no_token_id"),
+        Index("idx_markets_open_end_date", "resolved", "end_date"),
     )
 
 
@@ -81,6 +84,10 @@ class TraderProfile(Base):
     trading_style = Column(String(50))  # 交易风格：激进/稳健/保守/投机/对冲
     risk_preference = Column(String(20))  # 风险偏好：高/中/低
     ai_analysis = Column(Text)  # AI 深度分析文本
+    ai_input_hash = Column(String(64))  # 生成当前 AI 分析的输入指纹（分析数据 + 模型 + 提示词版本）
+    ai_analyzed_at = Column(DateTime)  # 最近一次调用模型分析的时间
+    ai_analyzed_trades = Column(Integer)  # 最近一次分析时的交易数（计算分析后新增交易）
+    ai_analyzed_win_rate = Column(Numeric(5, 2))  # 最近一次分析时的胜率（计算胜率漂移）
 
     last_trade_at = Column(DateTime)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -93,6 +100,17 @@ class TraderProfile(Base):
     )
 
 
+class IngestionCursor(Base):
+    """采集游标表 - 记录每个采集任务最后完整提交的区块"""
+    __tablename__ = "ingestion_cursors"
+
+    job = Column(String(100), primary_key=True)  # 'listener' / 'backfill:<start>-<end>' / 'market:<condition_id>'
+    start_block = Column(BigInteger)  # 任务范围起点（回填分片），持续任务为空
+    end_block = Column(BigInteger)  # 任务范围终点（回填分片），持续任务为空
+    last_block = Column(BigInteger, nullable=False)  # 已与交易一起提交的最后区块（market: 任务为最新成交时间戳）
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class InsiderAlert(Base):
     """内幕分析警报表 - 存储 AI 分析结果"""
     __tablename__ = "insider_alerts"
@@ -117,3 +135,31 @@ class InsiderAlert(Base):
         Index("idx_alerts_suspect", "is_suspect", "analyzed_at"),
         Index("idx_alerts_market", "market_slug"),
     )
+
+
+class Job(Base):
+    """后台任务表 - 长耗时的批量 AI 分析 / 内幕分析在进程内工作池中执行，记录状态、进度与结果"""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)  # 'ai_batch_analyze' / 'insider_analyze'
+    scope = Column(String(255), nullable=False)  # 去重键：决定工作内容的参数（规范化 JSON）
+    params = Column(Text)  # 全部参数（JSON）
+    status = Column(String(20), nullable=False, default="queued")  # queued / running / succeeded / failed
+    progress = Column(Integer, default=0)  # 已完成的工作量
+    total = Column(Integer)  # 总工作量（开始执行后才知道）
+    result = Column(Text)  # 执行结果（JSON）
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    # 索引（同一 kind + scope 只能有一个排队中 / 执行中的任务）
+    __table_args__ = (
+        Index(
+            "uq_jobs_active_scope", "kind", "scope", unique=True,
+            postgresql_where=status.in_(("queued", "running")),
+        ),
+        Index("idx_jobs_created", "created_at"),
+    )
+
@@ -1,17 +1,89 @@
 """交易者画像AI分析模块 - 使用 DeepSeek V3 深度分析交易者行为"""
+import asyncio
+import hashlib
 import json
+import random
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Dict, Optional
+from typing import Awaitable, Callable, List, Dict, Optional
+import openai
 from openai import AsyncOpenAI
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import get_settings
 from ..models import Trade, Market, TraderProfile
+from ..ratelimit import TokenBucket
 
 settings = get_settings()
 
+SYSTEM_PROMPT = """你是一个专业的量化交易分析师，专门分析 Polymarket 预测市场的交易者行为。
+
+你的任务是基于交易者的历史数据，深度分析其交易风格、决策特点和行为模式。
+
+分析维度：
+1. 交易风格（Trading Style）：激进/稳健/保守/投机
+2. 风险偏好（Risk Preference）：高风险/中等/低风险
+3. 决策特点：理性/情绪化/数据驱动/跟风
+4. 擅长领域：政治/体育/娱乐等
+5. 行为特征：长期持有/短线交易/对冲等
+
+请用专业且有洞察力的语言，生成简洁的交易者画像。"""
+
+# 单次分析的最大输出 token 数
+MAX_OUTPUT_TOKENS = 1500
+
+# 打包请求中每个交易者预留的输出 token 数，以及单次请求的输出上限
+PACKED_OUTPUT_TOKENS_PER_TRADER = 500
+MAX_PACKED_OUTPUT_TOKENS = 8000
+
+# 提示词版本：修改任一提示词（单人 / 打包）时递增，使已有分析结果失效
+PROMPT_VERSION = "1"
+
+
+def analysis_fingerprint(data: Dict, model: str, prompt_version: str = PROMPT_VERSION) -> str:
+    """
+    计算分析输入的指纹
+
+    Args:
+        data: _prepare_analysis_data 的返回值
+        model: 模型名
+        prompt_version: 提示词版本
+
+    Returns:
+        sha256 十六进制串；输入不变时结果不变
+    """
+    payload = json.dumps(
+        {"data": data, "model": model, "prompt_version": prompt_version},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(messages: List[Dict], max_tokens: int = MAX_OUTPUT_TOKENS) -> int:
+    """粗略估算一次请求消耗的 token（中文约 1 字 1 token，加上输出上限）"""
+    return sum(len(m["content"]) for m in messages) + max_tokens
+
+
+def _is_retryable(error: Exception) -> bool:
+    """429 / 5xx / 网络错误可以重试"""
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _is_valid_result(item: Dict) -> bool:
+    """打包响应中的单个结果必须包含非空的 label 和 analysis"""
+    return all(isinstance(item.get(key), str) and item[key].strip() for key in ("label", "analysis"))
+
+
+def _retry_after(error: openai.APIStatusError) -> float:
+    """解析 429 响应的 Retry-After（秒），缺失或无法解析时返回 0"""
+    try:
+        return float(error.response.headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
 
 class TraderAIProfiler:
     """交易者AI画像分析器"""
@@ -24,11 +96,30 @@ class TraderAIProfiler:
             session_factory: 异步数据库会话工厂
         """
         self.session_factory = session_factory
+        # 重试由 _complete 统一处理（配合限流器退避）
         self.client = AsyncOpenAI(
             base_url=settings.DEEPSEEK_BASE_URL,
             api_key=settings.DEEPSEEK_API_KEY,
+            max_retries=0,
         )
         self.model = settings.DEEPSEEK_MODEL
+        self.max_retries = settings.AI_MAX_RETRIES
+
+        # 按服务商配额限速（容量为 10 秒的预算，允许小幅突发）
+        self.request_limiter = TokenBucket(settings.AI_MAX_RPM / 60, capacity=max(settings.AI_MAX_RPM / 6, 1))
+        self.token_limiter = TokenBucket(settings.AI_MAX_TPM / 60, capacity=settings.AI_MAX_TPM / 6)
+
+        # 统计计数
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.tokens_used = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.packed_requests = 0
+        self.packed_fallbacks = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     async def analyze_trader(
         self,
@@ -42,10 +133,69 @@ class TraderAIProfiler:
         Args:
             session: 数据库会话
             address: 交易者地址
-            force_refresh: 是否强制重新分析（忽略已有标签）
+            force_refresh: 是否重新分析已有标签的交易者（输入指纹未变化时仍复用结果）
+
+        Returns:
+            分析结果字典（cached=True 表示未调用模型）
+        """
+        return (await self.analyze_group(session, [address], force_refresh))[0]
+
+    async def analyze_group(
+        self,
+        session: AsyncSession,
+        addresses: List[str],
+        force_refresh: bool = False
+    ) -> List[Optional[Dict]]:
+        """
+        在同一会话中分析一组交易者
+
+        需要调用模型的交易者合并为一次打包请求（只有一个时使用单人提示词），
+        打包响应中缺失或无效的交易者逐个回退到单人请求。
+
+        Args:
+            session: 数据库会话
+            addresses: 交易者地址列表
+            force_refresh: 是否重新分析已有标签的交易者
 
         Returns:
-            分析结果字典
+            与 addresses 一一对应的分析结果，失败为 None
+        """
+        results: List[Optional[Dict]] = [None] * len(addresses)
+        pending = {}  # address -> (下标, 画像, 分析数据, 输入指纹)
+
+        for i, address in enumerate(addresses):
+            loaded = await self._load_analysis_input(session, address, force_refresh)
+            if loaded is None:
+                continue
+            if isinstance(loaded, dict):
+                results[i] = loaded
+                continue
+            profile, analysis_data, input_hash = loaded
+            pending[address] = (i, profile, analysis_data, input_hash)
+
+        if not pending:
+            return results
+
+        self.cache_misses += len(pending)
+        ai_results = await self._analyze_datas([item[2] for item in pending.values()])
+
+        now = datetime.utcnow()
+        for address, (i, profile, _, input_hash) in pending.items():
+            ai_result = ai_results.get(address)
+            if ai_result:
+                results[i] = self._apply_result(profile, ai_result, input_hash, now)
+
+        if any(results[i] for i, *_ in pending.values()):
+            await session.commit()
+        return results
+
+    async def _load_analysis_input(self, session: AsyncSession, address: str, force_refresh: bool):
+        """
+        读取交易者画像与最近交易并构建分析数据
+
+        Returns:
+            None（画像不存在或没有交易）/ 已有结果字典（无需调用模型）/
+            (画像, 分析数据, 输入指纹)
         """
         # 获取交易者画像
         profile_result = await session.execute(
@@ -57,27 +207,40 @@ class TraderAIProfiler:
             print(f"[WARN] Trader {address} not found, please run refresh-profiles first")
             return None
 
-        # 如果已有AI标签且不强制刷新，跳过
-        if profile.label and profile.ai_analysis and not force_refresh:
+        # 旧数据没有输入指纹，不强制刷新时沿用已有标签
+        if profile.label and profile.ai_analysis and not profile.ai_input_hash and not force_refresh:
             print(f"[SKIP] Trader {address} already has AI analysis (use --force to refresh)")
-            return {
-                "address": address,
-                "label": profile.label,
-                "ai_analysis": profile.ai_analysis,
-                "cached": True
-            }
+            self.cache_hits += 1
+            return self._cached_result(profile)
+
+        analysis_data = await self._load_analysis_data(session, profile)
+        if analysis_data is None:
+            print(f"[WARN] Trader {address} has no trade records")
+            return None
 
+        # 输入与上次分析完全相同：直接复用结果，不调用模型
+        input_hash = analysis_fingerprint(analysis_data, self.model)
+        if profile.label and profile.ai_input_hash == input_hash:
+            print(f"[SKIP] Trader {address[:10]} inputs unchanged, reusing AI analysis")
+            self.cache_hits += 1
+            if self._snapshot_stats(profile):
+                await session.commit()
+            return self._cached_result(profile)
+
+        return profile, analysis_data, input_hash
+
+    async def _load_analysis_data(self, session: AsyncSession, profile: TraderProfile) -> Optional[Dict]:
+        """读取最近交易与相关市场，返回 _prepare_analysis_data 的结果（没有交易时返回 None）"""
         # 获取交易历史
         trades_result = await session.execute(
             select(Trade)
-            .where(Trade.maker == address)
+            .where(Trade.maker == profile.address)
             .order_by(Trade.timestamp.desc())
             .limit(100)  # 分析最近100笔交易
         )
         trades = trades_result.scalars().all()
 
         if not trades:
-            print(f"[WARN] Trader {address} has no trade records")
             return None
 
         # 获取已结算市场信息
@@ -88,32 +251,79 @@ class TraderAIProfiler:
         markets = {m.slug: m for m in markets_result.scalars().all()}
 
         # 构建分析数据
-        analysis_data = self._prepare_analysis_data(profile, trades, markets)
-
-        # 调用AI分析
-        print(f"[AI] Analyzing trader {address[:10]}...")
-        ai_result = await self._call_ai_analysis(analysis_data)
-
-        if ai_result:
-            # 更新数据库
-            profile.label = ai_result.get("label")
-            profile.ai_analysis = ai_result.get("analysis")
-            profile.trading_style = ai_result.get("trading_style")
-            profile.risk_preference = ai_result.get("risk_preference")
-            profile.updated_at = datetime.utcnow()
-            await session.commit()
+        return self._prepare_analysis_data(profile, trades, markets)
 
-            print(f"[OK] Analysis complete: {ai_result.get('label')}")
-            return {
-                "address": address,
-                "label": ai_result.get("label"),
-                "ai_analysis": ai_result.get("analysis"),
-                "trading_style": ai_result.get("trading_style"),
-                "risk_preference": ai_result.get("risk_preference"),
-                "cached": False
-            }
+    async def _analyze_datas(self, datas: List[Dict]) -> Dict[str, Dict]:
+        """
+        调用模型分析一组交易者
+
+        Args:
+            datas: 每个交易者的分析数据
 
-        return None
+        Returns:
+            {address: 解析后的分析结果}，失败的交易者不在结果中
+        """
+        results = {}
+        if len(datas) > 1:
+            print(f"[AI] Analyzing {len(datas)} traders in one packed request...")
+            results = await self._call_packed_analysis(datas)
+
+        for data in datas:
+            address = data["profile"]["address"]
+            if address in results:
+                continue
+            if len(datas) > 1:
+                self.packed_fallbacks += 1
+            print(f"[AI] Analyzing trader {address[:10]}...")
+            ai_result = await self._call_ai_analysis(data)
+            if ai_result:
+                results[address] = ai_result
+        return results
+
+    def _apply_result(self, profile: TraderProfile, ai_result: Dict, input_hash: str, now: datetime) -> Dict:
+        """把分析结果写入画像（由调用方提交），返回结果字典"""
+        profile.label = ai_result.get("label")
+        profile.ai_analysis = ai_result.get("analysis")
+        profile.trading_style = ai_result.get("trading_style")
+        profile.risk_preference = ai_result.get("risk_preference")
+        profile.ai_input_hash = input_hash
+        profile.ai_analyzed_at = now
+        self._snapshot_stats(profile)
+        profile.updated_at = now
+
+        print(f"[OK] Analysis complete: {ai_result.get('label')}")
+        return {
+            "address": profile.address,
+            "label": ai_result.get("label"),
+            "ai_analysis": ai_result.get("analysis"),
+            "trading_style": ai_result.get("trading_style"),
+            "risk_preference": ai_result.get("risk_preference"),
+            "ai_analyzed_at": now.isoformat(),
+            "cached": False
+        }
+
+    @staticmethod
+    def _snapshot_stats(profile: TraderProfile) -> bool:
+        """记录分析时的交易数与胜率（供重分析调度计算新增交易和胜率漂移），有变化时返回 True"""
+        if (profile.ai_analyzed_trades == profile.total_trades
+                and profile.ai_analyzed_win_rate == profile.win_rate):
+            return False
+        profile.ai_analyzed_trades = profile.total_trades
+        profile.ai_analyzed_win_rate = profile.win_rate
+        return True
+
+    @staticmethod
+    def _cached_result(profile: TraderProfile) -> Dict:
+        """已有分析结果（未调用模型）"""
+        return {
+            "address": profile.address,
+            "label": profile.label,
+            "ai_analysis": profile.ai_analysis,
+            "trading_style": profile.trading_style,
+            "risk_preference": profile.risk_preference,
+            "ai_analyzed_at": profile.ai_analyzed_at.isoformat() if profile.ai_analyzed_at else None,
+            "cached": True
+        }
 
     def _prepare_analysis_data(
         self,
@@ -185,40 +395,102 @@ class TraderAIProfiler:
         prompt = self._build_analysis_prompt(data)
 
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """你是一个专业的量化交易分析师，专门分析 Polymarket 预测市场的交易者行为。
-
-你的任务是基于交易者的历史数据，深度分析其交易风格、决策特点和行为模式。
-
-分析维度：
-1. 交易风格（Trading Style）：激进/稳健/保守/投机
-2. 风险偏好（Risk Preference）：高风险/中等/低风险
-3. 决策特点：理性/情绪化/数据驱动/跟风
-4. 擅长领域：政治/体育/娱乐等
-5. 行为特征：长期持有/短线交易/对冲等
-
-请用专业且有洞察力的语言，生成简洁的交易者画像。"""
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=1500,
-            )
-
-            content = response.choices[0].message.content
+            content = await self._complete([
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ])
             return self._parse_ai_response(content)
 
         except Exception as e:
             print(f"AI分析调用失败: {e}")
             return None
 
+    async def _call_packed_analysis(self, datas: List[Dict]) -> Dict[str, Dict]:
+        """
+        一次请求分析多个交易者
+
+        Returns:
+            {address: 分析结果}，只包含响应中存在且字段有效的交易者
+        """
+        prompt = self._build_packed_prompt(datas)
+        max_tokens = min(PACKED_OUTPUT_TOKENS_PER_TRADER * len(datas), MAX_PACKED_OUTPUT_TOKENS)
+        self.packed_requests += 1
+
+        try:
+            content = await self._complete([
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ], max_tokens=max_tokens)
+        except Exception as e:
+            print(f"AI打包分析调用失败: {e}")
+            return {}
+
+        # 空响应（如内容被过滤）与无法解析的响应一样，全部交给单独重试
+        if not isinstance(content, str):
+            print("AI打包分析返回空响应")
+            return {}
+
+        parsed = self._parse_ai_response(content)
+        if isinstance(parsed, dict):
+            parsed = parsed.get("results") or [parsed]
+        if not isinstance(parsed, list):
+            return {}
+
+        # 地址按小写匹配，只接受本次请求中的交易者
+        requested = {d["profile"]["address"].lower(): d["profile"]["address"] for d in datas}
+        results = {}
+        for item in parsed:
+            if not isinstance(item, dict):
+                continue
+            address = requested.get(str(item.get("address", "")).lower())
+            if address and address not in results and _is_valid_result(item):
+                results[address] = item
+        return results
+
+    async def _complete(self, messages: List[Dict], max_tokens: int = MAX_OUTPUT_TOKENS) -> str:
+        """
+        发送一次对话补全请求
+
+        请求前按 RPM / TPM 预算取令牌；429 时所有并发请求一起退避，
+        429 / 5xx / 网络错误按抖动指数退避重试，最终失败抛出原异常。
+
+        Returns:
+            模型返回的文本
+        """
+        estimated = estimate_tokens(messages, max_tokens)
+        attempt = 0
+
+        while True:
+            await self.request_limiter.acquire()
+            await self.token_limiter.acquire(estimated)
+            self.requests += 1
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                )
+                if response.usage:
+                    self.tokens_used += response.usage.total_tokens
+                    self.prompt_tokens += response.usage.prompt_tokens
+                    self.completion_tokens += response.usage.completion_tokens
+                return response.choices[0].message.content
+
+            except Exception as e:
+                if not _is_retryable(e) or attempt >= self.max_retries:
+                    self.failures += 1
+                    raise
+
+                delay = min(2 ** attempt, 30) * (0.5 + random.random())
+                if isinstance(e, openai.RateLimitError):
+                    # 被限流时所有共享预算的请求一起退避（优先遵循 Retry-After）
+                    delay = max(delay, _retry_after(e))
+                    self.request_limiter.pause(delay)
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+
     def _build_analysis_prompt(self, data: Dict) -> str:
         """构建AI分析提示词"""
         profile = data["profile"]
@@ -270,6 +542,54 @@ class TraderAIProfiler:
 - 如果频繁大额交易，分析其是否有内幕信息优势
 - 结合具体交易记录，给出有洞察力的评价"""
 
+    def _build_packed_prompt(self, datas: List[Dict]) -> str:
+        """构建多个交易者的打包提示词（每人只保留精简摘要）"""
+        blocks = []
+        for n, data in enumerate(datas, 1):
+            profile = data["profile"]
+            behavior = data["behavior_stats"]
+            trades = "\n".join([
+                f"  - {t['side']} {t['outcome']} ${t['amount']:.0f} ({t['question'][:30]}) "
+                f"→ {t['result']} {'胜' if t['is_win'] else '败'}"
+                for t in data["recent_trades"][:5]
+            ])
+            blocks.append(
+                f"### 交易者 {n}: {profile['address']}\n"
+                f"- 交易 {profile['total_trades']} 次, 总量 ${profile['total_volume']:,.0f}, "
+                f"胜率 {profile['win_rate']:.1f}% ({profile['win_count']}胜/{profile['loss_count']}败), "
+                f"均额 ${profile['avg_trade_size']:,.0f}, 分类 {profile['trader_type']}\n"
+                f"- 买卖 {behavior['buy_sell_ratio']}, YES/NO {behavior['yes_no_ratio']}, "
+                f"大单 {behavior['whale_trades']} 次, 活跃 {behavior['peak_trading_hour']}点\n"
+                f"- 最近已结算交易:\n{trades if trades else '  暂无'}"
+            )
+
+        profiles = "\n\n".join(blocks)
+        return f"""请分别分析以下 {len(datas)} 个交易者的行为画像：
+
+{profiles}
+
+---
+
+请以JSON数组返回，每个交易者一个对象，address 必须与上面的地址完全一致：
+
+```json
+[
+    {{
+        "address": "交易者地址",
+        "label": "简短标签（5-10字，如：激进型政治预测专家、稳健长线价值投资者）",
+        "trading_style": "交易风格（激进/稳健/保守/投机/对冲）",
+        "risk_preference": "风险偏好（高/中/低）",
+        "analysis": "深度分析（100-200字：核心特征、决策特点、优势与风险、典型行为模式）"
+    }}
+]
+```
+
+注意：
+- 如果胜率极高但交易次数少，可能是运气或样本不足
+- 如果交易量大但胜率一般，可能是专业对冲或套利
+- 如果频繁大额交易，分析其是否有内幕信息优势
+- 每个交易者独立评价，不要互相比较"""
+
     def _parse_ai_response(self, content: str) -> Optional[Dict]:
         """解析AI响应"""
         try:
@@ -293,24 +613,31 @@ class TraderAIProfiler:
         self,
         limit: int = 50,
         min_trades: int = 5,
-        force_refresh: bool = False
+        force_refresh: bool = False,
+        concurrency: Optional[int] = None,
+        pack_size: Optional[int] = None,
+        progress: Optional[Callable[[int, int], Awaitable]] = None,
     ) -> List[Dict]:
         """
         批量分析交易者
 
+        按交易量从高到低选出交易者，交给 analyze_many 并发分析
+        （速率由 RPM / TPM 限流器控制）。
+
         Args:
             limit: 分析数量限制
             min_trades: 最小交易次数（过滤小用户）
-            force_refresh: 是否强制重新分析
+            force_refresh: 是否重新分析已有标签的交易者（输入未变化的仍命中缓存）
+            concurrency: 同时分析的组数（默认取配置 AI_MAX_CONCURRENCY）
+            pack_size: 每次请求打包的交易者数（默认取配置 AI_PACK_SIZE）
+            progress: 可选进度回调 (已完成交易者数, 总数)
 
         Returns:
-            分析结果列表
+            分析结果列表（按交易量从高到低）
         """
-        results = []
-
         async with self.session_factory() as session:
             # 获取符合条件的交易者
-            query = select(TraderProfile).where(
+            query = select(TraderProfile.address).where(
                 TraderProfile.total_trades >= min_trades
             )
 
@@ -321,21 +648,86 @@ class TraderAIProfiler:
             query = query.order_by(TraderProfile.total_volume.desc()).limit(limit)
 
             result = await session.execute(query)
-            profiles = result.scalars().all()
+            addresses = [row[0] for row in result.all()]
 
-            print(f"[INFO] Found {len(profiles)} traders to analyze")
+        print(f"[INFO] Found {len(addresses)} traders to analyze")
 
-            for profile in profiles:
-                analysis = await self.analyze_trader(
-                    session,
-                    profile.address,
-                    force_refresh=force_refresh
-                )
-                if analysis:
-                    results.append(analysis)
+        analyses = await self.analyze_many(
+            addresses, force_refresh=force_refresh, concurrency=concurrency, pack_size=pack_size,
+            progress=progress,
+        )
+        results = [analysis for analysis in analyses if analysis]
 
+        print(f"[INFO] Batch done: {len(results)}/{len(addresses)} analyzed | {self.stats()}")
         return results
 
+    async def analyze_many(
+        self,
+        addresses: List[str],
+        force_refresh: bool = False,
+        concurrency: Optional[int] = None,
+        pack_size: Optional[int] = None,
+        progress: Optional[Callable[[int, int], Awaitable]] = None,
+    ) -> List[Optional[Dict]]:
+        """
+        并发分析一组交易者
+
+        每 pack_size 个交易者为一组（一次打包请求），最多 concurrency 组同时分析；
+        每组使用独立会话并单独提交，一组失败只丢失该组的结果。
+
+        Args:
+            addresses: 交易者地址列表
+            force_refresh: 是否重新分析已有标签的交易者
+            concurrency: 同时分析的组数（默认取配置 AI_MAX_CONCURRENCY）
+            pack_size: 每次请求打包的交易者数（默认取配置 AI_PACK_SIZE，1 为逐个分析）
+            progress: 可选进度回调 (已完成交易者数, 总数)，每组完成后调用
+
+        Returns:
+            与 addresses 一一对应的分析结果，失败为 None
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency or settings.AI_MAX_CONCURRENCY))
+        pack_size = max(1, pack_size or settings.AI_PACK_SIZE)
+
+        done = 0
+
+        async def analyze_one(group: List[str]) -> List[Optional[Dict]]:
+            nonlocal done
+            async with semaphore:
+                try:
+                    async with self.session_factory() as session:
+                        analyses = await self.analyze_group(session, group, force_refresh=force_refresh)
+                except Exception as e:
+                    print(f"[WARN] Trader {', '.join(a[:10] for a in group)} analysis failed: {e}")
+                    analyses = [None] * len(group)
+
+            done += len(group)
+            if progress:
+                await progress(done, len(addresses))
+            return analyses
+
+        if progress:
+            await progress(0, len(addresses))
+        groups = [addresses[i:i + pack_size] for i in range(0, len(addresses), pack_size)]
+        analyses = await asyncio.gather(*[analyze_one(group) for group in groups])
+        return [analysis for group in analyses for analysis in group]
+
+    def stats(self) -> Dict:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": round(self.cache_hits / lookups, 3) if lookups else None,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "tokens_used": self.tokens_used,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "packed_requests": self.packed_requests,
+            "packed_fallbacks": self.packed_fallbacks,
+            "rate_limit_pauses": self.request_limiter.pauses,
+        }
+
     async def get_top_traders_with_ai(
         self,
         session: AsyncSession,
@@ -378,6 +770,22 @@ class TraderAIProfiler:
                 "total_volume": float(p.total_volume),
                 "avg_trade_size": float(p.avg_trade_size),
                 "last_trade_at": p.last_trade_at.isoformat() if p.last_trade_at else None,
+                "ai_analyzed_at": p.ai_analyzed_at.isoformat() if p.ai_analyzed_at else None,
             }
             for p in profiles
         ]
+
+
+_shared_profiler: Optional[TraderAIProfiler] = None
+
+
+def get_ai_profiler(session_factory) -> TraderAIProfiler:
+    """
+    进程内共享的 AI 分析器
+
+    API 请求共用同一个实例，限流预算和缓存命中统计跨请求累计。
+    """
+    global _shared_profiler
+    if _shared_profiler is None:
+        _shared_profiler = TraderAIProfiler(session_factory)
+    return _shared_profiler
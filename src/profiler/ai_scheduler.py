@@ -0,0 +1,243 @@
+"""AI 画像重分析调度 - 按过期程度与交易者价值分配每小时的 LLM 预算"""
+import asyncio
+import math
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import DateTime, exists, func, literal, or_, select
+
+from ..config import get_settings
+from ..models import Trade, TraderProfile
+from .ai_analyzer import TraderAIProfiler
+
+settings = get_settings()
+
+# 优先级 = ln(1 + 交易量) × 过期程度
+# 过期程度 = ln(1 + 分析后新增交易) + 胜率漂移 / DRIFT_SCALE + 距上次分析天数 / AGE_SCALE_DAYS
+DRIFT_SCALE = 5.0  # 胜率漂移 5 个百分点 ≈ 1 分
+AGE_SCALE_DAYS = 7.0  # 一周未分析 ≈ 1 分
+MAX_AGE_DAYS = 30.0  # 分析时间的影响上限（从未分析的按上限计）
+
+# 分析失败的交易者在该时间内不再调度（秒）
+FAILURE_BACKOFF = 3600.0
+
+
+def reanalysis_candidates_query(
+    limit: int,
+    now: Optional[datetime] = None,
+    exclude: Optional[List[str]] = None,
+    min_trades: Optional[int] = None,
+    min_new_trades: Optional[int] = None,
+    min_drift: Optional[float] = None,
+):
+    """
+    需要重新分析的交易者（按优先级从高到低）
+
+    从未分析过、或分析后新增交易 / 胜率漂移达到阈值的交易者参与排序；
+    交易记录已不存在的交易者无法分析，不参与排序。
+
+    Args:
+        limit: 返回数量
+        now: 当前时间（UTC），默认 datetime.utcnow()
+        exclude: 排除的地址（如近期分析失败的）
+        min_trades / min_new_trades / min_drift: 阈值，默认取配置
+
+    Returns:
+        select(address, score)
+    """
+    now = now or datetime.utcnow()
+    min_trades = settings.AI_REANALYSIS_MIN_TRADES if min_trades is None else min_trades
+    min_new_trades = settings.AI_REANALYSIS_MIN_NEW_TRADES if min_new_trades is None else min_new_trades
+    min_drift = settings.AI_REANALYSIS_MIN_DRIFT if min_drift is None else min_drift
+
+    p = TraderProfile
+    new_trades = p.total_trades - func.coalesce(p.ai_analyzed_trades, 0)
+    drift = func.abs(p.win_rate - func.coalesce(p.ai_analyzed_win_rate, p.win_rate))
+    age_days = func.least(
+        func.coalesce(
+            func.extract("epoch", literal(now, DateTime) - p.ai_analyzed_at) / 86400,
+            MAX_AGE_DAYS,
+        ),
+        MAX_AGE_DAYS,
+    )
+    score = func.ln(1 + func.coalesce(p.total_volume, 0)) * (
+        func.ln(1 + func.greatest(new_trades, 0)) + drift / DRIFT_SCALE + age_days / AGE_SCALE_DAYS
+    )
+
+    query = (
+        select(p.address, score.label("score"))
+        .where(
+            p.total_trades >= min_trades,
+            or_(p.ai_analyzed_at.is_(None), new_trades >= min_new_trades, drift >= min_drift),
+            exists().where(Trade.maker == p.address),
+        )
+        .order_by(score.desc(), p.address)
+        .limit(limit)
+    )
+    if exclude:
+        query = query.where(p.address.notin_(exclude))
+    return query
+
+
+class AIReanalysisScheduler:
+    """
+    AI 画像重分析调度器
+
+    每轮按优先级选出最过期、价值最高的交易者交给 TraderAIProfiler 并发分析，
+    模型请求数（含重试与打包失败后的单独请求）受每小时预算限制（滑动窗口）；
+    输入未变化而命中缓存的不发请求，也就不计入预算。每轮选取的交易者数按
+    单个交易者最坏情况下的请求数预留预算，一轮不会超出剩余预算。
+    """
+
+    def __init__(
+        self,
+        profiler: TraderAIProfiler,
+        hourly_budget: Optional[int] = None,
+        interval: Optional[float] = None,
+    ):
+        """
+        初始化调度器
+
+        Args:
+            profiler: AI 分析器（与 API 共用时共享限流预算）
+            hourly_budget: 每小时最多发送的模型请求数（默认取配置 AI_REANALYSIS_HOURLY_BUDGET）
+            interval: 调度间隔（秒），默认取配置 AI_REANALYSIS_INTERVAL
+        """
+        self.profiler = profiler
+        self.session_factory = profiler.session_factory
+        self.hourly_budget = settings.AI_REANALYSIS_HOURLY_BUDGET if hourly_budget is None else hourly_budget
+        self.interval = settings.AI_REANALYSIS_INTERVAL if interval is None else interval
+        self.running = False
+
+        # 最近一小时内发送模型请求的时间点（每个请求一个）
+        self._spent: deque = deque()
+        # 近期分析失败的地址 -> 失败时间
+        self._failed: Dict[str, float] = {}
+
+        # 统计计数
+        self.runs = 0
+        self.analyzed = 0
+        self.cached = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_run_at: Optional[datetime] = None
+
+    def max_requests_per_trader(self) -> int:
+        """单个交易者最坏情况下的模型请求数：打包请求与回退的单人请求各自重试到上限"""
+        attempts = 1 + self.profiler.max_retries
+        return attempts * 2 if settings.AI_PACK_SIZE > 1 else attempts
+
+    def remaining_budget(self) -> int:
+        """最近一小时内剩余的模型请求数"""
+        cutoff = time.monotonic() - 3600
+        while self._spent and self._spent[0] < cutoff:
+            self._spent.popleft()
+        return max(self.hourly_budget - len(self._spent), 0)
+
+    async def run(self):
+        """持续调度"""
+        self.running = True
+
+        while self.running:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[AI SCHEDULER] Run failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stop(self):
+        """停止调度"""
+        self.running = False
+
+    async def run_once(self, limit: Optional[int] = None) -> Dict:
+        """
+        执行一轮重分析
+
+        Args:
+            limit: 本轮最多分析的交易者数，默认按调度间隔分摊小时预算；
+                不超过剩余预算按最坏请求数可容纳的交易者数
+
+        Returns:
+            {"selected": 选中数, "analyzed": 调用模型数, "cached": 命中缓存数,
+             "skipped": 没有交易记录而跳过的数量, "failed": 失败数}
+        """
+        empty = {"selected": 0, "analyzed": 0, "cached": 0, "skipped": 0, "failed": 0}
+        if limit is None:
+            limit = math.ceil(self.hourly_budget * self.interval / 3600)
+        limit = min(limit, self.remaining_budget() // self.max_requests_per_trader())
+        if limit <= 0:
+            return empty
+
+        now = time.monotonic()
+        self._failed = {a: t for a, t in self._failed.items() if now - t < FAILURE_BACKOFF}
+
+        async with self.session_factory() as session:
+            result = await session.execute(
+                reanalysis_candidates_query(limit, exclude=list(self._failed))
+            )
+            addresses = [row[0] for row in result.all()]
+
+        if not addresses:
+            return empty
+
+        # force_refresh：没有输入指纹的旧标签也重新分析；输入未变化的仍命中缓存
+        requests_before = self.profiler.requests
+        analyses = await self.profiler.analyze_many(addresses, force_refresh=True)
+
+        # 按实际发送的请求数扣预算（重试、打包失败后的单独请求都计入）
+        spent_at = time.monotonic()
+        self._spent.extend([spent_at] * (self.profiler.requests - requests_before))
+
+        # 没有结果的交易者中，交易记录在选出后被删除的记为跳过，不进入失败退避
+        missing = [a for a, analysis in zip(addresses, analyses) if analysis is None]
+        with_trades = set()
+        if missing:
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    select(Trade.maker).where(Trade.maker.in_(missing)).distinct()
+                )
+                with_trades = {row[0] for row in result.all()}
+
+        analyzed = cached = skipped = failed = 0
+        for address, analysis in zip(addresses, analyses):
+            if analysis is None and address not in with_trades:
+                skipped += 1
+            elif analysis is None:
+                failed += 1
+                self._failed[address] = time.monotonic()
+            elif analysis.get("cached"):
+                cached += 1
+            else:
+                analyzed += 1
+
+        self.runs += 1
+        self.analyzed += analyzed
+        self.cached += cached
+        self.skipped += skipped
+        self.failures += failed
+        self.last_run_at = datetime.utcnow()
+
+        print(f"[AI SCHEDULER] {len(addresses)} stale traders: {analyzed} re-analyzed, "
+              f"{cached} unchanged, {skipped} skipped, {failed} failed | budget left {self.remaining_budget()}/h")
+        return {
+            "selected": len(addresses),
+            "analyzed": analyzed,
+            "cached": cached,
+            "skipped": skipped,
+            "failed": failed,
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "analyzed": self.analyzed,
+            "cached": self.cached,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "hourly_budget": self.hourly_budget,
+            "remaining_budget": self.remaining_budget(),
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
@@ -1,8 +1,9 @@
 """交易者画像分析模块 - 计算胜率和交易者分类"""
 from decimal import Decimal
 from datetime import datetime
-from typing import List, Dict, Optional
-from sqlalchemy import select, func, and_, case
+from typing import List, Dict, Optional, Tuple
+from sqlalchemy import DateTime, select, func, and_, or_, not_, case, literal, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import get_settings
@@ -10,6 +11,242 @@ from ..models import Trade, Market, TraderProfile
 
 settings = get_settings()
 
+# update_profiles 每条语句的地址数
+PROFILE_CHUNK_SIZE = 5000
+
+# 流式重建：每次写入的画像数 / 服务端游标每批读取的交易行数
+STREAM_FLUSH_SIZE = 1000
+STREAM_YIELD_PER = 5000
+
+# 分类阈值（胜率为 0-100）
+SMART_MONEY_WIN_RATE = Decimal(str(settings.SMART_MONEY_WIN_RATE * 100))
+SMART_MONEY_MIN_VOLUME = Decimal(str(settings.SMART_MONEY_MIN_VOLUME))
+DUMB_MONEY_WIN_RATE = Decimal(str(settings.DUMB_MONEY_WIN_RATE * 100))
+
+# 画像中由交易聚合得到的字段（AI 分析字段不在此列）
+PROFILE_STAT_FIELDS = (
+    "total_trades", "total_volume", "win_count", "loss_count", "win_rate",
+    "avg_trade_size", "trader_type", "last_trade_at", "updated_at",
+)
+
+
+def maker_stats_query(*where, outcomes_only: bool = False):
+    """
+    按 maker 聚合交易（LEFT JOIN 已结算市场）
+
+    胜负：买入的 outcome 等于结算结果则胜；卖出的 outcome 不等于结算结果则胜。
+
+    Args:
+        where: 交易过滤条件
+        outcomes_only: 只统计胜负（交易数、交易量记为 0，用于市场结算时的增量）
+
+    Returns:
+        列为 address / total_trades / total_volume / win_count / loss_count / last_trade_at 的查询
+    """
+    settled = Market.resolution_outcome.isnot(None)
+    won = or_(
+        and_(Trade.side == "BUY", Trade.outcome == Market.resolution_outcome),
+        and_(Trade.side != "BUY", Trade.outcome != Market.resolution_outcome),
+    )
+
+    if outcomes_only:
+        totals = (
+            literal(0).label("total_trades"),
+            literal(Decimal(0)).label("total_volume"),
+            literal(None, DateTime).label("last_trade_at"),
+        )
+    else:
+        totals = (
+            func.count().label("total_trades"),
+            func.coalesce(func.sum(Trade.amount_usd), 0).label("total_volume"),
+            func.max(Trade.timestamp).label("last_trade_at"),
+        )
+
+    return (
+        select(
+            Trade.maker.label("address"),
+            totals[0],
+            totals[1],
+            func.count().filter(and_(settled, won)).label("win_count"),
+            func.count().filter(and_(settled, not_(won))).label("loss_count"),
+            totals[2],
+        )
+        .select_from(Trade)
+        .outerjoin(Market, and_(Market.slug == Trade.market_slug, Market.resolved == True))
+        .where(*where)
+        .group_by(Trade.maker)
+    )
+
+
+def _win_rate(win_count, loss_count):
+    settled_trades = win_count + loss_count
+    return case(
+        (settled_trades > 0, win_count * literal(Decimal(100)) / settled_trades),
+        else_=literal(Decimal(0)),
+    )
+
+
+def _trader_type(win_rate, total_volume, total_trades):
+    """与 TraderProfiler._classify_trader 相同的分类规则（SQL 表达式）"""
+    return case(
+        (and_(win_rate >= SMART_MONEY_WIN_RATE, total_volume >= SMART_MONEY_MIN_VOLUME), "smart_money"),
+        (and_(win_rate <= DUMB_MONEY_WIN_RATE, total_trades > 10), "dumb_money"),
+        else_="normal",
+    )
+
+
+def _avg_trade_size(total_volume, total_trades):
+    return func.coalesce(total_volume / func.nullif(total_trades, 0), 0)
+
+
+def profile_upsert(stats_query, additive: bool = False):
+    """
+    由 maker_stats_query 构造 trader_profiles 的 INSERT ... SELECT ... ON CONFLICT
+
+    Args:
+        stats_query: maker_stats_query 返回的查询
+        additive: False 时用聚合结果覆盖画像；True 时把聚合结果作为增量
+            加到已有画像上，并据此重算胜率、平均交易大小和分类
+
+    Returns:
+        可执行的语句（按地址排序写入，并发写入时行锁顺序一致）
+    """
+    stats = stats_query.cte("maker_stats")
+    win_rate = _win_rate(stats.c.win_count, stats.c.loss_count)
+
+    rows = select(
+        stats.c.address,
+        stats.c.total_trades,
+        stats.c.total_volume,
+        stats.c.win_count,
+        stats.c.loss_count,
+        func.round(win_rate, 2),
+        _avg_trade_size(stats.c.total_volume, stats.c.total_trades),
+        _trader_type(win_rate, stats.c.total_volume, stats.c.total_trades),
+        stats.c.last_trade_at,
+        literal(datetime.utcnow()),
+    ).order_by(stats.c.address)
+
+    stmt = pg_insert(TraderProfile).from_select(("address",) + PROFILE_STAT_FIELDS, rows)
+    excluded = stmt.excluded
+
+    if not additive:
+        set_ = {field: excluded[field] for field in PROFILE_STAT_FIELDS}
+    else:
+        total_trades = func.coalesce(TraderProfile.total_trades, 0) + excluded.total_trades
+        total_volume = func.coalesce(TraderProfile.total_volume, 0) + excluded.total_volume
+        win_count = func.coalesce(TraderProfile.win_count, 0) + excluded.win_count
+        loss_count = func.coalesce(TraderProfile.loss_count, 0) + excluded.loss_count
+        new_win_rate = _win_rate(win_count, loss_count)
+        set_ = {
+            "total_trades": total_trades,
+            "total_volume": total_volume,
+            "win_count": win_count,
+            "loss_count": loss_count,
+            "win_rate": func.round(new_win_rate, 2),
+            "avg_trade_size": _avg_trade_size(total_volume, total_trades),
+            "trader_type": _trader_type(new_win_rate, total_volume, total_trades),
+            # GREATEST 忽略 NULL
+            "last_trade_at": func.greatest(TraderProfile.last_trade_at, excluded.last_trade_at),
+            "updated_at": excluded.updated_at,
+        }
+
+    return stmt.on_conflict_do_update(index_elements=["address"], set_=set_)
+
+
+async def apply_trade_deltas(session: AsyncSession, keys: List[Tuple[str, int]]) -> int:
+    """
+    把新写入的交易作为增量加到画像上（不提交，由写入交易的事务一起提交）
+
+    先对交易所在的市场行加共享锁（按 slug 排序），与 ResolutionTracker 的结算更新互斥：
+    结算先提交时，本语句能看到已结算的市场并计入胜负；交易先提交时，结算的增量
+    查询能看到这些交易。两边都不会漏算或重复计算同一笔交易的胜负。
+
+    Args:
+        session: 写入交易的数据库会话
+        keys: 新写入交易的 (tx_hash, log_index)，重复跳过的交易不应包含在内
+
+    Returns:
+        受影响的画像数量
+    """
+    if not keys:
+        return 0
+    where = tuple_(Trade.tx_hash, Trade.log_index).in_(keys)
+    await session.execute(
+        select(Market.id)
+        .where(Market.slug.in_(select(Trade.market_slug).where(where)))
+        .order_by(Market.slug)
+        .with_for_update(read=True)
+    )
+    stats = maker_stats_query(where)
+    result = await session.execute(profile_upsert(stats, additive=True))
+    return result.rowcount
+
+
+async def apply_resolution_deltas(session: AsyncSession, slugs: List[str]) -> int:
+    """
+    把新结算市场上的胜负作为增量加到画像上（不提交，与写入结算结果的事务一起提交）
+
+    Args:
+        session: 已写入结算结果（尚未提交）的数据库会话
+        slugs: 本次新结算的市场，已结算过的市场不应包含在内
+
+    Returns:
+        受影响的画像数量
+    """
+    if not slugs:
+        return 0
+    stats = maker_stats_query(Trade.market_slug.in_(slugs), outcomes_only=True)
+    result = await session.execute(profile_upsert(stats, additive=True))
+    return result.rowcount
+
+
+class _ProfileAccumulator:
+    """单个地址的流式聚合状态（定长，与交易数无关）"""
+
+    __slots__ = ("address", "total_trades", "total_volume", "win_count", "loss_count", "last_trade_at")
+
+    def __init__(self, address: str):
+        self.address = address
+        self.total_trades = 0
+        self.total_volume = Decimal(0)
+        self.win_count = 0
+        self.loss_count = 0
+        self.last_trade_at: Optional[datetime] = None
+
+    def add(self, amount_usd, timestamp, side: str, outcome: str, resolution: Optional[str]):
+        self.total_trades += 1
+        self.total_volume += amount_usd or 0
+        if timestamp is not None and (self.last_trade_at is None or timestamp > self.last_trade_at):
+            self.last_trade_at = timestamp
+
+        # 只统计已结算市场的胜负
+        if resolution is not None and outcome is not None:
+            if (outcome == resolution) == (side == "BUY"):
+                self.win_count += 1
+            else:
+                self.loss_count += 1
+
+    def to_row(self, classify) -> Dict:
+        settled_trades = self.win_count + self.loss_count
+        if settled_trades > 0:
+            win_rate = Decimal(self.win_count * 100) / Decimal(settled_trades)
+        else:
+            win_rate = Decimal(0)
+
+        return {
+            "address": self.address,
+            "total_trades": self.total_trades,
+            "total_volume": self.total_volume,
+            "win_count": self.win_count,
+            "loss_count": self.loss_count,
+            "win_rate": round(win_rate, 2),
+            "avg_trade_size": self.total_volume / Decimal(self.total_trades),
+            "trader_type": classify(win_rate, self.total_volume, self.total_trades),
+            "last_trade_at": self.last_trade_at,
+            "updated_at": datetime.utcnow(),
+        }
+
 
 class TraderProfiler:
     """交易者画像分析器"""
@@ -22,9 +259,9 @@ class TraderProfiler:
             session_factory: 异步数据库会话工厂
         """
         self.session_factory = session_factory
-        self.smart_money_win_rate = Decimal(str(settings.SMART_MONEY_WIN_RATE * 100))
-        self.smart_money_min_volume = Decimal(str(settings.SMART_MONEY_MIN_VOLUME))
-        self.dumb_money_win_rate = Decimal(str(settings.DUMB_MONEY_WIN_RATE * 100))
+        self.smart_money_win_rate = SMART_MONEY_WIN_RATE
+        self.smart_money_min_volume = SMART_MONEY_MIN_VOLUME
+        self.dumb_money_win_rate = DUMB_MONEY_WIN_RATE
 
     async def update_profile(self, address: str) -> Optional[TraderProfile]:
         """
@@ -34,98 +271,54 @@ class TraderProfiler:
             address: 交易者地址
 
         Returns:
-            更新后的 TraderProfile
+            更新后的 TraderProfile，没有交易时返回 None
         """
         async with self.session_factory() as session:
-            # 获取该地址的所有交易
-            trades_result = await session.execute(
-                select(Trade).where(Trade.maker == address)
-            )
-            trades = trades_result.scalars().all()
-
-            if not trades:
-                return None
+            await self._upsert_profiles(session, [address])
+            await session.commit()
 
-            # 获取已结算市场
-            resolved_markets = await session.execute(
-                select(Market).where(Market.resolved == True)
+            result = await session.execute(
+                select(TraderProfile).where(TraderProfile.address == address)
             )
-            resolved_map = {m.slug: m.resolution_outcome for m in resolved_markets.scalars().all()}
-
-            # 统计胜负
-            total_trades = len(trades)
-            total_volume = Decimal(0)
-            win_count = 0
-            loss_count = 0
-            last_trade_at = None
-
-            for trade in trades:
-                total_volume += trade.amount_usd
-
-                if last_trade_at is None or trade.timestamp > last_trade_at:
-                    last_trade_at = trade.timestamp
-
-                # 只统计已结算市场的胜负
-                if trade.market_slug in resolved_map:
-                    resolution = resolved_map[trade.market_slug]
-                    # 判断胜负：买入的 outcome 等于结算结果则胜
-                    if trade.side == "BUY":
-                        if trade.outcome == resolution:
-                            win_count += 1
-                        else:
-                            loss_count += 1
-                    else:  # SELL
-                        # 卖出的情况：卖出的 outcome 不等于结算结果则胜
-                        if trade.outcome != resolution:
-                            win_count += 1
-                        else:
-                            loss_count += 1
-
-            # 计算胜率
-            settled_trades = win_count + loss_count
-            if settled_trades > 0:
-                win_rate = Decimal(win_count * 100) / Decimal(settled_trades)
-            else:
-                win_rate = Decimal(0)
+            return result.scalar_one_or_none()
 
-            # 计算平均交易大小
-            avg_trade_size = total_volume / Decimal(total_trades) if total_trades > 0 else Decimal(0)
+    async def update_profiles(self, addresses) -> int:
+        """
+        只重算给定地址的画像（市场结算后由 ResolutionTracker 调用）
 
-            # 分类交易者
-            trader_type = self._classify_trader(win_rate, total_volume, total_trades)
+        Args:
+            addresses: 交易者地址集合
 
-            # 更新或创建 profile
-            profile_result = await session.execute(
-                select(TraderProfile).where(TraderProfile.address == address)
-            )
-            profile = profile_result.scalar_one_or_none()
-
-            if profile:
-                profile.total_trades = total_trades
-                profile.total_volume = total_volume
-                profile.win_count = win_count
-                profile.loss_count = loss_count
-                profile.win_rate = win_rate
-                profile.avg_trade_size = avg_trade_size
-                profile.trader_type = trader_type
-                profile.last_trade_at = last_trade_at
-                profile.updated_at = datetime.utcnow()
-            else:
-                profile = TraderProfile(
-                    address=address,
-                    total_trades=total_trades,
-                    total_volume=total_volume,
-                    win_count=win_count,
-                    loss_count=loss_count,
-                    win_rate=win_rate,
-                    avg_trade_size=avg_trade_size,
-                    trader_type=trader_type,
-                    last_trade_at=last_trade_at,
-                )
-                session.add(profile)
+        Returns:
+            更新的画像数量
+        """
+        addresses = list(addresses)
+        count = 0
 
+        async with self.session_factory() as session:
+            for start in range(0, len(addresses), PROFILE_CHUNK_SIZE):
+                count += await self._upsert_profiles(session, addresses[start:start + PROFILE_CHUNK_SIZE])
             await session.commit()
-            return profile
+
+        return count
+
+    async def _upsert_profiles(self, session: AsyncSession, addresses: Optional[List[str]] = None) -> int:
+        """
+        一条 INSERT ... SELECT ... GROUP BY maker ... ON CONFLICT 重算画像（不提交）
+
+        交易 LEFT JOIN 已结算市场，在数据库内一次算出交易数、交易量、胜负、
+        最后交易时间、胜率、平均交易大小和分类，AI 分析字段保持不变。
+
+        Args:
+            session: 数据库会话
+            addresses: 只重算这些地址，默认全部交易者
+
+        Returns:
+            写入的画像数量
+        """
+        where = [Trade.maker.in_(addresses)] if addresses is not None else []
+        result = await session.execute(profile_upsert(maker_stats_query(*where)))
+        return result.rowcount
 
     def _classify_trader(
         self,
@@ -154,28 +347,134 @@ class TraderProfiler:
 
         return "normal"
 
-    async def refresh_all_profiles(self) -> int:
+    async def refresh_all_profiles(self, streaming: bool = False) -> int:
         """
         刷新所有交易者画像
 
+        默认用单条集合化 SQL 在数据库内完成；streaming 时改用
+        rebuild_profiles_streaming（事务和单条语句都有界，适合超大交易表）。
+
+        Args:
+            streaming: 使用流式重建
+
         Returns:
             更新的画像数量
         """
+        if streaming:
+            return await self.rebuild_profiles_streaming()
+
         async with self.session_factory() as session:
-            # 获取所有交易者地址
-            result = await session.execute(
-                select(Trade.maker).distinct()
+            count = await self._upsert_profiles(session)
+            await session.commit()
+
+        print(f"已刷新 {count} 个交易者画像")
+        return count
+
+    async def rebuild_profiles_streaming(
+        self,
+        chunk_size: int = STREAM_FLUSH_SIZE,
+        yield_per: int = STREAM_YIELD_PER,
+    ) -> int:
+        """
+        流式重建所有交易者画像
+
+        通过服务端游标按 maker 顺序逐批读取交易（只取聚合需要的列），每个地址
+        只保留一个定长累加器，每 chunk_size 个画像写入并提交一次。峰值内存与
+        单个地址的交易数无关。
+
+        Args:
+            chunk_size: 每次写入的画像数
+            yield_per: 服务端游标每批读取的交易行数
+
+        Returns:
+            更新的画像数量
+        """
+        query = (
+            select(
+                Trade.maker,
+                Trade.amount_usd,
+                Trade.timestamp,
+                Trade.side,
+                Trade.outcome,
+                Market.resolution_outcome,
             )
-            addresses = [row[0] for row in result.fetchall()]
+            .select_from(Trade)
+            .outerjoin(Market, and_(Market.slug == Trade.market_slug, Market.resolved == True))
+            .order_by(Trade.maker)
+            .execution_options(yield_per=yield_per)
+        )
 
         count = 0
-        for address in addresses:
-            await self.update_profile(address)
-            count += 1
-
-        print(f"已刷新 {count} 个交易者画像")
+        buffer: List[Dict] = []
+        current: Optional[_ProfileAccumulator] = None
+
+        async with self.session_factory() as read_session, self.session_factory() as write_session:
+            result = await read_session.stream(query)
+            async for maker, amount_usd, timestamp, side, outcome, resolution in result:
+                if current is None or current.address != maker:
+                    if current is not None:
+                        buffer.append(current.to_row(self._classify_trader))
+                        if len(buffer) >= chunk_size:
+                            count += await self._flush_profiles(write_session, buffer)
+                            buffer = []
+                    current = _ProfileAccumulator(maker)
+                current.add(amount_usd, timestamp, side, outcome, resolution)
+
+            if current is not None:
+                buffer.append(current.to_row(self._classify_trader))
+            if buffer:
+                count += await self._flush_profiles(write_session, buffer)
+
+        print(f"已流式重建 {count} 个交易者画像")
         return count
 
+    async def _flush_profiles(self, session: AsyncSession, rows: List[Dict]) -> int:
+        """覆盖写入一批画像并提交"""
+        stmt = pg_insert(TraderProfile).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["address"],
+            set_={field: stmt.excluded[field] for field in PROFILE_STAT_FIELDS},
+        )
+        await session.execute(stmt)
+        await session.commit()
+        return len(rows)
+
+    async def check_consistency(self, sample: int = 10) -> Dict:
+        """
+        一致性检查：用全量聚合结果核对增量维护的画像（只读）
+
+        Args:
+            sample: 返回的不一致地址样例数
+
+        Returns:
+            {"traders": 有交易的地址数, "mismatched": 不一致（含缺失）的画像数, "samples": [地址]}
+        """
+        stats = maker_stats_query().subquery("maker_stats")
+        mismatch = or_(
+            TraderProfile.address.is_(None),
+            TraderProfile.total_trades.is_distinct_from(stats.c.total_trades),
+            TraderProfile.total_volume.is_distinct_from(func.round(stats.c.total_volume, 2)),
+            TraderProfile.win_count.is_distinct_from(stats.c.win_count),
+            TraderProfile.loss_count.is_distinct_from(stats.c.loss_count),
+            TraderProfile.last_trade_at.is_distinct_from(stats.c.last_trade_at),
+        )
+        joined = stats.outerjoin(TraderProfile, TraderProfile.address == stats.c.address)
+
+        async with self.session_factory() as session:
+            totals = await session.execute(
+                select(func.count(), func.count().filter(mismatch)).select_from(joined)
+            )
+            traders, mismatched = totals.one()
+            samples = await session.execute(
+                select(stats.c.address).select_from(joined).where(mismatch).limit(sample)
+            )
+
+        return {
+            "traders": traders,
+            "mismatched": mismatched,
+            "samples": [row[0] for row in samples.all()],
+        }
+
     async def get_leaderboard(
         self,
         session: AsyncSession,
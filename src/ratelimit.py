@@ -0,0 +1,63 @@
+"""限流模块 - 异步令牌桶，供 RPC / HTTP API / LLM 调用共享速率预算"""
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    异步令牌桶
+
+    按固定速率补充令牌，调用方在发请求前 acquire；收到 429 等限流信号时
+    调用 pause 让所有共享该桶的调用方一起退避。
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量（允许的突发量），默认等于 rate
+        """
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+        # 统计计数
+        self.waited = 0.0
+        self.pauses = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """
+        获取令牌，不足时等待
+
+        Args:
+            tokens: 需要的令牌数（超过容量时按容量计）
+        """
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= tokens:
+                        self._tokens -= tokens
+                        return
+                    delay = (tokens - self._tokens) / self.rate
+                self.waited += delay
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """暂停发放令牌（收到限流响应时全局退避）"""
+        self.pauses += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)